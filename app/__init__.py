@@ -1,7 +1,6 @@
 from flask import Flask
 from flask_migrate import Migrate
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import create_engine
 from sqlalchemy.engine.base import Engine
 from sqlalchemy.orm import sessionmaker
 
@@ -9,24 +8,65 @@ from .auth.oauth import register_oauth
 from .blueprints.admin import admin_bp
 from .blueprints.auth import auth_bp
 from .blueprints.main import main_bp
+from .commands import register_commands
+from .db import close_db_session, prewarm_pool
 from .models import Base
+from .navigation.import_jobs import ImportJobManager
+from .navigation.season_graph import SeasonGraphCache
+from .navigation.uploads import InMemoryUploadRequest
+from .seasons.season_cache import CurrentSeasonCache
+from .seasons.season_stats import SeasonStatsCache
+from .users.position_buffer import PositionBuffer
+from .users.users import UserStore
 
 
-def create_app(config: str) -> Flask:
+def create_app(config: str | type) -> Flask:
     app = Flask(__name__)
     app.config.from_object(config)
+    # Season uploads are parsed from memory, MAX_CONTENT_LENGTH bounds them
+    app.request_class = InMemoryUploadRequest
 
     db = SQLAlchemy(model_class=Base)
     migrate = Migrate(app, db)
     db.init_app(app)
     migrate.init_app(app, db)
 
-    engine: Engine = create_engine(app.config["SQLALCHEMY_DATABASE_URI"])  # type: ignore
+    # Flask-SQLAlchemy owns the only engine (and connection pool) in the worker. The app
+    # sessions, migrations and CLI commands all share it
+    with app.app_context():
+        engine: Engine = db.engine
+    if app.config["SQLALCHEMY_POOL_PREWARM"] > 0:
+        prewarm_pool(engine, app.config["SQLALCHEMY_POOL_PREWARM"])
     Session = sessionmaker(bind=engine)
+    app.teardown_appcontext(close_db_session)
     app.extensions["Session"] = Session
     app.extensions["engine"] = engine
+    app.extensions["season_graphs"] = SeasonGraphCache(
+        app.config["SEASON_GRAPH_CACHE_BYTES"]
+    )
+    app.extensions["current_season"] = CurrentSeasonCache(
+        app.config["SEASON_CACHE_TTL"]
+    )
+    app.extensions["season_stats"] = SeasonStatsCache(
+        app.config["SEASON_STATS_BACKGROUND"],
+        app.config["SEASON_STATS_MAX_CONCURRENT"],
+    )
+    app.extensions["import_jobs"] = ImportJobManager(
+        app, app.config["IMPORT_MAX_CONCURRENT"], app.config["IMPORT_PARSE_PROCESSES"]
+    )
+    if app.config["USER_LOCATION_WRITE_BEHIND"]:
+        position_buffer = PositionBuffer(
+            Session,
+            app.config["USER_LOCATION_FLUSH_INTERVAL"],
+            app.config["USER_LOCATION_FLUSH_MAX_PENDING"],
+        )
+        position_buffer.start()
+        app.extensions["position_buffer"] = position_buffer
 
     register_oauth(app)
+    register_commands(app)
+    # One context processor for every blueprint, the current user is resolved once per request
+    app.context_processor(UserStore.inject_user)
     # Register DB models
     register_models()
 
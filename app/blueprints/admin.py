@@ -1,39 +1,50 @@
-import os
-import time
+from datetime import datetime
 from uuid import UUID
 
 from flask import (
     Blueprint,
+    Response,
     current_app,
     flash,
+    jsonify,
     redirect,
     render_template,
     request,
+    stream_with_context,
     url_for,
 )
-from sqlalchemy import delete
-from werkzeug.utils import secure_filename
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
 
-from ..models import Season
-from ..navigation.import_twine import ImportTwine
+from ..navigation.export_season import EXPORT_FORMATS, export_season
+from ..navigation.import_jobs import ImportJob, get_import_jobs
+from ..navigation.uploads import (
+    StoryUpload,
+    archive_upload,
+    read_upload,
+    split_compression,
+)
+from ..seasons.season_analysis import season_analysis
+from ..seasons.season_stats import get_season_stats, stats_available
 from ..seasons.seasons import SeasonStore
 from ..users.users import UserStore
 
 admin_bp = Blueprint("admin", __name__)
 
-UPLOAD_FOLDER = "uploads"
-ALLOWED_EXTENSIONS = {"twee"}
+ALLOWED_EXTENSIONS = {"twee", "html"}
 
 
-# Only .twee files supported
-def allowed_file(filename: str) -> bool:
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+# Every admin route, like the admin page in main
+@admin_bp.before_request
+def require_admin():
+    if not UserStore.current_user_is_admin():
+        return "User must be set and must be an admin", 403
 
 
-@admin_bp.context_processor
-def inject_user():
-    user = UserStore.get_current_user()
-    return dict(user=user, current_user_is_admin=UserStore.current_user_is_admin)
+# Twee and published Twine HTML files, optionally compressed (e.g. story.twee.gz)
+def allowed_file(filename: str) -> bool:
+    filename, _ = split_compression(filename)
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
 @admin_bp.route("/admin/users")
@@ -46,9 +57,42 @@ def users():
 
 @admin_bp.route("/admin/seasons")
 def seasons():
+    # Show seasons whose scheduled time has passed as live, even if nobody has played since
+    SeasonStore.promote_due_seasons()
     seasons = SeasonStore.fetch_seasons_with_counts()
+    # Computed in the background, seasons show up once their statistics are ready
+    app = current_app._get_current_object()  # type: ignore
+    stats = {season.id: get_season_stats().get(app, season) for season in seasons}
+    # Every season is listed, so anything else cached was deleted, maybe on another worker
+    get_season_stats().retain(stats)
     return render_template(
-        "admin/admin_seasons.html", endpoint="admin.seasons", seasons=seasons
+        "admin/admin_seasons.html",
+        endpoint="admin.seasons",
+        seasons=seasons,
+        stats=stats,
+        stats_available=stats_available(),
+        import_jobs=get_import_jobs().list(),
+    )
+
+
+@admin_bp.route("/admin/import_jobs/<uuid:job_id>")
+def import_job(job_id: UUID):
+    job = get_import_jobs().get(job_id)
+    if job is None:
+        return jsonify(error="Import job not found"), 404
+    return jsonify(
+        id=job.id,
+        filename=job.filename,
+        status=job.status,
+        passages_parsed=job.passages_parsed,
+        rows_inserted=job.rows_inserted,
+        season_id=job.season_id,
+        duplicate=job.duplicate,
+        update=job.update,
+        changes=job.changes,
+        analysis=job.analysis,
+        error=job.error,
+        elapsed=job.elapsed,
     )
 
 
@@ -63,52 +107,157 @@ def upload_file():
         print("No selected file")
         return redirect(request.url)
     if file and file.filename and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filename_with_ts = f"{int(time.time())}_{filename}"
-        filepath = os.path.join(UPLOAD_FOLDER, filename_with_ts)
-        file.save(filepath)
-        twine = ImportTwine(filepath, file.filename)
-        twine.parse_twee_file()
-        twine.insert_story()
-
-        print("File successfully uploaded")
-        return redirect(url_for("admin.seasons"))
+        return import_upload(file, file.filename)
     else:
-        print("Allowed file types are .twee (Twine story files)")
+        print(
+            "Allowed file types are .twee and .html (Twine story files), optionally gzip or zstd compressed"
+        )
         return redirect(request.url)
 
 
+def import_upload(file: FileStorage, upload_filename: str):
+    # Update an existing season in place rather than importing a new one
+    season_id: UUID | None = None
+    if request.form.get("season_id"):
+        try:
+            season_id = UUID(request.form["season_id"])
+        except ValueError:
+            flash("Season not found")
+            return redirect(url_for("admin.seasons"))
+
+    # The upload is decompressed and hashed in one read, only stories big enough to
+    # be split across the parsing pool are spooled to a temporary file
+    try:
+        upload = read_upload(
+            file.stream, upload_filename, current_app.config["IMPORT_MAX_STORY_BYTES"]
+        )
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for("admin.seasons"))
+
+    # Identical uploads are recognized before anything is saved or parsed
+    existing = SeasonStore.get_season_by_content_hash(upload.content_hash)
+    if existing is not None:
+        upload.discard()
+        flash(
+            f"{upload_filename} is identical to season {existing.name} ({existing.id}), "
+            "nothing was imported"
+        )
+        return redirect(url_for("admin.seasons"))
+
+    if current_app.config["IMPORT_ARCHIVE_FOLDER"]:
+        archive_upload(
+            file.stream, upload_filename, current_app.config["IMPORT_ARCHIVE_FOLDER"]
+        )
+    job = submit_upload(upload, upload_filename, season_id)
+
+    if season_id is not None:
+        flash(
+            f"Update of season {season_id} from {upload_filename} queued as job {job.id}"
+        )
+    else:
+        flash(f"Import of {upload_filename} queued as job {job.id}")
+    return redirect(url_for("admin.seasons"))
+
+
+def submit_upload(
+    upload: StoryUpload, upload_filename: str, season_id: UUID | None
+) -> ImportJob:
+    filename, _ = split_compression(upload_filename)
+    if upload.path is not None:
+        return get_import_jobs().submit(
+            upload.path, filename, upload.content_hash, season_id, remove=True
+        )
+    assert upload.data is not None
+    return get_import_jobs().submit_data(
+        upload.data, filename, upload.content_hash, season_id
+    )
+
+
+@admin_bp.errorhandler(RequestEntityTooLarge)
+def upload_too_large(error: RequestEntityTooLarge):
+    flash(
+        f"Uploads are limited to {current_app.config['MAX_CONTENT_LENGTH']} bytes, "
+        "try compressing the file"
+    )
+    return redirect(url_for("admin.seasons"))
+
+
+@admin_bp.route("/admin/export/<uuid:season_id>")
+def export(season_id: UUID):
+    # Streamed as it is read from the database, see app/navigation/export_season.py
+    format = request.args.get("format", "twee")
+    if format not in EXPORT_FORMATS:
+        return jsonify(error=f"Unsupported export format {format}"), 400
+    season_export = export_season(season_id, format)
+    if season_export is None:
+        return jsonify(error="Season not found"), 404
+    return Response(
+        stream_with_context(season_export.chunks),
+        mimetype=season_export.mimetype,
+        headers={
+            "Content-Disposition": f'attachment; filename="{season_export.filename}"'
+        },
+    )
+
+
+@admin_bp.route("/admin/analysis/<uuid:season_id>")
+def analysis(season_id: UUID):
+    # Read from the distances stored on the locations, see app/seasons/season_analysis.py
+    Session = current_app.extensions["Session"]
+    with Session() as db_session:
+        result = season_analysis(db_session, season_id)
+    if result is None:
+        return (
+            jsonify(
+                error="Season not found or not analyzed, see flask analyze-seasons"
+            ),
+            404,
+        )
+    return jsonify(result)
+
+
 @admin_bp.route("/admin/delete_season/<uuid:season_id>", methods=["POST"])
 def delete_season(season_id: UUID):
-    Session = current_app.extensions["Session"]
-    with Session.begin() as db_session:
-        stmt = delete(Season).where(Season.id == season_id)
-        result = db_session.execute(stmt)
-        if result.rowcount > 0:
-            flash("Season successfully deleted")
-        else:
-            flash("Season not found")
+    if SeasonStore.delete_season(season_id):
+        flash("Season successfully deleted")
+    else:
+        flash("Season not found")
     return redirect(url_for("admin.seasons"))
 
 
 @admin_bp.route("/admin/make_default/<uuid:season_id>", methods=["POST"])
 def make_default(season_id: UUID):
-    Session = current_app.extensions["Session"]
-    with Session.begin() as db_session:
-        # First need to mark the current default season as not default
-        current_default_season = (
-            db_session.query(Season).filter(Season.default).one_or_none()
-        )
-        if current_default_season:
-            current_default_season.default = False
-            db_session.query(Season).update({Season.default: False})
-        season = db_session.query(Season).filter(Season.id == season_id).one_or_none()
-        if season:
-            # Reset the default flag for all seasons
-            db_session.query(Season).update({Season.default: False})
-            # Set the selected season as default
-            season.default = True
-            flash("Season successfully set as default")
-        else:
-            flash("Season not found")
-        return redirect(url_for("admin.seasons"))
+    if SeasonStore.make_default(season_id):
+        flash("Season successfully set as default")
+    else:
+        flash("Season not found")
+    return redirect(url_for("admin.seasons"))
+
+
+@admin_bp.route("/admin/publish/<uuid:season_id>", methods=["POST"])
+def publish_season(season_id: UUID):
+    # An ISO 8601 time with its UTC offset, publishes after SEASON_PUBLISH_LEAD by default
+    publish_at = None
+    if request.form.get("publish_at"):
+        try:
+            publish_at = datetime.fromisoformat(request.form["publish_at"])
+        except ValueError:
+            flash(f"Invalid publish time {request.form['publish_at']}")
+            return redirect(url_for("admin.seasons"))
+
+    scheduled = SeasonStore.publish_season(season_id, publish_at)
+    if scheduled is not None:
+        flash(f"Season scheduled to go live at {scheduled.isoformat()}")
+    else:
+        flash("Season not found")
+    return redirect(url_for("admin.seasons"))
+
+
+@admin_bp.route("/admin/unschedule/<uuid:season_id>", methods=["POST"])
+def unschedule_season(season_id: UUID):
+    if SeasonStore.unschedule_season(season_id):
+        flash("Scheduled publish cancelled")
+    else:
+        flash("Season not found")
+    return redirect(url_for("admin.seasons"))
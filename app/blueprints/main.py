@@ -1,8 +1,9 @@
 import uuid
 
-from flask import Blueprint, render_template
+from flask import Blueprint, abort, render_template
 
 from ..navigation.nav import Nav
+from ..navigation.season_graph import GraphDestination
 from ..seasons.seasons import SeasonStore
 from ..users.users import UserStore
 from ..util import uuid_validate
@@ -10,13 +11,6 @@ from ..util import uuid_validate
 main_bp = Blueprint("main", __name__)
 
 
-# TODO: Refactor so we don't have to copy pasta this inject_user across all blueprints
-@main_bp.context_processor
-def inject_user():
-    user = UserStore.get_current_user()
-    return dict(user=user, current_user_is_admin=UserStore.current_user_is_admin)
-
-
 @main_bp.route("/")
 def index():
     return render_template("index.html")
@@ -60,8 +54,7 @@ def play(url_season_id: str | None):
         )
 
     nav = Nav(season_id, season.genesis_location_id, user)
-    nav.set_location(season.genesis_location_id)
-    return render_decisions(nav)
+    return render_decisions(nav, *nav.transition(season.genesis_location_id))
 
 
 @main_bp.route("/play/<url_season_id>/<url_location_id>")
@@ -76,15 +69,17 @@ def play_location(url_season_id: str, url_location_id: str):
         return render_template("login.html")
 
     nav = Nav(season_id, location_id, user)
-    nav.set_location(location_id)
-    return render_decisions(nav)
+    try:
+        return render_decisions(nav, *nav.transition(location_id))
+    except ValueError:
+        # A stale or made up location id, or one of another season
+        abort(404)
 
 
 # Helper function to render all the decisions for a location
-# def render_decisions(season_id: uuid.UUID, location_id: uuid.UUID):
-def render_decisions(nav: Nav):
-    # location_description, decisions = Nav.get_decisions_for_location(location_id)
-    location_description, decisions = nav.fetch_decisions()
+def render_decisions(
+    nav: Nav, location_description: str, decisions: list[GraphDestination]
+):
     return render_template(
         "game.html",
         location_description=location_description,
@@ -0,0 +1,527 @@
+from __future__ import annotations
+
+import datetime
+import glob
+import io
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import (
+    Executor,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
+from functools import partial
+
+import click
+from flask import Flask, current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+from .models import Season
+from .navigation.export_season import EXPORT_FORMATS, export_season
+from .navigation.import_jobs import (
+    IMPORTERS,
+    importer_for,
+    parse_story_path,
+    parse_story_split,
+    splits_across_pool,
+)
+from .navigation.import_twine import (
+    HarloweMetadata,
+    Import,
+    ImportTwine,
+    TwinePassage,
+    content_hash,
+    hash_story_file,
+)
+from .seasons import partitions
+from .seasons.season_analysis import analyze_season
+from .seasons.seasons import SeasonStore
+
+"""
+Flask CLI commands, e.g. `flask import-seasons stories/`
+"""
+
+ParseResult = tuple[str, HarloweMetadata | None, list[TwinePassage]]
+
+
+def expand_sources(sources: tuple[str, ...]) -> list[str]:
+    """
+    Expand directories and glob patterns into a list of story files. "-" stands for stdin.
+
+    Returns:
+        list[str]: File paths, in the order given
+    """
+    paths: list[str] = []
+    for source in sources:
+        if source == "-":
+            paths.append(source)
+        elif os.path.isdir(source):
+            paths.extend(
+                sorted(
+                    path
+                    for extension in IMPORTERS
+                    for path in glob.glob(os.path.join(source, f"*.{extension}"))
+                )
+            )
+        elif glob.has_magic(source):
+            paths.extend(sorted(glob.glob(source)))
+        else:
+            paths.append(source)
+    return paths
+
+
+@click.command("import-seasons")
+@click.argument("sources", nargs=-1, required=True)
+@click.option(
+    "--workers",
+    type=int,
+    default=os.cpu_count() or 1,
+    show_default=True,
+    help="Parsing processes, 0 parses in this process",
+)
+@click.option(
+    "--writers",
+    type=int,
+    default=2,
+    show_default=True,
+    help="How many seasons may be inserted into the database at once",
+)
+@with_appcontext
+def import_seasons(sources: tuple[str, ...], workers: int, writers: int) -> None:
+    """
+    Import Twee or published Twine HTML files as new seasons.
+
+    SOURCES are .twee or .html files, directories of them, glob patterns or - for Twee on stdin.
+    """
+    paths = expand_sources(sources)
+    if not paths:
+        raise click.UsageError("No .twee or .html files found")
+
+    run = _ImportRun(current_app._get_current_object(), workers, writers)  # type: ignore
+    started = time.perf_counter()
+    parse_pool: Executor = (
+        ProcessPoolExecutor(max_workers=workers)
+        if workers > 0
+        else ThreadPoolExecutor(max_workers=1)
+    )
+    # Waits on the parse pool for files split across it, see parse_story_split
+    split_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="import-split")
+    with parse_pool, split_pool, ThreadPoolExecutor(max_workers=writers) as write_pool:
+        stories = run.hash_files(paths)
+        inserts = run.queue_parses(stories, parse_pool, split_pool, write_pool)
+        run.report_inserts(inserts)
+
+    elapsed = time.perf_counter() - started
+    click.echo(
+        f"Imported {len(paths) - run.failures - run.skipped}/{len(paths)} files, "
+        f"{run.total_passages} passages and {run.total_rows} rows in {elapsed:.2f}s"
+        + (f", skipped {run.skipped} identical files" if run.skipped else "")
+    )
+    if run.failures:
+        sys.exit(1)
+
+
+class _ImportRun:
+    """
+    One run of import-seasons: files are hashed here, parsed on the parse pool and inserted
+    on the write pool as their parses complete, with a tally for the summary
+
+    A parsed story is held in memory until a writer takes it, and parsing outruns inserting,
+    so at most twice as many parses as there are writers are queued or waiting at once.
+    """
+
+    def __init__(self, app: Flask, workers: int, writers: int):
+        self.app = app
+        self.workers = workers
+        self.failures = 0
+        self.skipped = 0
+        self.total_passages = 0
+        self.total_rows = 0
+        # Files already seen in this run, so identical files aren't inserted twice
+        self.seen: dict[str, str] = {}
+        # Parses submitted that no writer has taken yet
+        self.max_parses = writers * 2
+        self.parse_slots = threading.BoundedSemaphore(self.max_parses)
+        # Inserts are queued and failures tallied from the parse pools' threads
+        self.lock = threading.Lock()
+        self.inserts: dict[Future, tuple[str, float, int]] = {}
+
+    def hash_files(self, paths: list[str]) -> list[tuple[str, bytes | None, str]]:
+        """
+        Hash every file and skip the ones already imported, before anything is inserted
+
+        Returns:
+            list[tuple[str, bytes | None, str]]: Each file to import, with the story read
+            from stdin and its hash
+        """
+        stories: list[tuple[str, bytes | None, str]] = []
+        for path in paths:
+            try:
+                data, digest = _read_hash(path)
+            except OSError as e:
+                self.fail(path, "read", e)
+                continue
+            if not self.identical(path, digest):
+                stories.append((path, data, digest))
+        return stories
+
+    def queue_parses(
+        self,
+        stories: list[tuple[str, bytes | None, str]],
+        parse_pool: Executor,
+        split_pool: Executor,
+        write_pool: Executor,
+    ) -> dict[Future, tuple[str, float, int]]:
+        """
+        Parse each story and hand it to the write pool once it is parsed
+
+        Returns:
+            dict[Future, tuple[str, float, int]]: Each insert, with its file, parse time
+            and passage count
+        """
+        for path, data, digest in stories:
+            # Blocks while as many parses as the writers can take are waiting for them
+            self.parse_slots.acquire()
+            future = self.parse(path, data, parse_pool, split_pool)
+            future.add_done_callback(
+                partial(
+                    self.queue_insert, write_pool, path, digest, time.perf_counter()
+                )
+            )
+        # Every slot is free once each parse has failed or been taken by a writer
+        for _ in range(self.max_parses):
+            self.parse_slots.acquire()
+        with self.lock:
+            return self.inserts
+
+    def identical(self, path: str, digest: str) -> bool:
+        existing = SeasonStore.get_season_by_content_hash(digest)
+        if existing is None and digest not in self.seen:
+            self.seen[digest] = path
+            return False
+        self.skipped += 1
+        original = (
+            f"season {existing.id}" if existing is not None else self.seen[digest]
+        )
+        click.echo(f"{path}: identical to {original}, skipped")
+        return True
+
+    def parse(
+        self,
+        path: str,
+        data: bytes | None,
+        parse_pool: Executor,
+        split_pool: Executor,
+    ) -> Future:
+        if data is not None:
+            # stdin can't be handed to another process, so it is parsed right here
+            future: Future = Future()
+            try:
+                future.set_result(_parse_stream(ImportTwine(path, "stdin.twee"), data))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        if self.workers > 1 and splits_across_pool(path, os.path.basename(path)):
+            # Spread over every parse worker, while the other files keep being queued
+            return split_pool.submit(
+                parse_story_split, path, os.path.basename(path), parse_pool
+            )
+        return parse_pool.submit(parse_story_path, path, os.path.basename(path))
+
+    def queue_insert(
+        self,
+        write_pool: Executor,
+        path: str,
+        digest: str,
+        parse_start: float,
+        future: Future,
+    ) -> None:
+        # Called when the parse completes, on the thread that completed it
+        parse_time = time.perf_counter() - parse_start
+        try:
+            parsed: ParseResult = future.result()
+            with self.lock:
+                insert = write_pool.submit(self.insert, path, digest, parsed)
+                self.inserts[insert] = (path, parse_time, len(parsed[2]))
+        except Exception as e:
+            self.fail(path, "parse", e)
+            self.parse_slots.release()
+
+    def insert(
+        self, filename: str, digest: str, parsed: ParseResult
+    ) -> tuple[Import, int, float]:
+        # The parse is this writer's now, another one can be submitted
+        self.parse_slots.release()
+        insert_started = time.perf_counter()
+        rows = 0
+
+        def on_progress(count: int) -> None:
+            nonlocal rows
+            rows = count
+
+        with self.app.app_context():
+            twine = importer_for(filename)(filename, os.path.basename(filename))
+            twine.story_title, twine.metadata, twine.passages = parsed
+            twine.content_hash = digest
+            twine.insert_story(on_progress=on_progress)
+        return twine, rows, time.perf_counter() - insert_started
+
+    def report_inserts(self, inserts: dict[Future, tuple[str, float, int]]) -> None:
+        for future in as_completed(inserts):
+            path, parse_time, passages = inserts[future]
+            try:
+                twine, rows, insert_time = future.result()
+            except Exception as e:
+                self.fail(path, "insert", e)
+                continue
+            self.total_passages += passages
+            self.total_rows += rows
+            click.echo(
+                f"{path}: season {twine.season_id}, {passages} passages parsed in "
+                f"{parse_time:.2f}s, {rows} rows inserted in {insert_time:.2f}s, "
+                f"{twine.analysis}"
+            )
+
+    def fail(self, path: str, stage: str, error: Exception) -> None:
+        with self.lock:
+            self.failures += 1
+            click.echo(f"{path}: {stage} failed: {error}", err=True)
+
+
+def _read_hash(path: str) -> tuple[bytes | None, str]:
+    """
+    Hash a story file, or read and hash stdin for "-"
+
+    Returns:
+        tuple[bytes | None, str]: The story read from stdin, None for files, and its hash
+    """
+    if path == "-":
+        data = sys.stdin.buffer.read()
+        return data, content_hash(io.BytesIO(data))
+    return None, hash_story_file(path)
+
+
+@click.command("update-season")
+@click.argument("season_id", type=click.UUID)
+@click.argument("source")
+@with_appcontext
+def update_season(season_id: uuid.UUID, source: str) -> None:
+    """
+    Update a season in place from an edited Twee or published Twine HTML file.
+
+    Only the passages that were added, changed or removed are written, and players keep
+    their progress. SOURCE is a .twee or .html file, or - for Twee on stdin.
+    """
+    started = time.perf_counter()
+    try:
+        if source == "-":
+            data = sys.stdin.buffer.read()
+        else:
+            with open(source, "rb") as file:
+                data = file.read()
+    except OSError as e:
+        click.echo(f"{source}: read failed: {e}", err=True)
+        sys.exit(1)
+
+    digest = content_hash(io.BytesIO(data))
+    existing = SeasonStore.get_season_by_content_hash(digest)
+    if existing is not None:
+        click.echo(f"{source}: identical to season {existing.id}, nothing to update")
+        return
+
+    filename = "stdin.twee" if source == "-" else os.path.basename(source)
+    try:
+        twine = importer_for(filename)(source, filename)
+        twine.story_title, twine.metadata, twine.passages = _parse_stream(twine, data)
+        twine.content_hash = digest
+        changes = twine.update_story(season_id)
+    except Exception as e:
+        click.echo(f"{source}: update failed: {e}", err=True)
+        sys.exit(1)
+    click.echo(
+        f"Updated season {season_id} from {source} in "
+        f"{time.perf_counter() - started:.2f}s: {changes}, {twine.analysis}"
+    )
+
+
+@click.command("publish-season")
+@click.argument("season_id", type=click.UUID)
+@click.option(
+    "--at",
+    "publish_at",
+    type=datetime.datetime.fromisoformat,
+    help="When to go live, ISO 8601 with a UTC offset. Defaults to SEASON_PUBLISH_LEAD from now",
+)
+@click.option(
+    "--now", is_flag=True, help="Make the season the default right away, on this worker"
+)
+@with_appcontext
+def publish_season(
+    season_id: uuid.UUID, publish_at: datetime.datetime | None, now: bool
+) -> None:
+    """
+    Publish a staged season, e.g. from a deploy script or cron at a season launch.
+    """
+    if now:
+        if not SeasonStore.make_default(season_id):
+            click.echo(f"Season {season_id} not found", err=True)
+            sys.exit(1)
+        click.echo(f"Season {season_id} is live")
+        return
+
+    scheduled = SeasonStore.publish_season(season_id, publish_at)
+    if scheduled is None:
+        click.echo(f"Season {season_id} not found", err=True)
+        sys.exit(1)
+    click.echo(f"Season {season_id} goes live at {scheduled.isoformat()}")
+
+
+@click.command("recount-seasons")
+@click.argument("season_ids", nargs=-1, type=click.UUID)
+@with_appcontext
+def recount_seasons(season_ids: tuple[uuid.UUID, ...]) -> None:
+    """
+    Count the locations, decisions, destinations and players of seasons from scratch.
+
+    Run it once after upgrading to a schema with count columns. SEASON_IDS default to every
+    season.
+    """
+    started = time.perf_counter()
+    counted = SeasonStore.recount_seasons(list(season_ids) if season_ids else None)
+    click.echo(f"Counted {counted} seasons in {time.perf_counter() - started:.2f}s")
+    if season_ids and counted < len(season_ids):
+        click.echo(f"{len(season_ids) - counted} seasons not found", err=True)
+        sys.exit(1)
+
+
+@click.command("analyze-seasons")
+@click.argument("season_ids", nargs=-1, type=click.UUID)
+@with_appcontext
+def analyze_seasons(season_ids: tuple[uuid.UUID, ...]) -> None:
+    """
+    Find unreachable passages, dead ends and passages without a way to an ending.
+
+    Imports analyze stories as they are written, run this for seasons imported before or
+    edited since. Each season is analyzed in its own transaction. SEASON_IDS default to
+    every season.
+    """
+    Session = current_app.extensions["Session"]
+    if not season_ids:
+        with Session() as db_session:
+            season_ids = tuple(db_session.execute(select(Season.id)).scalars())
+    failures = 0
+    for season_id in season_ids:
+        started = time.perf_counter()
+        try:
+            with Session.begin() as db_session:
+                analysis = analyze_season(db_session, season_id)
+        except ValueError as e:
+            failures += 1
+            click.echo(f"Season {season_id}: {e}", err=True)
+            continue
+        click.echo(
+            f"Season {season_id}: {analysis} in {time.perf_counter() - started:.2f}s"
+        )
+    if failures:
+        sys.exit(1)
+
+
+@click.command("partition-seasons")
+@with_appcontext
+def partition_seasons() -> None:
+    """
+    Partition the season tables of a Postgres database by season.
+
+    Converts the default layout, copying every row, so run it during maintenance (see
+    app/seasons/partitions.py). On a partitioned database it drops the partitions of deleted
+    seasons that were left behind instead.
+    """
+    engine = current_app.extensions["engine"]
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        orphaned = (
+            partitions.orphaned_partition_seasons(connection)
+            if partitions.is_partitioned(connection)
+            else None
+        )
+    if orphaned is not None:
+        dropped = sum(
+            partitions.drop_season_partitions(engine, season_id)
+            for season_id in orphaned
+        )
+        click.echo(
+            f"Already partitioned, dropped {dropped} partitions of {len(orphaned)} "
+            "deleted seasons"
+        )
+        return
+
+    try:
+        with engine.begin() as connection:
+            seasons = partitions.partition_tables(connection)
+    except ValueError as e:
+        click.echo(str(e), err=True)
+        sys.exit(1)
+    click.echo(f"Partitioned {seasons} seasons in {time.perf_counter() - started:.2f}s")
+
+
+@click.command("export-season")
+@click.argument("season_id", type=click.UUID)
+@click.option(
+    "--format",
+    "format",
+    type=click.Choice(list(EXPORT_FORMATS)),
+    default="twee",
+    show_default=True,
+)
+@click.option(
+    "--output",
+    "-o",
+    type=click.Path(dir_okay=False, writable=True),
+    help="File to write, stdout by default",
+)
+@with_appcontext
+def export_season_command(
+    season_id: uuid.UUID, format: str, output: str | None
+) -> None:
+    """
+    Export a season as Twee, which can be imported again, or JSON Lines.
+
+    The season is written out as it is read, so large seasons take little memory.
+    """
+    started = time.perf_counter()
+    season_export = export_season(season_id, format)
+    if season_export is None:
+        click.echo(f"Season {season_id} not found", err=True)
+        sys.exit(1)
+    if output is None:
+        for chunk in season_export.chunks:
+            click.echo(chunk, nl=False)
+        return
+    with open(output, "w", encoding="utf-8") as file:
+        for chunk in season_export.chunks:
+            file.write(chunk)
+    click.echo(
+        f"Exported season {season_id} to {output} in "
+        f"{time.perf_counter() - started:.2f}s"
+    )
+
+
+def _parse_stream(twine: Import, data: bytes) -> ParseResult:
+    passages = list(twine.iter_passages(io.StringIO(data.decode("utf-8-sig"))))
+    return (twine.story_title, twine.metadata, passages)
+
+
+def register_commands(app: Flask) -> None:
+    app.cli.add_command(import_seasons)
+    app.cli.add_command(update_season)
+    app.cli.add_command(publish_season)
+    app.cli.add_command(recount_seasons)
+    app.cli.add_command(analyze_seasons)
+    app.cli.add_command(partition_seasons)
+    app.cli.add_command(export_season_command)
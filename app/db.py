@@ -1,5 +1,6 @@
 # utils.py or db.py
-from flask import current_app
+from flask import current_app, g
+from sqlalchemy.engine.base import Engine
 from sqlalchemy.orm import Session
 
 """
@@ -8,4 +9,47 @@ Utility functions for the database
 
 
 def get_db_session() -> Session:
-    return current_app.extensions["Session"]()
+    """
+    Get the session for the current request
+
+    The session is created on first use and closed (or rolled back, if the request failed)
+    by close_db_session when the app context is torn down, which returns its connection to
+    the pool.
+
+    Returns:
+        Session
+    """
+    if "db_session" not in g:
+        g.db_session = current_app.extensions["Session"]()
+    return g.db_session
+
+
+def close_db_session(exception: BaseException | None = None) -> None:
+    db_session: Session | None = g.pop("db_session", None)
+    if db_session is None:
+        return
+    if exception is not None:
+        db_session.rollback()
+    db_session.close()
+
+
+def prewarm_pool(engine: Engine, count: int) -> None:
+    """
+    Open connections up front so the first requests after a deploy don't pay for the
+    connection setup. All of them are checked out at once (so the pool can't hand back the
+    same connection twice) and then returned to the pool.
+
+    Args:
+        engine (Engine): The engine whose pool should be warmed
+        count (int): How many connections to open, capped at the pool size
+    """
+    size = getattr(engine.pool, "size", None)
+    if callable(size):
+        count = min(count, size())
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
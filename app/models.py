@@ -59,6 +59,35 @@ class Season(Base):
         TIMESTAMP(timezone=True), nullable=False, server_default="now()"
     )
     origin_file: Mapped[str] = mapped_column(VARCHAR(2048), nullable=True)
+    # SHA-256 of the normalized Twee file, so identical uploads map to the same season
+    content_hash: Mapped[str | None] = mapped_column(VARCHAR(64), nullable=True)
+    # When the season went live, None while it is staged. Imports land staged
+    published_at: Mapped[datetime.datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+    # Scheduled cutover to this season, see SeasonStore.promote_due_seasons
+    publish_at: Mapped[datetime.datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+    # Row counts of the season's content and players, kept up to date by every write so the
+    # admin overview doesn't count them. See app.seasons.season_counts
+    location_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    decision_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    destination_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    player_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+    # Bumped whenever the season's content changes in place, so every worker can tell its
+    # compiled graph of the season is stale. See app.navigation.season_graph
+    content_version: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
 
     # relationships
     genesis_location: Mapped["Location"] = relationship(
@@ -86,11 +115,15 @@ class Season(Base):
             "default",
             unique=True,
             postgresql_where=and_(default == True, genesis_location_id != None),
+            sqlite_where=and_(default.is_(True), genesis_location_id.is_not(None)),
         ),
+        # Fallback for get_current_season when no season is marked as default
+        Index("ix_seasons_date_created", "date_created"),
+        Index("ix_seasons_content_hash", "content_hash", unique=True),
     )
 
     def __repr__(self) -> str:
-        return f"<Season(id={self.id}, name={self.name}, genesis_location_id={self.genesis_location_id}, default={self.default}, date_created={self.date_created})>"
+        return f"<Season(id={self.id}, name={self.name}, genesis_location_id={self.genesis_location_id}, default={self.default}, date_created={self.date_created}, published_at={self.published_at}, publish_at={self.publish_at})>"
 
 
 class UserLocation(Base):
@@ -119,6 +152,9 @@ class UserLocation(Base):
     # Many-to-one relationship: a user_location has one season
     season: Mapped["Season"] = relationship("Season", back_populates="user_seasons")
 
+    # Deleting a season cascades through locations to here
+    __table_args__ = (Index("ix_user_locations_location_id", "location_id"),)
+
 
 class Location(Base):
     __tablename__ = "locations"
@@ -126,6 +162,15 @@ class Location(Base):
         UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
     )
     description: Mapped[str] = mapped_column(TEXT, nullable=False)
+    # Name of the passage the location was imported from, so a re-import of the season can
+    # match its passages to the stored locations. None for locations imported before names
+    # were stored
+    name: Mapped[str | None] = mapped_column(TEXT, nullable=True)
+    # Fewest moves from the genesis location and to the nearest location without
+    # decisions, see app/navigation/story_analysis.py. None where there is no way, and for
+    # locations that weren't imported or were imported before the analysis
+    start_distance: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    ending_distance: Mapped[int | None] = mapped_column(Integer, nullable=True)
     season_id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True),
         ForeignKey(
@@ -163,7 +208,10 @@ class Location(Base):
         "UserLocation", back_populates="location", cascade="all, delete-orphan"
     )
 
-    __table_args__ = (Index("ix_locations_season_id", "season_id"),)
+    __table_args__ = (
+        Index("ix_locations_season_id", "season_id"),
+        Index("ix_locations_season_id_name", "season_id", "name", unique=True),
+    )
 
     def __repr__(self) -> str:
         return f"<Location(id={self.id}, description={self.description})>"
@@ -182,6 +230,9 @@ class Decision(Base):
             ondelete="CASCADE",
         ),
     )
+    # The source location's season, so the table can be partitioned by season. See
+    # app.seasons.partitions
+    season_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
 
     # One-to-many relationship: a decision has one source location
     source_location: Mapped["Location"] = relationship(
@@ -199,6 +250,9 @@ class Decision(Base):
         secondaryjoin="Location.id == DecisionDestination.destination_location_id",
     )
 
+    # Decisions are looked up by location, and deleted with their location
+    __table_args__ = (Index("ix_decisions_source_location_id", "source_location_id"),)
+
     def __repr__(self) -> str:
         return f"<Decision(id={self.id}, source_location_id={self.source_location_id})>"
 
@@ -229,6 +283,8 @@ class DecisionDestination(Base):
     )
     description: Mapped[str] = mapped_column(TEXT, nullable=False)
     position: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # The decision's season, see Decision.season_id
+    season_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=False)
 
     __table_args__ = (
         # Ensure there is only ever a single position for a location
@@ -239,7 +295,50 @@ class DecisionDestination(Base):
             "position",
             name="destination_location_position_unique",
         ),
+        # Without it every location deleted with its season scans the whole table
+        Index(
+            "ix_decision_destinations_destination_location_id",
+            "destination_location_id",
+        ),
     )
 
     def __repr__(self) -> str:
         return f"<DecisionDestination(id={self.id}, decision_id={self.decision_id}, destination_location_id={self.destination_location_id}, description={self.description}, position={self.position})>"
+
+
+class ImportJobRecord(Base):
+    """
+    Status of a background season import, so every worker can report on the jobs any of
+    them accepted. See app.navigation.import_jobs
+    """
+
+    __tablename__ = "import_jobs"
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    filename: Mapped[str] = mapped_column(VARCHAR(2048), nullable=False)
+    status: Mapped[str] = mapped_column(VARCHAR(16), nullable=False)
+    passages_parsed: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    rows_inserted: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    # Not a foreign key, the job outlives a season deleted after it was imported
+    season_id: Mapped[uuid.UUID | None] = mapped_column(
+        UUID(as_uuid=True), nullable=True
+    )
+    duplicate: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    update: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    changes: Mapped[str | None] = mapped_column(TEXT, nullable=True)
+    analysis: Mapped[str | None] = mapped_column(TEXT, nullable=True)
+    error: Mapped[str | None] = mapped_column(TEXT, nullable=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=False
+    )
+    started_at: Mapped[datetime.datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+    finished_at: Mapped[datetime.datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True
+    )
+
+    # The admin pages list the newest jobs
+    __table_args__ = (Index("ix_import_jobs_created_at", "created_at"),)
+
+    def __repr__(self) -> str:
+        return f"<ImportJobRecord(id={self.id}, filename={self.filename}, status={self.status})>"
@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import json
+from collections import Counter
+from dataclasses import dataclass
+from itertools import groupby
+from typing import Callable, Iterable, Iterator
+from uuid import UUID, uuid5
+
+from flask import current_app
+from sqlalchemy import String, and_, cast, func, select
+from sqlalchemy.orm import Session, aliased, sessionmaker
+
+from ..models import Decision, DecisionDestination, Location, Season
+from .import_twine import LINK_PATTERN, TwineLink, TwinePassage
+
+"""
+Streaming a season back out as a story file
+
+A season is read with a single query over its locations and destinations, fetched in
+batches of EXPORT_BATCH_ROWS from a server-side cursor on Postgres (yield_per), and written
+out as it is read. Only one passage and one output chunk are held in memory at a time, so
+exporting a season with hundreds of thousands of locations takes as little memory as a
+small one. The export only reads, so it takes no locks that would hold up players or
+imports on other workers.
+
+Twee exports can be imported again. Only what the importer stored comes back: a passage's
+first line and its links, not passage positions or the rest of its text.
+"""
+
+# Rows fetched from the database at a time
+EXPORT_BATCH_ROWS = 1000
+# Output is handed to the response or file in chunks of about this many characters
+EXPORT_CHUNK_CHARS = 64 * 1024
+
+# Seasons don't store the Harlowe version they were written for
+HARLOWE_FORMAT_VERSION = "3.3.9"
+
+
+@dataclass
+class StoryHeader:
+    """
+    What an export writes before the passages
+    """
+
+    title: str
+    ifid: str
+    start: str
+
+
+@dataclass
+class SeasonExport:
+    """
+    A season export. The passages are read from the database while chunks is iterated
+    """
+
+    filename: str
+    mimetype: str
+    chunks: Iterator[str]
+
+
+def export_season(season_id: UUID, format: str) -> SeasonExport | None:
+    """
+    Export a season as Twee or JSON Lines
+
+    The season is looked up right away, the passages are only read as the chunks are
+    consumed, in a session of their own. Close the chunks iterator to stop early.
+
+    Args:
+        season_id (UUID): The season id
+        format (str): A key of EXPORT_FORMATS, "twee" or "jsonl"
+
+    Returns:
+        SeasonExport | None: The export, None if the season doesn't exist
+
+    Raises:
+        ValueError: If the format isn't supported
+    """
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format {format}")
+    write, mimetype = EXPORT_FORMATS[format]
+    Session = current_app.extensions["Session"]
+    with Session() as db_session:
+        name = db_session.execute(
+            select(Season.name).where(Season.id == season_id)
+        ).scalar()
+    if name is None:
+        return None
+    return SeasonExport(
+        filename=f"{_file_stem(name)}.{format}",
+        mimetype=mimetype,
+        chunks=_chunks(_export(Session, season_id, write)),
+    )
+
+
+def iter_season_passages(
+    db_session: Session, season_id: UUID
+) -> Iterator[tuple[UUID, TwinePassage]]:
+    """
+    Read the passages of a season, ordered by name, with their links in position order
+
+    Locations imported before names were stored are named after their id, and so are links
+    to them.
+
+    Yields:
+        tuple[UUID, TwinePassage]: Each location id and its passage
+    """
+    target = aliased(Location)
+    # The season predicates let Postgres prune to the season's partitions, see
+    # app.seasons.partitions
+    stmt = (
+        select(
+            Location.id,
+            func.coalesce(Location.name, cast(Location.id, String)).label("name"),
+            Location.description,
+            DecisionDestination.description.label("label"),
+            # Named in SQL, converting every destination id to a UUID is most of the cost
+            # of reading a row
+            func.coalesce(
+                target.name, cast(DecisionDestination.destination_location_id, String)
+            ).label("target"),
+        )
+        .select_from(Location)
+        .outerjoin(
+            Decision,
+            and_(
+                Decision.source_location_id == Location.id,
+                Decision.season_id == season_id,
+            ),
+        )
+        .outerjoin(
+            DecisionDestination,
+            and_(
+                DecisionDestination.decision_id == Decision.id,
+                DecisionDestination.season_id == season_id,
+            ),
+        )
+        .outerjoin(
+            target,
+            and_(
+                target.id == DecisionDestination.destination_location_id,
+                target.season_id == season_id,
+            ),
+        )
+        .where(Location.season_id == season_id)
+        .order_by(
+            Location.name,
+            Location.id,
+            DecisionDestination.position,
+            DecisionDestination.id,
+        )
+    )
+    # On the session's connection, as the rows don't need the ORM's processing
+    rows = db_session.connection().execute(
+        stmt, execution_options={"yield_per": EXPORT_BATCH_ROWS}
+    )
+    for id, location_rows in groupby(rows, key=lambda row: row.id):
+        first = next(location_rows)
+        links = [
+            TwineLink(row.label, row.target)
+            for row in (first, *location_rows)
+            if row.label is not None
+        ]
+        yield id, TwinePassage(first.name, first.description, links)
+
+
+def twee_lines(
+    header: StoryHeader, passages: Iterable[tuple[UUID, TwinePassage]]
+) -> Iterator[str]:
+    """
+    Format a story as Twee 3, which ImportTwine reads back
+    """
+    story_data = {
+        "ifid": header.ifid,
+        "format": "Harlowe",
+        "format-version": HARLOWE_FORMAT_VERSION,
+        "start": header.start,
+        "zoom": 1,
+    }
+    yield f":: StoryTitle\n{header.title}\n\n"
+    yield f":: StoryData\n{json.dumps(story_data, indent=2)}\n\n"
+    for _, passage in passages:
+        lines = [f":: {passage.name}\n", f"{passage.content}\n"]
+        # Links in the content line are read back from it, writing them again would
+        # duplicate them on the next import
+        in_content = Counter(
+            (label, target or label)
+            for label, target in LINK_PATTERN.findall(passage.content or "")
+        )
+        for link in passage.links:
+            if in_content[(link.label, link.target)] > 0:
+                in_content[(link.label, link.target)] -= 1
+                continue
+            if link.label == link.target:
+                lines.append(f"[[{link.label}]]\n")
+            else:
+                lines.append(f"[[{link.label}->{link.target}]]\n")
+        lines.append("\n")
+        yield "".join(lines)
+
+
+def jsonl_lines(
+    header: StoryHeader, passages: Iterable[tuple[UUID, TwinePassage]]
+) -> Iterator[str]:
+    """
+    Format a story as JSON Lines, the story itself on the first line and then a passage per
+    line
+    """
+    yield json.dumps(
+        {
+            "type": "story",
+            "title": header.title,
+            "ifid": header.ifid,
+            "format": "Harlowe",
+            "start": header.start,
+        }
+    ) + "\n"
+    for id, passage in passages:
+        yield json.dumps(
+            {
+                "type": "passage",
+                "id": str(id),
+                "name": passage.name,
+                "content": passage.content,
+                "links": [
+                    {"label": link.label, "target": link.target}
+                    for link in passage.links
+                ],
+            }
+        ) + "\n"
+
+
+# Formats a story header and its passages
+StoryWriter = Callable[
+    [StoryHeader, Iterable[tuple[UUID, TwinePassage]]], Iterator[str]
+]
+
+# Format name: (writer, mimetype)
+EXPORT_FORMATS: dict[str, tuple[StoryWriter, str]] = {
+    "twee": (twee_lines, "text/plain"),
+    "jsonl": (jsonl_lines, "application/jsonl"),
+}
+
+
+def _export(
+    Session: sessionmaker,
+    season_id: UUID,
+    write: StoryWriter,
+) -> Iterator[str]:
+    with Session() as db_session:
+        if db_session.get_bind().dialect.name == "postgresql":
+            # The story header and the passages come from one snapshot, even while the
+            # season is updated, and the export only takes the locks every read takes
+            db_session.connection(
+                execution_options={
+                    "isolation_level": "REPEATABLE READ",
+                    "postgresql_readonly": True,
+                }
+            )
+        season = db_session.get(Season, season_id)
+        if season is None:
+            # Deleted since export_season looked it up
+            return
+        start = db_session.execute(
+            select(func.coalesce(Location.name, cast(Location.id, String))).where(
+                Location.id == season.genesis_location_id,
+                Location.season_id == season_id,
+            )
+        ).scalar()
+        header = StoryHeader(
+            title=season.name,
+            # Stable across exports of the season
+            ifid=str(uuid5(season_id, "ifid")).upper(),
+            start=start or "",
+        )
+        yield from write(header, iter_season_passages(db_session, season_id))
+
+
+def _file_stem(name: str) -> str:
+    stem = "".join(
+        character if character.isalnum() or character in "-_" else "_"
+        for character in name
+    ).strip("_")
+    return stem or "season"
+
+
+def _chunks(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Join lines into chunks of about EXPORT_CHUNK_CHARS, so a response isn't written a
+    passage at a time
+    """
+    chunk: list[str] = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_CHARS:
+            yield "".join(chunk)
+            chunk = []
+            size = 0
+    if chunk:
+        yield "".join(chunk)
@@ -0,0 +1,517 @@
+from __future__ import annotations
+
+import datetime
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from uuid import UUID, uuid4
+
+from flask import Flask, current_app
+from sqlalchemy import delete, select
+
+from ..models import ImportJobRecord
+from ..seasons.seasons import SeasonStore
+from . import import_twine
+from .import_twine import (
+    PARALLEL_PARSE_MIN_BYTES,
+    HarloweMetadata,
+    Import,
+    ImportTwine,
+    TwinePassage,
+    hash_story_file,
+)
+from .import_twine_html import ImportTwineHtml
+
+"""
+Background season imports
+
+Uploads are queued as import jobs and run on a small thread pool, so a large story doesn't
+tie up a web worker (or hit the proxy timeout). Parsing is CPU bound and runs in a process
+pool, inserting runs on the job thread. IMPORT_MAX_CONCURRENT caps how many imports run at
+once so imports can't starve play traffic of CPU and database connections.
+
+A job runs on the worker that accepted the upload. Its status is written to the
+import_jobs table when it is queued, at every phase and when it finishes, so the admin
+pages of every worker can report on it. The rows inserted so far are only live on the
+worker running the job, the others see the count as of the last phase. A job whose worker
+was killed stays in its last phase, a worker shut down cleanly fails its queued jobs.
+"""
+
+logger = logging.getLogger(__name__)
+
+# How many finished jobs to remember for the admin pages
+MAX_FINISHED_JOBS = 50
+
+# Importer for each story file extension
+IMPORTERS: dict[str, type[Import]] = {"twee": ImportTwine, "html": ImportTwineHtml}
+
+
+def importer_for(filename: str) -> type[Import]:
+    """
+    Pick the importer for a story file by its extension, Twee unless it is .html
+
+    Returns:
+        type[Import]
+    """
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return IMPORTERS.get(extension, ImportTwine)
+
+
+@dataclass
+class ImportJob:
+    id: UUID
+    filename: str
+    status: str = "queued"
+    passages_parsed: int = 0
+    rows_inserted: int = 0
+    season_id: UUID | None = None
+    # The file matched a season that was already imported, nothing was parsed or inserted
+    duplicate: bool = False
+    # Updating season_id in place rather than importing a new season, see update_story
+    update: bool = False
+    # Summary of the changes, see import_twine.StoryChanges
+    changes: str | None = None
+    # Summary of the story analysis, see story_analysis.StoryAnalysis
+    analysis: str | None = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    @classmethod
+    def from_record(cls, record: ImportJobRecord) -> ImportJob:
+        return cls(
+            id=record.id,
+            filename=record.filename,
+            status=record.status,
+            passages_parsed=record.passages_parsed,
+            rows_inserted=record.rows_inserted,
+            season_id=record.season_id,
+            duplicate=record.duplicate,
+            update=record.update,
+            changes=record.changes,
+            analysis=record.analysis,
+            error=record.error,
+            created_at=_timestamp(record.created_at),
+            started_at=(
+                _timestamp(record.started_at) if record.started_at is not None else None
+            ),
+            finished_at=(
+                _timestamp(record.finished_at)
+                if record.finished_at is not None
+                else None
+            ),
+        )
+
+    def to_record(self) -> ImportJobRecord:
+        return ImportJobRecord(
+            id=self.id,
+            filename=self.filename,
+            status=self.status,
+            passages_parsed=self.passages_parsed,
+            rows_inserted=self.rows_inserted,
+            season_id=self.season_id,
+            duplicate=self.duplicate,
+            update=self.update,
+            changes=self.changes,
+            analysis=self.analysis,
+            error=self.error,
+            created_at=_datetime(self.created_at),
+            started_at=_datetime(self.started_at),
+            finished_at=_datetime(self.finished_at),
+        )
+
+
+def _datetime(timestamp: float | None) -> datetime.datetime | None:
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+
+
+def _timestamp(value: datetime.datetime) -> float:
+    # SQLite hands timestamps back without a timezone, they are stored in UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+def parse_story_data(
+    data: bytes, filename: str
+) -> tuple[str, HarloweMetadata | None, list[TwinePassage]]:
+    """
+    Parse a story held in memory, e.g. an upload, meant to run in a worker process
+
+    Returns:
+        tuple[str, HarloweMetadata | None, list[TwinePassage]]: Story title, metadata and passages
+    """
+    twine = importer_for(filename)(filename, filename)
+    stream = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig")
+    passages = list(twine.iter_passages(stream))
+    return (twine.story_title, twine.metadata, passages)
+
+
+def parse_story_path(
+    filepath: str, filename: str
+) -> tuple[str, HarloweMetadata | None, list[TwinePassage]]:
+    """
+    Parse a story file, meant to run in a worker process
+
+    Returns:
+        tuple[str, HarloweMetadata | None, list[TwinePassage]]: Story title, metadata and passages
+    """
+    # Already running in a pool worker, so big Twee files aren't split across another pool
+    twine = importer_for(filename)(filepath, filename)
+    passages = list(twine.iter_passages())
+    return (twine.story_title, twine.metadata, passages)
+
+
+def splits_across_pool(filepath: str, filename: str) -> bool:
+    """
+    Whether a story file is big enough to be parsed in parallel byte ranges rather than on
+    one worker, see ImportTwine.parse_twee_file
+
+    Returns:
+        bool
+    """
+    return (
+        importer_for(filename) is ImportTwine
+        and os.path.getsize(filepath) >= PARALLEL_PARSE_MIN_BYTES
+    )
+
+
+def parse_story_split(
+    filepath: str, filename: str, executor: Executor
+) -> tuple[str, HarloweMetadata | None, list[TwinePassage]]:
+    """
+    Parse a big Twee file with its byte ranges spread over a pool's workers, meant to run
+    on a thread of the caller's, not in the pool
+
+    Returns:
+        tuple[str, HarloweMetadata | None, list[TwinePassage]]: Story title, metadata and passages
+    """
+    twine = ImportTwine(filepath, filename)
+    passages = twine.parse_twee_file(parallel=None, executor=executor)
+    return (twine.story_title, twine.metadata, passages)
+
+
+class ImportJobManager:
+    """
+    Queues and runs import jobs for one app
+
+    Attributes:
+        max_concurrent (int): How many imports may run at once
+        parse_processes (int): Size of the parsing process pool, 0 parses on the job thread
+    """
+
+    max_concurrent: int
+    parse_processes: int
+
+    def __init__(self, app: Flask, max_concurrent: int, parse_processes: int):
+        self.app = app
+        self.max_concurrent = max_concurrent
+        self.parse_processes = parse_processes
+        # The jobs this worker runs, the others are only in the database
+        self._jobs: OrderedDict[UUID, ImportJob] = OrderedDict()
+        self._futures: dict[UUID, Future] = {}
+        self._lock = threading.Lock()
+        self._started = False
+        self._shut_down = False
+        # Both pools start their workers lazily, on the first submitted job
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent, thread_name_prefix="import"
+        )
+        self._parse_pool: ProcessPoolExecutor | None = None
+
+    def submit(
+        self,
+        filepath: str,
+        filename: str,
+        content_hash: str | None = None,
+        season_id: UUID | None = None,
+        remove: bool = False,
+    ) -> ImportJob:
+        """
+        Queue a Twee file for import
+
+        Args:
+            filepath (str): Path to the Twee file to import
+            filename (str): Original filename of the Twee file
+            content_hash (str | None): Hash of the file if the caller already has it
+            season_id (UUID | None): Update this season in place instead of importing a new one
+            remove (bool): Delete the file once the job is done, e.g. a spooled upload
+
+        Returns:
+            ImportJob: A snapshot of the queued job
+        """
+        return self.__submit(filepath, filename, content_hash, season_id, remove)
+
+    def submit_data(
+        self,
+        data: bytes,
+        filename: str,
+        content_hash: str | None = None,
+        season_id: UUID | None = None,
+    ) -> ImportJob:
+        """
+        Queue Twee source held in memory for import, e.g. an upload that was never saved
+
+        Args:
+            data (bytes): The Twee source
+            filename (str): Original filename of the Twee file
+            content_hash (str | None): Hash of the source if the caller already has it
+            season_id (UUID | None): Update this season in place instead of importing a new one
+
+        Returns:
+            ImportJob: A snapshot of the queued job
+        """
+        return self.__submit(data, filename, content_hash, season_id)
+
+    def __submit(
+        self,
+        source: str | bytes,
+        filename: str,
+        content_hash: str | None,
+        season_id: UUID | None,
+        remove: bool = False,
+    ) -> ImportJob:
+        job = ImportJob(
+            id=uuid4(),
+            filename=filename,
+            season_id=season_id,
+            update=season_id is not None,
+        )
+        self._record(job)
+        with self._lock:
+            if not self._started:
+                # Shut down with the worker, see shutdown. Not with atexit, whose handlers
+                # only run once the executor's own exit hook has joined its threads, and
+                # they run every queued job before they stop
+                threading._register_atexit(  # type: ignore[attr-defined]
+                    self._shutdown_at_exit, os.getpid()
+                )
+                self._started = True
+            self._jobs[job.id] = job
+            self._prune()
+            self._futures[job.id] = self._executor.submit(
+                self._run, job, source, content_hash, remove
+            )
+            return replace(job)
+
+    def get(self, job_id: UUID) -> ImportJob | None:
+        """
+        Get a snapshot of a job, accepted by any worker
+
+        Returns:
+            ImportJob | None: The job, or None if it is unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return replace(job)
+        with self.app.extensions["Session"]() as db_session:
+            record = db_session.get(ImportJobRecord, job_id)
+            return ImportJob.from_record(record) if record is not None else None
+
+    def list(self) -> list[ImportJob]:
+        """
+        Get snapshots of the latest jobs of every worker, newest first
+
+        Returns:
+            list[ImportJob]
+        """
+        with self.app.extensions["Session"]() as db_session:
+            records = db_session.scalars(
+                select(ImportJobRecord)
+                .order_by(ImportJobRecord.created_at.desc())
+                .limit(MAX_FINISHED_JOBS)
+            ).all()
+            jobs = [ImportJob.from_record(record) for record in records]
+        with self._lock:
+            # The jobs this worker runs have their live progress
+            return [
+                replace(self._jobs[job.id]) if job.id in self._jobs else job
+                for job in jobs
+            ]
+
+    def wait(self, job_id: UUID, timeout: float | None = None) -> ImportJob | None:
+        """
+        Block until a job has finished
+
+        Returns:
+            ImportJob | None: The finished job, or None if it is unknown to this worker
+        """
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
+        return self.get(job_id)
+
+    def shutdown(self) -> None:
+        """
+        Finish the running imports and fail the queued ones, e.g. when the worker exits
+        """
+        with self._lock:
+            if self._shut_down:
+                return
+            self._shut_down = True
+            cancelled = [
+                self._jobs[job_id]
+                for job_id, future in self._futures.items()
+                if future.cancel()
+            ]
+        self._executor.shutdown(wait=True)
+        if self._parse_pool is not None:
+            self._parse_pool.shutdown(wait=True)
+        # Once the running imports are done, so this doesn't write alongside them
+        for job in cancelled:
+            self._update(
+                job,
+                status="failed",
+                error="The worker shut down before the import started",
+                finished_at=time.time(),
+            )
+
+    def _shutdown_at_exit(self, pid: int) -> None:
+        # Forked parse processes inherit the exit hook, and maybe the lock held by another
+        # thread, but they have no imports to shut down
+        if os.getpid() == pid:
+            self.shutdown()
+
+    def _run(
+        self,
+        job: ImportJob,
+        source: str | bytes,
+        content_hash: str | None,
+        remove: bool = False,
+    ) -> None:
+        self._update(job, status="parsing", started_at=time.time())
+        try:
+            with self.app.app_context():
+                if content_hash is None:
+                    content_hash = (
+                        hash_story_file(source)
+                        if isinstance(source, str)
+                        else import_twine.content_hash(io.BytesIO(source))
+                    )
+                # The same file may have been queued twice before either import finished
+                existing = SeasonStore.get_season_by_content_hash(content_hash)
+                if existing is not None:
+                    self._update(
+                        job,
+                        status="done",
+                        season_id=existing.id,
+                        duplicate=True,
+                        finished_at=time.time(),
+                    )
+                    return
+                twine = importer_for(job.filename)(
+                    source if isinstance(source, str) else job.filename, job.filename
+                )
+                twine.content_hash = content_hash
+                (
+                    twine.story_title,
+                    twine.metadata,
+                    twine.passages,
+                ) = self._parse(source, job.filename)
+                self._update(
+                    job,
+                    status="updating" if job.update else "inserting",
+                    passages_parsed=len(twine.passages),
+                )
+
+                def on_progress(rows: int) -> None:
+                    # Only in memory, this runs inside the import's transaction
+                    with self._lock:
+                        job.rows_inserted = rows
+
+                if job.season_id is not None:
+                    changes = twine.update_story(job.season_id, on_progress=on_progress)
+                    self._update(job, changes=str(changes))
+                else:
+                    twine.insert_story(on_progress=on_progress)
+        except Exception as e:
+            logger.exception("Import of %s failed", job.filename)
+            self._update(job, status="failed", error=str(e), finished_at=time.time())
+            return
+        finally:
+            if remove and isinstance(source, str):
+                os.remove(source)
+        self._update(
+            job,
+            status="done",
+            season_id=twine.season_id,
+            analysis=str(twine.analysis),
+            finished_at=time.time(),
+        )
+
+    def _parse(
+        self, source: str | bytes, filename: str
+    ) -> tuple[str, HarloweMetadata | None, list[TwinePassage]]:
+        parse = parse_story_path if isinstance(source, str) else parse_story_data
+        if self.parse_processes <= 0:
+            return parse(source, filename)  # type: ignore[arg-type]
+        with self._lock:
+            if self._parse_pool is None:
+                self._parse_pool = ProcessPoolExecutor(max_workers=self.parse_processes)
+            parse_pool = self._parse_pool
+        if (
+            isinstance(source, str)
+            and self.parse_processes > 1
+            and splits_across_pool(source, filename)
+        ):
+            # Split big files across the pool rather than parsing them on one worker
+            return parse_story_split(source, filename, parse_pool)
+        return parse_pool.submit(parse, source, filename).result()
+
+    def _update(self, job: ImportJob, **changes) -> None:
+        with self._lock:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            snapshot = replace(job)
+        self._record(snapshot)
+
+    def _record(self, job: ImportJob) -> None:
+        with self.app.extensions["Session"]() as db_session:
+            db_session.merge(job.to_record())
+            if job.finished:
+                # Keep the latest MAX_FINISHED_JOBS finished jobs of every worker
+                oldest = db_session.scalar(
+                    select(ImportJobRecord.created_at)
+                    .where(ImportJobRecord.status.in_(("done", "failed")))
+                    .order_by(ImportJobRecord.created_at.desc())
+                    .offset(MAX_FINISHED_JOBS - 1)
+                    .limit(1)
+                )
+                if oldest is not None:
+                    db_session.execute(
+                        delete(ImportJobRecord).where(
+                            ImportJobRecord.status.in_(("done", "failed")),
+                            ImportJobRecord.created_at < oldest,
+                        )
+                    )
+            db_session.commit()
+
+    def _prune(self) -> None:
+        finished = [job.id for job in self._jobs.values() if job.finished]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+            self._futures.pop(job_id, None)
+
+
+def get_import_jobs() -> ImportJobManager:
+    return current_app.extensions["import_jobs"]
@@ -1,14 +1,28 @@
+import hashlib
+import io
 import json
+import os
 import re
-from dataclasses import dataclass
+import sys
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
-from typing import List, TypedDict
-from uuid import UUID, uuid4
+from itertools import repeat
+from typing import IO, Callable, Iterable, Iterator, List, TypedDict
+from uuid import UUID, uuid4, uuid5
 
 from flask import current_app
-from sqlalchemy import insert, update
+from sqlalchemy import bindparam, delete, insert, select, update
+from sqlalchemy.orm import Session
 
-from ..models import Decision, DecisionDestination, Location, Season
+from ..models import Decision, DecisionDestination, Location, Season, UserLocation
+from ..seasons import partitions
+from ..seasons.season_counts import adjust_counts
+from ..seasons.seasons import SeasonStore
+from .bulk_load import BulkLoader
+from .season_graph import get_season_graphs
+from .story_analysis import StoryAnalysis, analyze_story
 
 
 # Metadata structure for Harlowe format
@@ -20,226 +34,960 @@ class HarloweMetadata(TypedDict):
     zoom: int
 
 
+# A passage header line, e.g. `:: Passage name {"position":"900,400"}`
+PASSAGE_HEADER_PATTERN = re.compile(r"::\s*(.+?)\s*(?:\{.*\})?\s*$")
+# Links within a passage, e.g. `[[Label]]` or `[[Label->Target passage]]`
+LINK_PATTERN = re.compile(r"\[\[(.*?)(?:->(.*?))?\]\]")
+
+# Files at least this big are parsed in parallel by parse_twee_file
+PARALLEL_PARSE_MIN_BYTES = 8 * 1024 * 1024
+# Smallest byte range handed to a parsing worker
+PARALLEL_CHUNK_MIN_BYTES = 1024 * 1024
+
+# Bytes hashed per read by content_hash
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
 # The link from one passage to another
 # Label is the text displayed to the user. It can be the same as the target passage name.
-@dataclass
+# Slotted, as a large story holds hundreds of thousands of these
+@dataclass(slots=True)
 class TwineLink:
     label: str
     target: str
 
 
 # A passage in the Twine story, containing one or more links to other passages
-@dataclass
+@dataclass(slots=True)
 class TwinePassage:
     name: str
     content: str
     links: List[TwineLink]
 
 
-class Import:
-    filepath: str
-    filename: str
+@dataclass
+class StoryChanges:
+    """
+    What update_story wrote to a season
+    """
 
-    def __init__(self, filepath: str, filename: str):
-        self.filepath = filepath
-        self.filename = filename
+    locations_added: int = 0
+    locations_changed: int = 0
+    locations_removed: int = 0
+    # Locations whose destinations were rewritten
+    decisions_changed: int = 0
+    # Players whose location was removed, moved to the start of the story
+    players_moved: int = 0
+    rows_written: int = 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.locations_added} locations added, {self.locations_changed} changed, "
+            f"{self.locations_removed} removed, {self.decisions_changed} decisions "
+            f"relinked, {self.players_moved} players moved to the start"
+        )
 
 
-class ImportTwine(Import):
+class Import(ABC):
     """
-    Handles importing and parsing of Twine story files in Twee format.
-
-    This class reads a Twee file, extracts the story title, metadata, and passages,
-    and creates the necessary database records to represent the story structure.
+    Base class for story imports. Subclasses parse a story format into passages, which
+    insert_story writes to the database as a new season.
 
     Attributes:
-        story_title (str): The title of the Twine story
+        story_title (str): The title of the story
         metadata (HarloweMetadata | None): Story metadata in Harlowe format
         passages (list[TwinePassage]): List of passages making up the story
         season_id (UUID): Unique identifier for this imported story/season
+        content_hash (str | None): Hash of the story file, see content_hash. Stored on the season
+        analysis (StoryAnalysis | None): Distances of the passages, set by insert_story and
+            update_story before they write anything
     """
 
+    filepath: str
+    filename: str
     story_title: str
     metadata: HarloweMetadata | None
     passages: list[TwinePassage] = []
     season_id: UUID
+    content_hash: str | None
+    analysis: StoryAnalysis | None
 
     def __init__(self, filepath: str, filename: str):
-        """
-        Initialize a new Twine story import.
-
-        Args:
-            filepath (str): Path to the Twee file to import
-            filename (str): Original filename of the Twee file
-        """
-        super().__init__(filepath, filename)
+        self.filepath = filepath
+        self.filename = filename
         self.story_title: str = ""
         self.metadata = None
         self.passages: List[TwinePassage] = []
         self.season_id: UUID = uuid4()
+        self.content_hash = None
+        self.analysis = None
 
-    def parse_twee_file(self) -> list[TwinePassage]:
+    @abstractmethod
+    def iter_passages(
+        self, stream: Iterable[str] | None = None
+    ) -> Iterator[TwinePassage]:
         """
-        Parses a Twee file and extracts passage content and connections.
-
-        This method reads the Twee file and parses out:
-        - Story title
-        - Story metadata (must be Harlowe format)
-        - Individual passages and their links to other passages
+        Lazily parse the story, yielding each passage once it is complete. The story title
+        and metadata are stored on the instance as they are encountered.
 
         Args:
-            file_path: Path to the Twee file.
+            stream: The story source. Defaults to reading self.filepath
+        """
 
-        Returns:
-            A dictionary where keys are passage names and values are tuples containing
-            the passage content and a list of links to other passages.
+    def insert_story(self, on_progress: Callable[[int], None] | None = None) -> None:
+        """
+        Inserts the story into the database.
+        Creates a season, locations, decisions, and decision destinations.
+
+        The content tables are written with BulkLoader (COPY on Postgres) in dependency
+        order, in a single transaction. Row ids are derived from the season id and passage
+        names, see location_id, so update_story can match them up later. The season is
+        staged until it is published, see SeasonStore.publish_season. The story is
+        analyzed first (see story_analysis) and every location stores its distances.
+
+        Args:
+            on_progress: Called with the number of content rows written so far
 
         Raises:
-            json.JSONDecodeError: If story metadata is invalid JSON
-            TypeError: If story metadata doesn't match expected format
-            ValueError: If story format is not Harlowe
+            ValueError: If the start passage or the target of a link doesn't exist
         """
+        if self.metadata is None:
+            raise ValueError("Must parse the story before insert_story")
+        analysis = self.analysis = analyze_story(self.passages, self.metadata["start"])
 
-        with open(self.filepath, "r", encoding="utf-8") as file:
-            twee_content = file.read()
+        self.season_id = uuid4()
+        season_id = self.season_id
+        passages = self.passages
 
-        # Regular expression to match a passage
-        passage_pattern = r"\s*(.+?)\s*(?:\{\s*.*?\s*\})?\n(.*?)(?=\n::|$)"
-        matches = twee_content.split("::")
+        # First create a dict of passage name to uuid, the only state kept for the whole story
+        passage_uuids: dict[str, UUID] = {}
 
-        for match in matches:
-            match = match.strip()
-            lines = match.split("\n")
-            first = lines[0]
+        # we know the content start location will be the genesis_location_id
+        genesis_location_id = location_id(season_id, self.metadata["start"])
+        passage_uuids[self.metadata["start"]] = genesis_location_id
 
-            # first line might be empty
-            if len(first) == 0:
-                continue
-            # store the story title
-            elif first == "StoryTitle":
-                self.story_title = lines[1]
-                continue
-            # store the story metadata
-            elif first == "StoryData":
-                try:
-                    self.metadata = json.loads(
-                        "".join(lines[1:]), object_hook=lambda d: HarloweMetadata(**d)
+        for passage in passages:
+            if passage.name not in passage_uuids:
+                passage_uuids[passage.name] = location_id(season_id, passage.name)
+
+        # Rows are produced lazily as the loader consumes them, so only a batch of rows
+        # exists at any time rather than every row of the story
+        decision_ids = [
+            decision_id(passage_uuids[passage.name]) for passage in passages
+        ]
+
+        # With partitioned tables the season's partitions are added first, and dropped again
+        # if the import fails
+        engine = current_app.extensions["engine"]
+        partitioned = partitions.create_season_partitions(engine, season_id)
+
+        # now insert the data into the database
+        # we need to insert the locations first, then the decisions, then the decision destinations
+        Session = current_app.extensions["Session"]
+        try:
+            with Session.begin() as db_session:
+                db_session.execute(
+                    insert(Season).values(
+                        id=self.season_id,
+                        name=self.story_title,
+                        # don't set genesis_location_id here, due to the fk constraint we need to set it after the locations are inserted
+                        default=False,
+                        date_created=datetime.now(timezone.utc),
+                        origin_file=self.filename,
+                        content_hash=self.content_hash,
                     )
-                except json.JSONDecodeError as e:
-                    # TODO: log this error
-                    print(f"Error decoding JSON for StoryData: {e}")
-                    raise json.JSONDecodeError(
-                        "Error decoding JSON for StoryData", e.doc, e.pos
+                )
+                loader = BulkLoader(db_session, on_progress=on_progress)
+                location_count = loader.load(
+                    Location.__table__,
+                    LOCATION_COLUMNS,
+                    _location_rows(season_id, passages, passage_uuids, analysis),
+                )
+                decision_count = loader.load(
+                    Decision.__table__,
+                    DECISION_COLUMNS,
+                    (
+                        (decision, passage_uuids[passage.name], season_id)
+                        for passage, decision in zip(passages, decision_ids)
+                    ),
+                )
+                destination_count = loader.load(
+                    DecisionDestination.__table__,
+                    DESTINATION_COLUMNS,
+                    _story_destination_rows(
+                        season_id, passages, passage_uuids, decision_ids
+                    ),
+                )
+                db_session.execute(
+                    update(Season)
+                    .where(Season.id == self.season_id)
+                    .values(
+                        genesis_location_id=genesis_location_id,
+                        location_count=location_count,
+                        decision_count=decision_count,
+                        destination_count=destination_count,
                     )
-                except TypeError as e:
-                    # TODO: log this error
-                    print(f"Error decoding JSON for StoryData: {e}")
-                    raise TypeError("Error decoding JSON for StoryData") from e
-                assert self.metadata is not None
+                )
+        except BaseException:
+            if partitioned:
+                partitions.drop_season_partitions(engine, season_id)
+            raise
+        # Drop any graph compiled from a previous import of this season
+        get_season_graphs().invalidate(self.season_id)
+        SeasonStore.invalidate_current_season()
+
+    def update_story(
+        self, season_id: UUID, on_progress: Callable[[int], None] | None = None
+    ) -> StoryChanges:
+        """
+        Updates an existing season in place to match the story, e.g. after it was edited.
 
-                if self.metadata["format"] != "Harlowe":
-                    raise ValueError("Only Harlowe format is supported")
+        Passages are matched to the season's locations by name. Only locations that were
+        added, changed or removed, and the destinations of passages whose links changed, are
+        written, in a single transaction. Location ids are kept, so players carry on where
+        they were. Players at a removed location are moved to the start of the story. The
+        story is analyzed first, and locations whose distances changed are updated. Every
+        statement is limited to the season, so with partitioned tables (see
+        app.seasons.partitions) only the season's partitions are read.
 
-                continue
+        Args:
+            season_id (UUID): The season to update
+            on_progress: Called with the number of content rows written so far
+
+        Returns:
+            StoryChanges: What was written
+
+        Raises:
+            ValueError: If the season doesn't exist or was imported before locations had
+            passage names, or the start passage or the target of a link doesn't exist
+        """
+        if self.metadata is None:
+            raise ValueError("Must parse the story before update_story")
+        analysis = self.analysis = analyze_story(self.passages, self.metadata["start"])
+        self.season_id = season_id
+        changes = StoryChanges()
+
+        def progress(count: int) -> None:
+            changes.rows_written += count
+            if on_progress is not None:
+                on_progress(changes.rows_written)
+
+        # Positions still buffered must be written before players are moved off removed
+        # locations, or they would be flushed to locations that no longer exist
+        position_buffer = current_app.extensions.get("position_buffer")
+        if position_buffer is not None:
+            position_buffer.flush()
+
+        Session = current_app.extensions["Session"]
+        with Session.begin() as db_session:
+            # Locks the season on Postgres, so two updates of it can't interleave
+            season = db_session.get(Season, season_id, with_for_update=True)
+            if season is None:
+                raise ValueError(f"Season {season_id} not found")
+
+            stored = _StoredSeason.read(db_session, season)
+            diff = self.__diff(stored, analysis)
+
+            # Locations first, they are the targets of every other change
+            loader = BulkLoader(db_session, on_progress=progress)
+            _write_locations(db_session, loader, season_id, diff, progress)
+            decisions, destinations = _rewrite_decisions(
+                db_session, loader, season_id, stored, diff
+            )
+
+            db_session.execute(
+                update(Season)
+                .where(Season.id == season_id)
+                .values(
+                    name=self.story_title,
+                    origin_file=self.filename,
+                    content_hash=self.content_hash,
+                    genesis_location_id=diff.genesis_location_id,
+                    # Other workers' graphs of the season are stale from here on
+                    content_version=Season.content_version + 1,
+                )
+            )
+            adjust_counts(
+                db_session,
+                season_id,
+                locations=len(diff.added) - len(diff.removed),
+                decisions=decisions,
+                destinations=destinations,
+            )
+            changes.players_moved = _remove_locations(
+                db_session, season_id, diff.removed, diff.genesis_location_id
+            )
+
+            changes.locations_added = len(diff.added)
+            changes.locations_changed = len(diff.changed)
+            changes.locations_removed = len(diff.removed)
+            changes.decisions_changed = len(diff.relinked)
+
+        get_season_graphs().invalidate(season_id)
+        SeasonStore.invalidate_current_season()
+        return changes
+
+    def __diff(self, stored: "_StoredSeason", analysis: StoryAnalysis) -> "_SeasonDiff":
+        # Compare the parsed story to the stored season, see update_story
+        assert self.metadata is not None
+        season_id = self.season_id
+        ids = {
+            passage.name: (
+                stored.locations[passage.name][0]
+                if passage.name in stored.locations
+                else location_id(season_id, passage.name)
+            )
+            for passage in self.passages
+        }
+        diff = _SeasonDiff(
+            genesis_location_id=ids.get(self.metadata["start"])
+            or location_id(season_id, self.metadata["start"]),
+            removed=[
+                id for name, (id, _, _) in stored.locations.items() if name not in ids
+            ],
+        )
+        for position, passage in enumerate(self.passages):
+            id = ids[passage.name]
+            distances = analysis.distances(position)
+            location = stored.locations.get(passage.name)
+            if location is None:
+                diff.added.append(
+                    (id, passage.name, passage.content, season_id, *distances)
+                )
             else:
-                # now let's parse the passages
-                inner_matches = re.findall(passage_pattern, match, re.DOTALL)
-
-                for match in inner_matches:
-                    passage_name = match[0].strip()
-                    passage_content = match[1].split("\n")[0].strip()
-                    passage = TwinePassage(
-                        name=passage_name, content=passage_content, links=[]
+                if location[1] != passage.content:
+                    diff.changed.append(
+                        {"location_id": id, "description": passage.content}
                     )
+                if location[2] != distances:
+                    diff.remeasured.append(
+                        {
+                            "location_id": id,
+                            "start_distance": distances[0],
+                            "ending_distance": distances[1],
+                        }
+                    )
+            links = [(ids[link.target], link.label) for link in passage.links]
+            if links != stored.links.get(id, []) or id not in stored.decisions:
+                diff.relinked[id] = links
+        return diff
+
+
+LOCATION_COLUMNS = [
+    "id",
+    "name",
+    "description",
+    "season_id",
+    "start_distance",
+    "ending_distance",
+]
+DECISION_COLUMNS = ["id", "source_location_id", "season_id"]
+DESTINATION_COLUMNS = [
+    "id",
+    "decision_id",
+    "destination_location_id",
+    "description",
+    "position",
+    "season_id",
+]
+
+# Ids per IN (...) list when updating a season
+UPDATE_BATCH_SIZE = 500
+
+
+def location_id(season_id: UUID, name: str) -> UUID:
+    """
+    Id of the location for a passage, the same every time a season is imported
 
-                    # Regular expression to match links within a passage
-                    link_pattern = r"\[\[(.*?)(?:->(.*?))?\]\]"
-                    links = re.findall(link_pattern, match[1].strip())
+    Returns:
+        UUID: A name based UUID in the season's namespace
+    """
+    return uuid5(season_id, name)
+
+
+def decision_id(source_location_id: UUID) -> UUID:
+    # Every imported passage has exactly one decision
+    return uuid5(source_location_id, "decision")
+
+
+def _destination_rows(
+    season_id: UUID, decision: UUID, links: list[tuple[UUID, str]]
+) -> Iterator[tuple[UUID, UUID, UUID, str, int, UUID]]:
+    # Nothing refers to destination ids, update_story rewrites a decision's destinations
+    for position, (destination_location_id, label) in enumerate(links):
+        yield (
+            uuid4(),
+            decision,
+            destination_location_id,
+            label,
+            position,
+            season_id,
+        )
 
-                    for link in links:
-                        label = link[0]
-                        destination = link[1] if link[1] else link[0]
-                        passage.links.append(TwineLink(label, destination))
 
-                    self.passages.append(passage)
+def _batches(ids: list[UUID]) -> Iterator[list[UUID]]:
+    for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+        yield ids[start : start + UPDATE_BATCH_SIZE]
+
+
+def _location_rows(
+    season_id: UUID,
+    passages: list[TwinePassage],
+    passage_uuids: dict[str, UUID],
+    analysis: StoryAnalysis,
+) -> Iterator[tuple[UUID, str, str, UUID, int | None, int | None]]:
+    for position, passage in enumerate(passages):
+        yield (
+            passage_uuids[passage.name],
+            passage.name,
+            passage.content,
+            season_id,
+            *analysis.distances(position),
+        )
 
-        return self.passages
 
-    def insert_story(self) -> None:
+def _story_destination_rows(
+    season_id: UUID,
+    passages: list[TwinePassage],
+    passage_uuids: dict[str, UUID],
+    decision_ids: list[UUID],
+) -> Iterator[tuple[UUID, UUID, UUID, str, int, UUID]]:
+    for passage, decision in zip(passages, decision_ids):
+        yield from _destination_rows(
+            season_id,
+            decision,
+            [(passage_uuids[link.target], link.label) for link in passage.links],
+        )
+
+
+@dataclass
+class _StoredSeason:
+    """
+    A season's content as update_story compares it to the story
+
+    Attributes:
+        locations: Passage name to location id, description and distances
+        decisions: Location id to the ids of its decisions
+        links: Location id to its destinations and their labels, in order
+    """
+
+    locations: dict[str, tuple[UUID, str, tuple[int | None, int | None]]]
+    decisions: dict[UUID, list[UUID]]
+    links: dict[UUID, list[tuple[UUID, str]]]
+
+    @classmethod
+    def read(cls, db_session: Session, season: Season) -> "_StoredSeason":
+        stored = cls({}, {}, {})
+        for row in db_session.execute(
+            select(
+                Location.id,
+                Location.name,
+                Location.description,
+                Location.start_distance,
+                Location.ending_distance,
+            ).where(Location.season_id == season.id)
+        ):
+            if row.name is None:
+                raise ValueError(
+                    f"Season {season.name} was imported before passage names were "
+                    "stored, import the story as a new season instead"
+                )
+            stored.locations[row.name] = (
+                row.id,
+                row.description,
+                (row.start_distance, row.ending_distance),
+            )
+
+        # Destinations of every stored location, in the same form as the new ones
+        for row in db_session.execute(
+            select(Decision.id, Decision.source_location_id)
+            .join(Location, Decision.source_location_id == Location.id)
+            .where(Location.season_id == season.id, Decision.season_id == season.id)
+        ):
+            stored.decisions.setdefault(row.source_location_id, []).append(row.id)
+        for row in db_session.execute(
+            select(
+                Decision.source_location_id,
+                DecisionDestination.destination_location_id,
+                DecisionDestination.description,
+            )
+            .select_from(DecisionDestination)
+            .join(Decision)
+            .join(Location, Decision.source_location_id == Location.id)
+            .where(
+                Location.season_id == season.id,
+                Decision.season_id == season.id,
+                DecisionDestination.season_id == season.id,
+            )
+            .order_by(Decision.id, DecisionDestination.position)
+        ):
+            stored.links.setdefault(row.source_location_id, []).append(
+                (row.destination_location_id, row.description)
+            )
+        return stored
+
+
+@dataclass
+class _SeasonDiff:
+    """
+    What update_story writes to bring a season in line with the story
+    """
+
+    genesis_location_id: UUID
+    removed: list[UUID]
+    added: list[tuple[UUID, str, str, UUID, int | None, int | None]] = field(
+        default_factory=list
+    )
+    changed: list[dict[str, object]] = field(default_factory=list)
+    remeasured: list[dict[str, object]] = field(default_factory=list)
+    # Source location id to its new links, for every passage whose links changed
+    relinked: dict[UUID, list[tuple[UUID, str]]] = field(default_factory=dict)
+
+
+def _write_locations(
+    db_session: Session,
+    loader: BulkLoader,
+    season_id: UUID,
+    diff: _SeasonDiff,
+    progress: Callable[[int], None],
+) -> None:
+    # Adds, edits and remeasures locations, removed ones go last, see _remove_locations
+    loader.load(Location.__table__, LOCATION_COLUMNS, diff.added)
+    locations = Location.__table__
+    if diff.changed:
+        db_session.execute(
+            update(locations)
+            .where(
+                locations.c.season_id == season_id,
+                locations.c.id == bindparam("location_id"),
+            )
+            .values(description=bindparam("description")),
+            diff.changed,
+        )
+        progress(len(diff.changed))
+    if diff.remeasured:
+        db_session.execute(
+            update(locations)
+            .where(
+                locations.c.season_id == season_id,
+                locations.c.id == bindparam("location_id"),
+            )
+            .values(
+                start_distance=bindparam("start_distance"),
+                ending_distance=bindparam("ending_distance"),
+            ),
+            diff.remeasured,
+        )
+        progress(len(diff.remeasured))
+
+
+def _rewrite_decisions(
+    db_session: Session,
+    loader: BulkLoader,
+    season_id: UUID,
+    stored: _StoredSeason,
+    diff: _SeasonDiff,
+) -> tuple[int, int]:
+    """
+    Rewrite the destinations of relinked and removed locations from scratch
+
+    Returns:
+        tuple[int, int]: How many decisions and destinations the season gained, negative if
+        it lost some
+    """
+    decisions_removed = destinations_removed = 0
+    stale_decisions = [
+        decision
+        for source_id in [*diff.relinked, *diff.removed]
+        for decision in stored.decisions.get(source_id, [])
+    ]
+    for batch in _batches(stale_decisions):
+        destinations_removed += db_session.execute(
+            delete(DecisionDestination).where(
+                DecisionDestination.season_id == season_id,
+                DecisionDestination.decision_id.in_(batch),
+            )
+        ).rowcount
+    for batch in _batches(
+        [decision for id in diff.removed for decision in stored.decisions.get(id, [])]
+    ):
+        decisions_removed += db_session.execute(
+            delete(Decision).where(
+                Decision.season_id == season_id, Decision.id.in_(batch)
+            )
+        ).rowcount
+    decisions_added = loader.load(
+        Decision.__table__,
+        DECISION_COLUMNS,
+        (
+            (decision_id(source_id), source_id, season_id)
+            for source_id in diff.relinked
+            if source_id not in stored.decisions
+        ),
+    )
+    destinations_added = loader.load(
+        DecisionDestination.__table__,
+        DESTINATION_COLUMNS,
+        (
+            row
+            for source_id, links in diff.relinked.items()
+            for row in _destination_rows(
+                season_id,
+                stored.decisions.get(source_id, [decision_id(source_id)])[0],
+                links,
+            )
+        ),
+    )
+    return (
+        decisions_added - decisions_removed,
+        destinations_added - destinations_removed,
+    )
+
+
+def _remove_locations(
+    db_session: Session,
+    season_id: UUID,
+    removed: list[UUID],
+    genesis_location_id: UUID,
+) -> int:
+    """
+    Delete removed locations, moving their players to the start of the story first
+
+    Returns:
+        int: How many players were moved
+    """
+    players_moved = 0
+    for batch in _batches(removed):
+        players_moved += db_session.execute(
+            update(UserLocation)
+            .where(
+                UserLocation.season_id == season_id,
+                UserLocation.location_id.in_(batch),
+            )
+            .values(location_id=genesis_location_id),
+            execution_options={"synchronize_session": False},
+        ).rowcount
+        db_session.execute(
+            delete(Location).where(
+                Location.season_id == season_id, Location.id.in_(batch)
+            )
+        )
+    return players_moved
+
+
+def content_hash(stream: IO[bytes]) -> str:
+    """
+    Hash story content so identical stories can be recognized before they are parsed
+
+    The content is normalized first, so a file saved with a BOM, Windows line endings,
+    trailing whitespace or trailing blank lines hashes the same as the original. None of
+    those change how the story is parsed.
+
+    Args:
+        stream (IO[bytes]): The story file, read to the end
+
+    Returns:
+        str: Hex SHA-256 of the normalized content
+    """
+    digest = hashlib.sha256()
+    first = True
+    remainder = b""
+    # Blank lines are only hashed once a non-blank line follows them
+    blank_lines = 0
+    while chunk := stream.read(HASH_CHUNK_SIZE):
+        if first:
+            chunk = chunk.removeprefix(b"\xef\xbb\xbf")
+            first = False
+        lines = (remainder + chunk).split(b"\n")
+        # The last line may continue in the next chunk
+        remainder = lines.pop()
+        for line in lines:
+            line = line.rstrip()
+            if not line:
+                blank_lines += 1
+                continue
+            digest.update(b"\n" * blank_lines + line + b"\n")
+            blank_lines = 0
+    if remainder := remainder.rstrip():
+        digest.update(b"\n" * blank_lines + remainder + b"\n")
+    return digest.hexdigest()
+
+
+def hash_story_file(filepath: str) -> str:
+    with open(filepath, "rb") as file:
+        return content_hash(file)
+
+
+def find_passage_boundaries(filepath: str, chunks: int) -> list[int]:
+    """
+    Split a Twee file into roughly equal byte ranges that each start at a passage header
+
+    Args:
+        filepath (str): Path to the Twee file
+        chunks (int): How many ranges to aim for. Ranges are never smaller than PARALLEL_CHUNK_MIN_BYTES
+
+    Returns:
+        list[int]: Sorted byte offsets, starting with 0 and ending with the file size
+    """
+    size = os.path.getsize(filepath)
+    chunks = max(1, min(chunks, size // PARALLEL_CHUNK_MIN_BYTES))
+    boundaries = [0]
+    with open(filepath, "rb") as file:
+        for index in range(1, chunks):
+            offset = max(size * index // chunks, boundaries[-1])
+            file.seek(offset)
+            if offset > 0:
+                # Skip the rest of the line we landed in
+                file.seek(offset - 1)
+                if file.read(1) != b"\n":
+                    file.readline()
+            while True:
+                position = file.tell()
+                line = file.readline()
+                if not line:
+                    position = size
+                    break
+                if line.startswith(b"::") and PASSAGE_HEADER_PATTERN.match(
+                    line.decode("utf-8")
+                ):
+                    break
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    if boundaries[-1] != size:
+        boundaries.append(size)
+    return boundaries
+
+
+def parse_links(text: str) -> Iterator[TwineLink]:
+    """
+    Parse the [[links]] in passage text
+
+    Yields:
+        TwineLink: Each link, with its target interned so it shares the passage's name
+    """
+    for label, target in LINK_PATTERN.findall(text):
+        yield TwineLink(label, sys.intern(target if target else label))
+
+
+# A passage as plain tuples, (name, content, ((label, target), ...)), which pickle several
+# times faster than the dataclasses when sent back from a worker process
+PassageTuple = tuple[str, str, tuple[tuple[str, str], ...]]
+
+
+def parse_twee_chunk(
+    filepath: str, start: int, end: int
+) -> tuple[str | None, HarloweMetadata | None, list[PassageTuple]]:
+    """
+    Parse the passages in a byte range of a Twee file, meant to run in a worker process
+
+    Returns:
+        tuple[str | None, HarloweMetadata | None, list[PassageTuple]]: Story title and
+        metadata (None if not in this range) and the passages in the range
+    """
+    with open(filepath, "rb") as file:
+        file.seek(start)
+        # Only the first range can start with a BOM
+        text = file.read(end - start).decode("utf-8-sig")
+
+    twine = ImportTwine(filepath, os.path.basename(filepath))
+    # None tells the caller this range had no StoryTitle passage
+    twine.story_title = None  # type: ignore
+    passages = [
+        (
+            passage.name,
+            passage.content,
+            tuple((link.label, link.target) for link in passage.links),
+        )
+        for passage in twine.iter_passages(io.StringIO(text))
+    ]
+    return (twine.story_title, twine.metadata, passages)
+
+
+class ImportTwine(Import):
+    """
+    Handles importing and parsing of Twine story files in Twee format.
+
+    This class reads a Twee file, extracts the story title, metadata, and passages,
+    and creates the necessary database records to represent the story structure.
+
+    The story title, metadata and passages are stored as described on Import.
+    """
+
+    def __init__(self, filepath: str, filename: str):
         """
-        Inserts the story into the database.
-        Creates a season, locations, decisions, and decision destinations.
+        Initialize a new Twine story import.
+
+        Args:
+            filepath (str): Path to the Twee file to import
+            filename (str): Original filename of the Twee file
         """
-        if self.metadata is None:
-            raise ValueError("Must call parse_twee_file before insert_story")
+        super().__init__(filepath, filename)
 
-        # First create a dict of passage name to uuid
-        passage_uuids: dict[str, UUID] = {}
+    def parse_twee_file(
+        self, parallel: bool | None = None, executor: Executor | None = None
+    ) -> list[TwinePassage]:
+        """
+        Parses a Twee file and extracts passage content and connections.
 
-        # we know the content start location will be the genesis_location_id
-        genesis_location_id: UUID = uuid4()
-        passage_uuids[self.metadata["start"]] = genesis_location_id
+        This method reads the Twee file and parses out:
+        - Story title
+        - Story metadata (must be Harlowe format)
+        - Individual passages and their links to other passages
 
-        locations: list[Location] = []
-        decisions: list[Decision] = []
-        decision_destinations: list[DecisionDestination] = []
-        self.season_id = uuid4()
+        On machines with more than one CPU, files of PARALLEL_PARSE_MIN_BYTES or more are split at passage headers into byte
+        ranges that are parsed in worker processes and merged back in file order. The result
+        is the same as parsing serially with iter_passages.
 
-        season = Season(
-            id=self.season_id,
-            name=self.story_title,
-            # don't set genesis_location_id here, due to the fk constraint we need to set it after the locations are inserted
-            default=False,
-            date_created=datetime.now(timezone.utc),
-            origin_file=self.filename,
-        )
+        Args:
+            parallel: Force parallel (True) or serial (False) parsing. Picked from the file size by default
+            executor: Pool to parse the chunks on. A process pool is created for the call by default
 
-        for passage in self.passages:
-            if passage.name not in passage_uuids:
-                passage_uuids[passage.name] = uuid4()
-
-        for passage in self.passages:
-            locations.append(
-                Location(
-                    id=passage_uuids[passage.name],
-                    description=passage.content,
-                    season_id=self.season_id,
+        Returns:
+            The list of passages, also stored on self.passages
+
+        Raises:
+            json.JSONDecodeError: If story metadata is invalid JSON
+            TypeError: If story metadata doesn't match expected format
+            ValueError: If story format is not Harlowe
+        """
+        if parallel is None:
+            try:
+                parallel = (
+                    os.path.getsize(self.filepath) >= PARALLEL_PARSE_MIN_BYTES
+                    and (os.cpu_count() or 1) > 1
                 )
-            )
-            decision = Decision(
-                id=uuid4(), source_location_id=passage_uuids[passage.name]
-            )
-            decisions.append(decision)
-            for index, link in enumerate(passage.links):
-                decision_destinations.append(
-                    DecisionDestination(
-                        decision_id=decision.id,
-                        destination_location_id=passage_uuids[link.target],
-                        description=link.label,
-                        position=index,
-                    )
+            except OSError:
+                parallel = False
+
+        if not parallel:
+            self.passages = list(self.iter_passages())
+            return self.passages
+
+        boundaries = find_passage_boundaries(self.filepath, (os.cpu_count() or 1) * 2)
+        ranges = list(zip(boundaries, boundaries[1:]))
+        if executor is None:
+            with ProcessPoolExecutor() as pool:
+                results = list(
+                    pool.map(parse_twee_chunk, repeat(self.filepath), *zip(*ranges))
                 )
-
-        # now insert the data into the database
-        # we need to insert the locations first, then the decisions, then the decision destinations
-        Session = current_app.extensions["Session"]
-        with Session.begin() as db_session:
-            db_session.execute(insert(Season), [season.__dict__])
-            db_session.execute(
-                insert(Location), [location.__dict__ for location in locations]
+        else:
+            results = list(
+                executor.map(parse_twee_chunk, repeat(self.filepath), *zip(*ranges))
             )
-            db_session.execute(
-                insert(Decision), [decision.__dict__ for decision in decisions]
+
+        self.passages = []
+        for story_title, metadata, passages in results:
+            # Later chunks win, just like later passages do when parsing serially
+            if story_title is not None:
+                self.story_title = story_title
+            if metadata is not None:
+                self.metadata = metadata
+            # Strings don't stay interned when they are pickled, so intern them again
+            self.passages.extend(
+                TwinePassage(
+                    sys.intern(name),
+                    content,
+                    [TwineLink(label, sys.intern(target)) for label, target in links],
+                )
+                for name, content, links in passages
             )
-            db_session.execute(
-                insert(DecisionDestination),
-                [dest.__dict__ for dest in decision_destinations],
+        return self.passages
+
+    def iter_passages(
+        self, stream: Iterable[str] | None = None
+    ) -> Iterator[TwinePassage]:
+        """
+        Lazily parses Twee source line by line, yielding each passage once it is complete.
+
+        Only the current passage is held in memory, so memory stays bounded regardless of
+        the size of the story. The story title and metadata are stored on the instance as
+        they are encountered.
+
+        A passage starts at a line beginning with "::". Its content is the first non-blank
+        line after the header, and its links are every [[link]] in its body.
+
+        Args:
+            stream: Lines of Twee source, e.g. an open text file. Defaults to reading self.filepath
+
+        Yields:
+            TwinePassage: Each story passage, in file order
+
+        Raises:
+            json.JSONDecodeError: If story metadata is invalid JSON
+            TypeError: If story metadata doesn't match expected format
+            ValueError: If story format is not Harlowe
+        """
+        if stream is None:
+            with open(self.filepath, "r", encoding="utf-8-sig") as file:
+                yield from self.iter_passages(file)
+            return
+
+        name: str | None = None
+        content: str | None = None
+        links: list[TwineLink] = []
+        data_lines: list[str] = []
+
+        for line in stream:
+            header = PASSAGE_HEADER_PATTERN.match(line)
+            if header is not None:
+                if name is not None:
+                    yield from self.__finish_passage(name, content, links, data_lines)
+                # Interned, so the name and every link to it share one string
+                name = sys.intern(header.group(1))
+                content = None
+                links = []
+                data_lines = []
+                continue
+
+            # Anything before the first passage header isn't part of the story
+            if name is None:
+                continue
+            if name == "StoryData":
+                data_lines.append(line.strip())
+                continue
+            if content is None and line.strip():
+                content = line.strip()
+            links.extend(parse_links(line))
+
+        if name is not None:
+            yield from self.__finish_passage(name, content, links, data_lines)
+
+    def __finish_passage(
+        self,
+        name: str,
+        content: str | None,
+        links: list[TwineLink],
+        data_lines: list[str],
+    ) -> Iterator[TwinePassage]:
+        # Yields the passage, unless it holds the story title or metadata
+        # store the story title
+        if name == "StoryTitle":
+            self.story_title = content or ""
+        # store the story metadata
+        elif name == "StoryData":
+            self.__set_metadata("".join(data_lines))
+        else:
+            yield TwinePassage(name=name, content=content or "", links=links)
+
+    def __set_metadata(self, story_data: str) -> None:
+        try:
+            self.metadata = json.loads(
+                story_data, object_hook=lambda d: HarloweMetadata(**d)
             )
-            db_session.execute(
-                update(Season)
-                .where(Season.id == self.season_id)
-                .values(genesis_location_id=genesis_location_id)
+        except json.JSONDecodeError as e:
+            # TODO: log this error
+            print(f"Error decoding JSON for StoryData: {e}")
+            raise json.JSONDecodeError(
+                "Error decoding JSON for StoryData", e.doc, e.pos
             )
+        except TypeError as e:
+            # TODO: log this error
+            print(f"Error decoding JSON for StoryData: {e}")
+            raise TypeError("Error decoding JSON for StoryData") from e
+        assert self.metadata is not None
+
+        if self.metadata["format"] != "Harlowe":
+            raise ValueError("Only Harlowe format is supported")
 
     def __str__(self):
         return f"ImportTwine({self.filename})"
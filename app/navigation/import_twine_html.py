@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import sys
+from collections import deque
+from html.parser import HTMLParser
+from typing import Iterable, Iterator
+
+from .import_twine import HarloweMetadata, Import, TwinePassage, parse_links
+
+"""
+Import of published Twine 2 stories, the HTML files Twine's "Publish to File" writes
+
+The story is a <tw-storydata> element holding one <tw-passagedata> element per passage:
+
+    <tw-storydata name="Story" startnode="1" format="Harlowe" format-version="3.3.9" ...>
+      <tw-passagedata pid="1" name="Introduction" tags="" position="900,400">Welcome!
+    [[Begin Your Adventure-&gt;You Awake]]</tw-passagedata>
+    </tw-storydata>
+
+The file is fed to an incremental HTML parser a chunk at a time and passages are yielded
+as their closing tag is read, so no DOM is built and memory stays bounded for large stories.
+"""
+
+# Characters fed to the HTML parser at a time
+HTML_CHUNK_SIZE = 64 * 1024
+
+
+class _StoryDataParser(HTMLParser):
+    """
+    Collects the story attributes and passages from Twine HTML as it is fed
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.story: dict[str, str | None] | None = None
+        # Completed passages as (pid, passage), waiting to be yielded
+        self.passages: deque[tuple[str | None, TwinePassage]] = deque()
+        self._pid: str | None = None
+        self._name: str | None = None
+        self._text: list[str] = []
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if tag == "tw-storydata":
+            if self.story is not None:
+                raise ValueError("Only one story per file is supported")
+            self.story = dict(attrs)
+        elif tag == "tw-passagedata" and self.story is not None:
+            passage = dict(attrs)
+            self._pid = passage.get("pid")
+            self._name = sys.intern(passage.get("name") or "")
+            self._text = []
+
+    def handle_data(self, data: str) -> None:
+        if self._name is not None:
+            self._text.append(data)
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag != "tw-passagedata" or self._name is None:
+            return
+        text = "".join(self._text)
+        content = next((line.strip() for line in text.splitlines() if line.strip()), "")
+        links = list(parse_links(text))
+        self.passages.append((self._pid, TwinePassage(self._name, content, links)))
+        self._pid = None
+        self._name = None
+        self._text = []
+
+
+class ImportTwineHtml(Import):
+    """
+    Handles importing published Twine 2 HTML story files.
+
+    The story title, metadata and passages are stored as described on Import, and the
+    story is written with the same insert_story as Twee imports.
+    """
+
+    def __init__(self, filepath: str, filename: str):
+        """
+        Initialize a new Twine HTML story import.
+
+        Args:
+            filepath (str): Path to the HTML file to import
+            filename (str): Original filename of the HTML file
+        """
+        super().__init__(filepath, filename)
+
+    def parse_html_file(self) -> list[TwinePassage]:
+        """
+        Parses a published Twine HTML file
+
+        Returns:
+            The list of passages, also stored on self.passages
+
+        Raises:
+            ValueError: If the file has no story, the story format is not Harlowe or the
+            start passage is missing
+        """
+        self.passages = list(self.iter_passages())
+        return self.passages
+
+    def iter_passages(
+        self, stream: Iterable[str] | None = None
+    ) -> Iterator[TwinePassage]:
+        """
+        Lazily parses Twine HTML, yielding each passage once its closing tag is read.
+
+        A passage's content is the first non-blank line of its text, and its links are every
+        [[link]] in the text, the same as for Twee.
+
+        Args:
+            stream: The HTML, e.g. an open text file. Defaults to reading self.filepath
+
+        Yields:
+            TwinePassage: Each story passage, in file order
+
+        Raises:
+            ValueError: If the file has no story, the story format is not Harlowe or the
+            start passage is missing
+        """
+        if stream is None:
+            with open(self.filepath, "r", encoding="utf-8-sig") as file:
+                yield from self.iter_passages(file)
+            return
+
+        read = getattr(stream, "read", None)
+        chunks: Iterable[str] = (
+            iter(lambda: read(HTML_CHUNK_SIZE), "") if read is not None else stream
+        )
+
+        parser = _StoryDataParser()
+        start_pid: str | None = None
+        for chunk in chunks:
+            parser.feed(chunk)
+            if parser.story is not None and self.metadata is None:
+                start_pid = parser.story.get("startnode")
+                self.__set_metadata(parser.story)
+            while parser.passages:
+                pid, passage = parser.passages.popleft()
+                if pid is not None and pid == start_pid and self.metadata is not None:
+                    self.metadata["start"] = passage.name
+                yield passage
+        parser.close()
+
+        if self.metadata is None:
+            raise ValueError(f"{self.filename} has no <tw-storydata> story")
+        if not self.metadata["start"]:
+            raise ValueError(f"Start passage {start_pid} not found in {self.filename}")
+
+    def __set_metadata(self, story: dict[str, str | None]) -> None:
+        self.story_title = story.get("name") or ""
+        zoom = story.get("zoom") or "1"
+        # The same keys as the StoryData passage of Twee files
+        self.metadata = HarloweMetadata(
+            **{
+                "ifid": story.get("ifid") or "",
+                "format": story.get("format") or "",
+                "format-version": story.get("format-version") or "",
+                # Filled in once the start passage is read
+                "start": "",
+                "zoom": float(zoom) if "." in zoom else int(zoom),
+            }
+        )
+        if self.metadata["format"] != "Harlowe":
+            raise ValueError("Only Harlowe format is supported")
+
+    def __str__(self):
+        return f"ImportTwineHtml({self.filename})"
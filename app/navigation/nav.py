@@ -4,12 +4,15 @@ import uuid
 from typing import TypedDict
 
 from flask import current_app
-from sqlalchemy import select
+from sqlalchemy import and_, select
+from sqlalchemy.exc import IntegrityError
 
 from ..db import get_db_session
 from ..models import Decision, DecisionDestination, Location, Season, User, UserLocation
+from ..seasons.season_counts import adjust_counts, is_player
 from ..seasons.seasons import SeasonStore
 from ..users.user_locations import UserLocationStore
+from .season_graph import GraphDestination, get_season_graphs
 
 """
 Navigating around in the world
@@ -78,36 +81,67 @@ class Nav:
     Navigation core methods
     """
 
-    def fetch_decisions(self) -> tuple[str, list[DecisionDestination]]:
+    def fetch_decisions(self) -> tuple[str, list[GraphDestination]]:
         """
         Get a location and its decisions
 
-        Args:
-            location_id (str): The location id
+        Served from the compiled season graph, so this doesn't touch the database once the
+        season has been compiled on this worker. Seasons too large for the graph cache are
+        queried per location.
 
         Returns:
-            tuple[str, list[DecisionDestination]]: The location description and a list of decisions
+            tuple[str, list[GraphDestination]]: The location description and a list of decisions
         """
+        graph = get_season_graphs().get(self.__season_id)
+        location = (
+            graph.locations.get(self.__location_id) if graph is not None else None
+        )
+        if location is None:
+            # The location isn't part of this season's graph, so fall back to the database
+            return self.__fetch_decisions_from_db()
+
+        return (location.description, list(location.destinations))
+
+    def __fetch_decisions_from_db(self) -> tuple[str, list[GraphDestination]]:
         stmt = (
-            select(DecisionDestination, Location.description)
+            select(
+                DecisionDestination.destination_location_id,
+                DecisionDestination.description,
+                DecisionDestination.position,
+                Location.description.label("location_description"),
+            )
             .select_from(DecisionDestination)
             .join(Decision)
             .join(Location)
-            .where(Decision.source_location_id == self.__location_id)
+            .where(
+                Decision.source_location_id == self.__location_id,
+                Location.season_id == self.__season_id,
+                Decision.season_id == self.__season_id,
+                DecisionDestination.season_id == self.__season_id,
+            )
             .order_by(DecisionDestination.position)
         )
         results = list(get_db_session().execute(stmt).all())
         description = None
-        destinations: list[DecisionDestination] = []
+        destinations: list[GraphDestination] = []
         for row in results:
-            description = row.description
-            destinations.append(row.DecisionDestination)
+            description = row.location_description
+            destinations.append(
+                GraphDestination(
+                    row.destination_location_id, row.description, row.position
+                )
+            )
 
         # We should always have one or more decisions for a location, but if have no
         # decisions, we should still return the location description
         if description is None:
-            stmt = select(Location.description).where(Location.id == self.__location_id)
-            description = get_db_session().execute(stmt).scalar_one()
+            stmt = select(Location.description).where(
+                Location.id == self.__location_id,
+                Location.season_id == self.__season_id,
+            )
+            description = get_db_session().execute(stmt).scalar()
+            if description is None:
+                raise ValueError("No location found")
 
         return (description, destinations)
 
@@ -124,6 +158,124 @@ class Nav:
             self.__season_id, self.__user.id, self.__location_id
         )
 
+    def transition(self, location_id: uuid.UUID) -> tuple[str, list[GraphDestination]]:
+        """
+        Move to a location and get its decisions in a single round trip
+
+        The season's graph is compiled on this worker's first move in it, after that the
+        decisions come from memory and the position upsert is the only statement. For a
+        season too large for the graph cache, or a location the graph doesn't have yet, on
+        Postgres the upsert and the decision lookup run as one statement (a data-modifying
+        CTE). SQLite can't put an INSERT inside a CTE, so there the upsert and the lookup
+        share one transaction. A player's first move in the season also adds to the
+        season's player_count.
+
+        Args:
+            location_id (uuid.UUID): The location id
+
+        Returns:
+            tuple[str, list[GraphDestination]]: The location description and a list of decisions
+
+        Raises:
+            ValueError: If the location isn't part of the season
+        """
+        self.__location_id = location_id
+
+        write_behind = UserLocationStore.get_buffer() is not None
+        graph = get_season_graphs().get(self.__season_id)
+        location = graph.locations.get(location_id) if graph is not None else None
+        if location is not None:
+            try:
+                self.set_location(location_id)
+            except IntegrityError:
+                # The graph is stale, the location was deleted on another worker since it
+                # was compiled, see SeasonGraphCache.sync
+                get_db_session().rollback()
+                raise ValueError("No location found")
+            return (location.description, list(location.destinations))
+        if write_behind:
+            # Looked up before buffering, so only existing locations are written
+            decisions = self.__fetch_decisions_from_db()
+            self.set_location(location_id)
+            return decisions
+
+        upsert = UserLocationStore.upsert_statement(
+            self.__season_id, self.__user.id, location_id
+        )
+        stmt = select(
+            Location.description.label("location_description"),
+            DecisionDestination.destination_location_id,
+            DecisionDestination.description,
+            DecisionDestination.position,
+        )
+        db_session = get_db_session()
+        postgres = db_session.get_bind().dialect.name == "postgresql"
+        if postgres:
+            moved = upsert.returning(UserLocation.location_id).cte("moved")
+            # Read from before the upsert, see season_counts.new_players
+            stmt = (
+                stmt.add_columns(
+                    (~is_player(self.__season_id, self.__user.id)).label("new_player")
+                )
+                .select_from(moved)
+                .join(
+                    Location,
+                    and_(
+                        Location.id == moved.c.location_id,
+                        Location.season_id == self.__season_id,
+                    ),
+                )
+            )
+        else:
+            UserLocationStore.upsert(
+                db_session, self.__season_id, self.__user.id, location_id
+            )
+            stmt = stmt.select_from(Location).where(
+                Location.id == location_id, Location.season_id == self.__season_id
+            )
+
+        # The season predicates let Postgres prune to the season's partitions, see
+        # app.seasons.partitions
+        stmt = (
+            stmt.outerjoin(
+                Decision,
+                and_(
+                    Decision.source_location_id == Location.id,
+                    Decision.season_id == self.__season_id,
+                ),
+            )
+            .outerjoin(
+                DecisionDestination,
+                and_(
+                    DecisionDestination.decision_id == Decision.id,
+                    DecisionDestination.season_id == self.__season_id,
+                ),
+            )
+            .order_by(DecisionDestination.position)
+        )
+        try:
+            results = list(db_session.execute(stmt).all())
+        except IntegrityError:
+            # The upsert's foreign key, the location doesn't exist
+            db_session.rollback()
+            raise ValueError("No location found")
+        if len(results) == 0:
+            # A location of another season, don't keep the upsert
+            db_session.rollback()
+            raise ValueError("No location found")
+        if postgres and results[0].new_player:
+            # Only a player's first move in the season costs this extra statement
+            adjust_counts(db_session, self.__season_id, players=1)
+        db_session.commit()
+
+        # A location without decisions comes back as a single row with no destination
+        destinations = [
+            GraphDestination(row.destination_location_id, row.description, row.position)
+            for row in results
+            if row.destination_location_id is not None
+        ]
+        return (results[0].location_description, destinations)
+
     @staticmethod
     def create_location(season: Season, description: str) -> uuid.UUID:
         """
@@ -139,7 +291,10 @@ class Nav:
         id: uuid.UUID = uuid.uuid4()
         location = Location(id=id, description=description, season_id=season.id)
         db_session.add(location)
+        adjust_counts(db_session, season.id, locations=1)
+        SeasonStore.bump_content_version(db_session, season.id)
         db_session.commit()
+        get_season_graphs().invalidate(season.id)
         return id
 
     @staticmethod
@@ -156,10 +311,17 @@ class Nav:
             Decision: The newly created decision
         """
         decision_id = uuid.uuid4()
-        decision = Decision(id=decision_id, source_location_id=source_location_id)
 
         Session = current_app.extensions["Session"]
         with Session.begin() as db_session:
+            season_id = db_session.execute(
+                select(Location.season_id).where(Location.id == source_location_id)
+            ).scalar_one()
+            decision = Decision(
+                id=decision_id,
+                source_location_id=source_location_id,
+                season_id=season_id,
+            )
             db_session.add(decision)
             for destination in destinations:
                 decision_destination = DecisionDestination(
@@ -168,6 +330,15 @@ class Nav:
                     destination_location_id=destination["destination_location_id"],
                     description=destination["description"],
                     position=destination["position"],
+                    season_id=season_id,
                 )
                 db_session.add(decision_destination)
+            adjust_counts(
+                db_session,
+                season_id,
+                decisions=1,
+                destinations=len(destinations),
+            )
+            SeasonStore.bump_content_version(db_session, season_id)
+        get_season_graphs().invalidate(season_id)
         return decision
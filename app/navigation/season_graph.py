@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import logging
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Mapping, NamedTuple
+
+from flask import Flask, current_app
+from sqlalchemy import select
+
+from ..models import Decision, DecisionDestination, Location, Season
+
+"""
+Compiled season graphs
+
+Each worker compiles a season into a plain dict of location id -> (description, ordered
+destinations) the first time it is played, and serves navigation from memory after that.
+
+A season's content can change after ImportTwine.insert_story has written it: update_story
+edits it in place and admins delete seasons. Every change in place bumps the season's
+content_version, and each graph remembers the version it was compiled from. The worker
+that made the change drops its graph right away. Every other worker drops its graph the
+next time it resolves the current season, at most SEASON_CACHE_TTL seconds later, which
+also reads the version of every season, see SeasonGraphCache.sync. Until then, a move
+into a location that is gone is rejected by the database, see Nav.transition.
+
+Compiled graphs are kept in a per-worker LRU bounded by an (estimated) memory budget.
+"""
+
+logger = logging.getLogger(__name__)
+
+
+class GraphDestination(NamedTuple):
+    destination_location_id: uuid.UUID
+    description: str
+    position: int
+
+
+class GraphLocation(NamedTuple):
+    description: str
+    destinations: tuple[GraphDestination, ...]
+
+
+# Rough per-object overheads used to estimate the memory held by a compiled graph
+_GRAPH_OVERHEAD = 1024
+_LOCATION_OVERHEAD = 240
+_DESTINATION_OVERHEAD = 200
+
+
+class SeasonGraph:
+    """
+    Read-only navigation graph for a single season
+
+    Attributes:
+        season_id (uuid.UUID): The season this graph was compiled from
+        locations (dict[uuid.UUID, GraphLocation]): Location id to description and destinations
+        version (int): The season's content_version when the graph was compiled
+        size (int): Estimated memory held by the graph, in bytes, at least
+            _GRAPH_OVERHEAD so the cache's budget also bounds how many graphs it keeps
+    """
+
+    season_id: uuid.UUID
+    locations: dict[uuid.UUID, GraphLocation]
+    version: int
+    size: int
+
+    def __init__(
+        self,
+        season_id: uuid.UUID,
+        locations: dict[uuid.UUID, GraphLocation],
+        version: int = 0,
+    ):
+        self.season_id = season_id
+        self.locations = locations
+        self.version = version
+        self.size = _GRAPH_OVERHEAD + sum(
+            _LOCATION_OVERHEAD
+            + sys.getsizeof(location.description)
+            + sum(
+                _DESTINATION_OVERHEAD + sys.getsizeof(destination.description)
+                for destination in location.destinations
+            )
+            for location in locations.values()
+        )
+
+    @classmethod
+    def load(cls, season_id: uuid.UUID) -> SeasonGraph | None:
+        """
+        Compile a season graph from the database
+
+        Args:
+            season_id (uuid.UUID): The season id
+
+        Returns:
+            SeasonGraph | None: The compiled graph, None if the season doesn't exist
+        """
+        Session = current_app.extensions["Session"]
+        with Session() as db_session:
+            # Read before the content, a change in between leaves the graph looking stale
+            version = db_session.execute(
+                select(Season.content_version).where(Season.id == season_id)
+            ).scalar()
+            if version is None:
+                return None
+            location_rows = db_session.execute(
+                select(Location.id, Location.description).where(
+                    Location.season_id == season_id
+                )
+            ).all()
+            destination_rows = db_session.execute(
+                select(
+                    Decision.source_location_id,
+                    DecisionDestination.destination_location_id,
+                    DecisionDestination.description,
+                    DecisionDestination.position,
+                )
+                .select_from(DecisionDestination)
+                .join(Decision)
+                .join(Location, Decision.source_location_id == Location.id)
+                .where(
+                    Location.season_id == season_id,
+                    Decision.season_id == season_id,
+                    DecisionDestination.season_id == season_id,
+                )
+                .order_by(DecisionDestination.position)
+            ).all()
+
+        destinations: dict[uuid.UUID, list[GraphDestination]] = {}
+        for row in destination_rows:
+            destinations.setdefault(row.source_location_id, []).append(
+                GraphDestination(
+                    row.destination_location_id, row.description, row.position
+                )
+            )
+
+        return cls(
+            season_id,
+            {
+                row.id: GraphLocation(
+                    row.description, tuple(destinations.get(row.id, ()))
+                )
+                for row in location_rows
+            },
+            version,
+        )
+
+
+class SeasonGraphCache:
+    """
+    LRU of compiled season graphs, bounded by an estimated memory budget
+
+    A graph larger than the whole budget isn't kept. Its season is remembered as too large,
+    so get returns None for it from then on rather than compiling it again on every call,
+    and callers fall back to querying the database per location. Until its content changes,
+    see sync.
+    """
+
+    max_bytes: int
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._graphs: OrderedDict[uuid.UUID, SeasonGraph] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        # Seasons being compiled by prewarm
+        self._warming: set[uuid.UUID] = set()
+        # Seasons whose graph is larger than the whole budget, with the version compiled
+        self._too_large: dict[uuid.UUID, int] = {}
+
+    def get(self, season_id: uuid.UUID) -> SeasonGraph | None:
+        """
+        Get a season graph, compiling it on a cache miss
+
+        Args:
+            season_id (uuid.UUID): The season id
+
+        Returns:
+            SeasonGraph | None: The compiled graph, None if it is too large to keep or the
+            season doesn't exist. Nothing is cached for a season that doesn't exist, so
+            requests for made up season ids can't fill the cache.
+        """
+        with self._lock:
+            if season_id in self._too_large:
+                return None
+        graph = self.peek(season_id)
+        if graph is None:
+            graph = SeasonGraph.load(season_id)
+            if graph is None:
+                return None
+            self.put(graph)
+        return graph
+
+    def prewarm(self, app: Flask, season_id: uuid.UUID) -> threading.Thread | None:
+        """
+        Compile a season graph on a background thread, e.g. ahead of a scheduled cutover,
+        so the first players of the season don't wait for it. Loading the graph also reads
+        the season's rows into the database's buffer cache.
+
+        Args:
+            app (Flask): The app to compile the graph in
+            season_id (uuid.UUID): The season id
+
+        Returns:
+            threading.Thread | None: The compiling thread, or None if the graph is already
+            compiled or being compiled
+        """
+        with self._lock:
+            if (
+                season_id in self._graphs
+                or season_id in self._warming
+                or season_id in self._too_large
+            ):
+                return None
+            self._warming.add(season_id)
+
+        def run() -> None:
+            try:
+                with app.app_context():
+                    self.get(season_id)
+            except Exception:
+                logger.exception("Failed to prewarm season %s", season_id)
+            finally:
+                with self._lock:
+                    self._warming.discard(season_id)
+
+        thread = threading.Thread(target=run, name="season-prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def peek(self, season_id: uuid.UUID) -> SeasonGraph | None:
+        """
+        Get a season graph only if it is already compiled
+
+        Args:
+            season_id (uuid.UUID): The season id
+
+        Returns:
+            SeasonGraph | None: The compiled graph, or None on a cache miss
+        """
+        with self._lock:
+            graph = self._graphs.get(season_id)
+            if graph is not None:
+                self._graphs.move_to_end(season_id)
+            return graph
+
+    def put(self, graph: SeasonGraph) -> None:
+        with self._lock:
+            self._discard(graph.season_id)
+            if graph.size > self.max_bytes:
+                self._too_large[graph.season_id] = graph.version
+                return
+            self._graphs[graph.season_id] = graph
+            self._size += graph.size
+            while self._size > self.max_bytes:
+                _, evicted = self._graphs.popitem(last=False)
+                self._size -= evicted.size
+
+    def invalidate(self, season_id: uuid.UUID) -> None:
+        with self._lock:
+            self._discard(season_id)
+            # The changed season may fit now
+            self._too_large.pop(season_id, None)
+
+    def sync(self, versions: Mapping[uuid.UUID, int]) -> None:
+        """
+        Drop the graphs of seasons that were deleted or changed since they were compiled,
+        including changes made by other workers
+
+        Args:
+            versions (Mapping[uuid.UUID, int]): The content_version of every season
+        """
+        with self._lock:
+            stale = [
+                season_id
+                for season_id, graph in self._graphs.items()
+                if versions.get(season_id) != graph.version
+            ]
+            for season_id in stale:
+                self._discard(season_id)
+            for season_id, version in list(self._too_large.items()):
+                if versions.get(season_id) != version:
+                    del self._too_large[season_id]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._graphs.clear()
+            self._size = 0
+            self._too_large.clear()
+
+    def __len__(self) -> int:
+        return len(self._graphs)
+
+    def _discard(self, season_id: uuid.UUID) -> None:
+        graph = self._graphs.pop(season_id, None)
+        if graph is not None:
+            self._size -= graph.size
+
+
+def get_season_graphs() -> SeasonGraphCache:
+    return current_app.extensions["season_graphs"]
@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+from array import array
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable, Sequence
+
+if TYPE_CHECKING:
+    from .import_twine import TwinePassage
+
+"""
+Graph analysis of a story, run between parsing and writing it to the database
+
+Every passage gets two distances, both found with a breadth-first search in time linear in
+the passages and links:
+
+- start_distance: the fewest moves from the start passage, None for passages the start
+  can't reach
+- ending_distance: the fewest moves to a passage without links, where the story ends.
+  None for passages where every path loops forever, a cycle without an exit
+
+They are stored on the season's locations, so admin tools and hints read them instead of
+walking the graph. Links are resolved here first, so a link to a missing passage fails the
+import before anything is written.
+"""
+
+# Distance of a passage that wasn't reached, in the arrays below
+UNREACHED = -1
+
+
+@dataclass
+class StoryAnalysis:
+    """
+    Distances of every passage, indexed like the analyzed passages
+    """
+
+    names: list[str]
+    start_distances: array
+    ending_distances: array
+
+    def distances(self, index: int) -> tuple[int | None, int | None]:
+        """
+        Returns:
+            tuple[int | None, int | None]: start_distance and ending_distance of a passage
+        """
+        start = self.start_distances[index]
+        ending = self.ending_distances[index]
+        return (
+            start if start != UNREACHED else None,
+            ending if ending != UNREACHED else None,
+        )
+
+    @property
+    def unreachable(self) -> list[str]:
+        """
+        Passages the start can't reach
+        """
+        return [
+            name
+            for name, start in zip(self.names, self.start_distances)
+            if start == UNREACHED
+        ]
+
+    @property
+    def dead_ends(self) -> list[str]:
+        """
+        Passages without links, where the story ends
+        """
+        return [
+            name
+            for name, ending in zip(self.names, self.ending_distances)
+            if ending == 0
+        ]
+
+    @property
+    def trapped(self) -> list[str]:
+        """
+        Reachable passages without a way to an ending, players there can only go in circles
+        """
+        return [
+            name
+            for name, start, ending in zip(
+                self.names, self.start_distances, self.ending_distances
+            )
+            if start != UNREACHED and ending == UNREACHED
+        ]
+
+    def __str__(self) -> str:
+        return (
+            f"{len(self.unreachable)} unreachable passages, {len(self.dead_ends)} dead "
+            f"ends, {len(self.trapped)} trapped passages"
+        )
+
+
+def analyze_story(passages: Sequence[TwinePassage], start: str) -> StoryAnalysis:
+    """
+    Find the distances of every passage from the start and to the nearest ending
+
+    The links are held as flat arrays of passage indexes (compressed sparse rows), so a story
+    with a million passages takes a few bytes per link rather than a list per passage.
+
+    Args:
+        passages: The passages of the story. Of passages with the same name, links go to the
+            first
+        start (str): Name of the start passage
+
+    Returns:
+        StoryAnalysis: The distances
+
+    Raises:
+        ValueError: If the start passage or the target of a link doesn't exist
+    """
+    index: dict[str, int] = {}
+    for position, passage in enumerate(passages):
+        index.setdefault(passage.name, position)
+    if start not in index:
+        raise ValueError(f"The start passage {start} doesn't exist")
+
+    # Links of passage i are targets[offsets[i]:offsets[i + 1]]
+    offsets = array("l", [0])
+    targets = array("l")
+    broken: list[tuple[str, str]] = []
+    for passage in passages:
+        for link in passage.links:
+            target = index.get(link.target)
+            if target is None:
+                broken.append((passage.name, link.target))
+            else:
+                targets.append(target)
+        offsets.append(len(targets))
+    if broken:
+        examples = ", ".join(f"{source} -> {target}" for source, target in broken[:5])
+        raise ValueError(
+            f"{len(broken)} links to passages that don't exist: {examples}"
+        )
+
+    # The same links the other way around, for searching back from the endings
+    count = len(passages)
+    reverse_offsets, reverse_targets = _reverse_links(offsets, targets, count)
+
+    return StoryAnalysis(
+        names=[passage.name for passage in passages],
+        start_distances=_distances([index[start]], offsets, targets, count),
+        ending_distances=_distances(
+            (
+                position
+                for position in range(count)
+                if offsets[position] == offsets[position + 1]
+            ),
+            reverse_offsets,
+            reverse_targets,
+            count,
+        ),
+    )
+
+
+def _reverse_links(offsets: array, targets: array, count: int) -> tuple[array, array]:
+    # The links as compressed sparse rows of their targets, pointing back at their sources
+    reverse_offsets = array("l", [0]) * (count + 1)
+    for target in targets:
+        reverse_offsets[target + 1] += 1
+    for position in range(count):
+        reverse_offsets[position + 1] += reverse_offsets[position]
+    reverse_targets = array("l", [0]) * len(targets)
+    filled = array("l", reverse_offsets[:count])
+    for source in range(count):
+        for link in range(offsets[source], offsets[source + 1]):
+            target = targets[link]
+            reverse_targets[filled[target]] = source
+            filled[target] += 1
+    return reverse_offsets, reverse_targets
+
+
+def _distances(
+    sources: Iterable[int], offsets: array, targets: array, count: int
+) -> array:
+    # Breadth-first search from every source at once
+    distances = array("l", [UNREACHED]) * count
+    queue = array("l")
+    for source in sources:
+        if distances[source] == UNREACHED:
+            distances[source] = 0
+            queue.append(source)
+    head = 0
+    while head < len(queue):
+        node = queue[head]
+        head += 1
+        distance = distances[node] + 1
+        for link in range(offsets[node], offsets[node + 1]):
+            target = targets[link]
+            if distances[target] == UNREACHED:
+                distances[target] = distance
+                queue.append(target)
+    return distances
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import time
+import zlib
+from dataclasses import dataclass
+from typing import IO
+
+from flask import Request
+from werkzeug.utils import secure_filename
+
+from . import import_twine
+
+try:
+    # Optional, only needed to accept .zst uploads
+    import zstandard
+except ImportError:
+    zstandard = None
+
+"""
+Reading season uploads
+
+Uploads are read straight from the request: file parts are kept in memory rather than
+spooled to a temporary file (MAX_CONTENT_LENGTH caps the request before any of it is read),
+compressed uploads are decompressed and hashed as they are read, and the decompressed story
+is capped at IMPORT_MAX_STORY_BYTES so a small compressed file can't expand without bound.
+Stories are spooled in memory until they are big enough to be split across the parsing
+pool, which needs a path, and only those are written to a temporary file. Nothing else is
+written to disk unless IMPORT_ARCHIVE_FOLDER is set.
+"""
+
+# Extensions of the compressed uploads we accept, e.g. story.twee.gz
+COMPRESSION_SUFFIXES = {"gz": "gzip", "zst": "zstd"}
+
+
+# Errors raised while reading a corrupt compressed upload
+DECOMPRESSION_ERRORS: tuple[type[Exception], ...] = (OSError, EOFError, zlib.error)
+if zstandard is not None:
+    DECOMPRESSION_ERRORS += (zstandard.ZstdError,)
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class InMemoryUploadRequest(Request):
+    """
+    Request that keeps uploaded files in memory instead of spooling them to a temporary
+    file. Only safe with MAX_CONTENT_LENGTH set, which rejects larger requests before
+    their body is read.
+    """
+
+    def _get_file_stream(
+        self,
+        total_content_length: int | None,
+        content_type: str | None,
+        filename: str | None = None,
+        content_length: int | None = None,
+    ) -> IO[bytes]:
+        return io.BytesIO()
+
+
+def split_compression(filename: str) -> tuple[str, str | None]:
+    """
+    Split the compression suffix off an upload's filename
+
+    Returns:
+        tuple[str, str | None]: The filename without the suffix and the compression, e.g.
+        ("story.twee", "gzip") for story.twee.gz, or ("story.twee", None) for story.twee
+    """
+    if "." in filename:
+        name, extension = filename.rsplit(".", 1)
+        compression = COMPRESSION_SUFFIXES.get(extension.lower())
+        if compression is not None:
+            return name, compression
+    return filename, None
+
+
+@dataclass
+class StoryUpload:
+    """
+    A decompressed upload, in memory or in a temporary file
+
+    Attributes:
+        content_hash (str): Hash of the story, see import_twine.content_hash
+        data (bytes | None): The story, if it was kept in memory
+        path (str | None): The temporary file holding the story otherwise, the import job
+            deletes it once it is done
+    """
+
+    content_hash: str
+    data: bytes | None = None
+    path: str | None = None
+
+    def discard(self) -> None:
+        """Delete the temporary file of an upload that won't be imported"""
+        if self.path is not None:
+            os.remove(self.path)
+            self.path = None
+
+
+class _UploadSpool:
+    """
+    Copies a story while content_hash reads it, so it is only read once
+
+    The copy is kept in memory until it reaches memory_bytes and moved to a temporary file
+    from then on.
+    """
+
+    def __init__(
+        self, source: IO[bytes], filename: str, max_bytes: int, memory_bytes: int
+    ):
+        self.source = source
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.size = 0
+        self.file: IO[bytes] = io.BytesIO()
+        self.path: str | None = None
+
+    def read(self, size: int) -> bytes:
+        # Read one byte past the limit, to tell a story of exactly max_bytes from a larger one
+        chunk = self.source.read(min(size, self.max_bytes + 1 - self.size))
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(
+                f"{self.filename} is larger than {self.max_bytes} bytes once decompressed"
+            )
+        if self.path is None and self.size >= self.memory_bytes:
+            spooled = self.file.getvalue()  # type: ignore[attr-defined]
+            self.file = tempfile.NamedTemporaryFile(prefix="upload_", delete=False)
+            self.path = self.file.name
+            self.file.write(spooled)
+        self.file.write(chunk)
+        return chunk
+
+    def close(self, content_hash: str) -> StoryUpload:
+        if self.path is None:
+            return StoryUpload(content_hash, data=self.file.getvalue())  # type: ignore[attr-defined]
+        self.file.close()
+        return StoryUpload(content_hash, path=self.path)
+
+    def discard(self) -> None:
+        self.file.close()
+        if self.path is not None:
+            os.remove(self.path)
+
+
+def read_upload(
+    stream: IO[bytes], filename: str, max_bytes: int, memory_bytes: int | None = None
+) -> StoryUpload:
+    """
+    Read an uploaded story, decompressing and hashing it as it is read
+
+    Args:
+        stream (IO[bytes]): The uploaded file
+        filename (str): Name of the uploaded file, its suffix picks the decompression
+        max_bytes (int): Largest story to accept, after decompression
+        memory_bytes (int | None): Stories this large are spooled to a temporary file
+            rather than kept in memory, PARALLEL_PARSE_MIN_BYTES by default so the ones
+            that can be split across the parsing pool have a path
+
+    Returns:
+        StoryUpload: The story and its content hash
+
+    Raises:
+        UploadTooLarge: If the story is larger than max_bytes
+        ValueError: If the compression isn't supported or the data is corrupt
+    """
+    _, compression = split_compression(filename)
+    if compression == "gzip":
+        source: IO[bytes] = gzip.GzipFile(fileobj=stream, mode="rb")
+    elif compression == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd uploads need the zstandard package")
+        source = zstandard.ZstdDecompressor().stream_reader(stream)
+    else:
+        source = stream
+
+    if memory_bytes is None:
+        memory_bytes = import_twine.PARALLEL_PARSE_MIN_BYTES
+    spool = _UploadSpool(source, filename, max_bytes, memory_bytes)
+    try:
+        try:
+            content_hash = import_twine.content_hash(spool)  # type: ignore[arg-type]
+        except DECOMPRESSION_ERRORS as e:
+            raise ValueError(f"{filename} could not be decompressed: {e}") from e
+    except Exception:
+        spool.discard()
+        raise
+    return spool.close(content_hash)
+
+
+def archive_upload(stream: IO[bytes], filename: str, folder: str) -> str:
+    """
+    Keep a copy of an upload, as it was uploaded
+
+    Returns:
+        str: Path of the copy
+    """
+    os.makedirs(folder, exist_ok=True)
+    filepath = os.path.join(folder, f"{int(time.time())}_{secure_filename(filename)}")
+    stream.seek(0)
+    with open(filepath, "wb") as archive:
+        shutil.copyfileobj(stream, archive)
+    return filepath
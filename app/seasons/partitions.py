@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import logging
+import re
+import uuid
+
+from sqlalchemy import Connection, Engine, Table, UniqueConstraint, select, text
+
+from ..models import Decision, DecisionDestination, Location, Season, UserLocation
+
+"""
+Optional Postgres layout with season content partitioned by season
+
+In the partitioned layout locations, decisions, decision_destinations and user_locations are
+PARTITION BY LIST (season_id) with one partition per season. Play queries filter on the
+season, so Postgres only reads that season's partitions, and deleting a season detaches and
+drops its partitions instead of cascading a DELETE through every row of the season.
+
+`flask partition-seasons` converts a database from the default layout. Postgres requires
+the primary key and unique indexes of a partitioned table to include season_id, so they lead
+with it. Foreign keys between the partitioned tables are dropped, as detaching a referenced
+partition would check it against every partition of the referencing table. The importer
+writes a season's rows consistently in one transaction. The exception is user_locations to
+locations, which keeps a player from moving to a location that was deleted since their
+worker compiled the season's graph, see Nav.transition. It is keyed on (season_id,
+location_id), and a season's user_locations partition is dropped before its locations
+partition is detached, so that check finds nothing to scan. Nothing in a partition refers to
+its season row either, so deleting the row doesn't cascade.
+
+The layout is detected from the database, there is nothing to configure. With SQLite, or a
+Postgres database that wasn't converted, the functions here do nothing.
+"""
+
+logger = logging.getLogger(__name__)
+
+# In the order their rows are written, partitions are dropped in reverse
+PARTITIONED_TABLES: list[Table] = [
+    Location.__table__,  # type: ignore
+    Decision.__table__,  # type: ignore
+    DecisionDestination.__table__,  # type: ignore
+    UserLocation.__table__,  # type: ignore
+]
+
+PARTITION_NAME_PATTERN = re.compile(
+    r"^(%s)_([0-9a-f]{32})$" % "|".join(table.name for table in PARTITIONED_TABLES)
+)
+
+
+def partition_name(table: Table, season_id: uuid.UUID) -> str:
+    return f"{table.name}_{season_id.hex}"
+
+
+def is_partition_name(name: str) -> bool:
+    """
+    Is this the name of a season partition? Alembic leaves those alone, see migrations/env.py
+    """
+    return PARTITION_NAME_PATTERN.match(name) is not None
+
+
+def is_partitioned(connection: Connection) -> bool:
+    """
+    Does the database use the partitioned layout?
+    """
+    if connection.dialect.name != "postgresql":
+        return False
+    return (
+        connection.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass('locations')")
+        ).scalar()
+        == "p"
+    )
+
+
+def create_season_partitions(engine: Engine, season_id: uuid.UUID) -> bool:
+    """
+    Add the partitions of a new season, before its rows are written
+
+    Each partition is created on its own and then attached, which doesn't block queries on
+    the partitioned tables the way CREATE TABLE ... PARTITION OF does. This commits right
+    away, so the import that follows doesn't hold the partitioned tables' locks.
+
+    Returns:
+        bool: Whether partitions were created, False in the default layout
+    """
+    with engine.begin() as connection:
+        if not is_partitioned(connection):
+            return False
+        for table in PARTITIONED_TABLES:
+            name = partition_name(table, season_id)
+            connection.execute(
+                text(f"CREATE TABLE {name} (LIKE {table.name} INCLUDING DEFAULTS)")
+            )
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table.name} ATTACH PARTITION {name} "
+                    f"FOR VALUES IN ('{season_id}')"
+                )
+            )
+    return True
+
+
+def drop_season_partitions(engine: Engine, season_id: uuid.UUID) -> int:
+    """
+    Detach and drop the partitions of a season, after its season row was deleted
+
+    Partitions are detached CONCURRENTLY, so queries on other seasons carry on. Partitions
+    that are already gone are skipped and an interrupted detach is finished, so this can be
+    run again after a failure.
+
+    Returns:
+        int: The number of partitions dropped
+    """
+    if engine.dialect.name != "postgresql":
+        return 0
+    dropped = 0
+    # DETACH PARTITION CONCURRENTLY can't run inside a transaction
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        if not is_partitioned(connection):
+            return 0
+        concurrently = (connection.dialect.server_version_info or (0,)) >= (14,)
+        for table in reversed(PARTITIONED_TABLES):
+            name = partition_name(table, season_id)
+            if (
+                connection.execute(text(f"SELECT to_regclass('{name}')")).scalar()
+                is None
+            ):
+                continue
+            attached = connection.execute(
+                text(
+                    "SELECT "
+                    + ("inhdetachpending" if concurrently else "false")
+                    + f" FROM pg_inherits WHERE inhrelid = to_regclass('{name}')"
+                )
+            ).first()
+            if attached is not None:
+                if attached[0]:
+                    logger.info("Finishing the interrupted detach of %s", name)
+                    detach = "FINALIZE"
+                else:
+                    detach = "CONCURRENTLY" if concurrently else ""
+                connection.execute(
+                    text(f"ALTER TABLE {table.name} DETACH PARTITION {name} {detach}")
+                )
+            connection.execute(text(f"DROP TABLE {name}"))
+            dropped += 1
+    return dropped
+
+
+def orphaned_partition_seasons(connection: Connection) -> set[uuid.UUID]:
+    """
+    Seasons that were deleted, but whose partitions are still around, e.g. because dropping
+    them was interrupted
+
+    Returns:
+        set[uuid.UUID]: The season ids
+    """
+    if not is_partitioned(connection):
+        return set()
+    seasons = set(connection.execute(select(Season.id)).scalars())
+    orphaned: set[uuid.UUID] = set()
+    for (name,) in connection.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent IN ("
+            + ", ".join(f"to_regclass('{table.name}')" for table in PARTITIONED_TABLES)
+            + ")"
+        )
+    ):
+        match = PARTITION_NAME_PATTERN.match(name)
+        if match is not None and uuid.UUID(match.group(2)) not in seasons:
+            orphaned.add(uuid.UUID(match.group(2)))
+    return orphaned
+
+
+def partition_tables(connection: Connection) -> int:
+    """
+    Convert the default layout to the partitioned one, in the connection's transaction
+
+    Every row is copied into the new tables, and the old tables are locked until the
+    transaction commits, so run this during maintenance.
+
+    Returns:
+        int: The number of seasons partitioned
+    """
+    if connection.dialect.name != "postgresql":
+        raise ValueError("Only Postgres tables can be partitioned")
+    if is_partitioned(connection):
+        raise ValueError("The tables are partitioned already")
+
+    season_ids = list(connection.execute(select(Season.id)).scalars())
+    for table in PARTITIONED_TABLES:
+        _partition_table(connection, table, season_ids)
+
+    # Also drops every foreign key to and between the old tables
+    for table in reversed(PARTITIONED_TABLES):
+        connection.execute(text(f"DROP TABLE {table.name}_unpartitioned CASCADE"))
+
+    _add_foreign_keys(connection)
+    # Players can only be at their season's locations
+    connection.execute(
+        text(
+            "ALTER TABLE user_locations ADD CONSTRAINT fk_user_locations_location_id "
+            "FOREIGN KEY (season_id, location_id) REFERENCES locations (season_id, id) "
+            "ON UPDATE CASCADE ON DELETE CASCADE"
+        )
+    )
+    # A season's start is one of its own locations
+    connection.execute(
+        text(
+            "ALTER TABLE seasons ADD CONSTRAINT fk_seasons_genesis_location_id "
+            "FOREIGN KEY (id, genesis_location_id) REFERENCES locations (season_id, id)"
+        )
+    )
+    return len(season_ids)
+
+
+def _partition_table(
+    connection: Connection, table: Table, season_ids: list[uuid.UUID]
+) -> None:
+    # Moves the table aside as <name>_unpartitioned and copies it into a partitioned one
+    old = f"{table.name}_unpartitioned"
+    connection.execute(text(f"ALTER TABLE {table.name} RENAME TO {old}"))
+    # Frees the index names for the new table
+    for (index,) in connection.execute(
+        text(f"SELECT indexname FROM pg_indexes WHERE tablename = '{old}'")
+    ).all():
+        connection.execute(text(f"ALTER INDEX {index} RENAME TO {index}_old"))
+
+    connection.execute(
+        text(
+            f"CREATE TABLE {table.name} (LIKE {old} INCLUDING DEFAULTS) "
+            "PARTITION BY LIST (season_id)"
+        )
+    )
+    _create_keys(connection, table)
+
+    for season_id in season_ids:
+        connection.execute(
+            text(
+                f"CREATE TABLE {partition_name(table, season_id)} PARTITION OF "
+                f"{table.name} FOR VALUES IN ('{season_id}')"
+            )
+        )
+    connection.execute(text(f"INSERT INTO {table.name} SELECT * FROM {old}"))
+
+
+def _create_keys(connection: Connection, table: Table) -> None:
+    # The primary key, indexes and unique constraints of a partitioned table, each unique
+    # one including season_id as Postgres requires
+    connection.execute(
+        text(
+            f"ALTER TABLE {table.name} ADD PRIMARY KEY "
+            f"({', '.join(_with_season_id([c.name for c in table.primary_key]))})"
+        )
+    )
+    for index in table.indexes:
+        columns = [column.name for column in index.columns]
+        # Every row of a partition has the same season
+        if columns == ["season_id"]:
+            continue
+        if index.unique:
+            columns = _with_season_id(columns)
+        connection.execute(
+            text(
+                f"CREATE {'UNIQUE ' if index.unique else ''}INDEX {index.name} "
+                f"ON {table.name} ({', '.join(columns)})"
+            )
+        )
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint):
+            columns = _with_season_id([column.name for column in constraint.columns])
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table.name} ADD CONSTRAINT {constraint.name} "
+                    f"UNIQUE ({', '.join(columns)})"
+                )
+            )
+
+
+def _add_foreign_keys(connection: Connection) -> None:
+    # Only foreign keys to tables that aren't partitioned are kept
+    partitioned = {table.name for table in PARTITIONED_TABLES}
+    for table in PARTITIONED_TABLES:
+        for foreign_key in table.foreign_keys:
+            target = foreign_key.column.table.name
+            if target in partitioned or target == Season.__tablename__:
+                continue
+            actions = "".join(
+                f" ON {event} {action}"
+                for event, action in (
+                    ("UPDATE", foreign_key.onupdate),
+                    ("DELETE", foreign_key.ondelete),
+                )
+                if action is not None
+            )
+            connection.execute(
+                text(
+                    f"ALTER TABLE {table.name} ADD FOREIGN KEY "
+                    f"({foreign_key.parent.name}) REFERENCES {target} "
+                    f"({foreign_key.column.name}){actions}"
+                )
+            )
+
+
+def _with_season_id(columns: list[str]) -> list[str]:
+    return columns if "season_id" in columns else ["season_id", *columns]
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import uuid
+from typing import Any
+
+from sqlalchemy import String, and_, bindparam, cast, func, select, update
+from sqlalchemy.orm import Session
+
+from ..models import Location, Season
+from ..navigation.export_season import iter_season_passages
+from ..navigation.import_twine import TwinePassage
+from ..navigation.story_analysis import StoryAnalysis, analyze_story
+
+"""
+Stored story analysis of seasons
+
+Imports store the distances of every location, see app/navigation/story_analysis.py.
+analyze_season computes them for a season in the database, for seasons imported before the
+analysis or edited outside an import, and season_analysis reads them back for the admin
+tools without walking the graph.
+"""
+
+# Passage names listed per problem by season_analysis
+ANALYSIS_NAME_LIMIT = 100
+
+
+def analyze_season(db_session: Session, season_id: uuid.UUID) -> StoryAnalysis:
+    """
+    Analyze a season from its stored locations and store the distances, in the session's
+    transaction
+
+    Returns:
+        StoryAnalysis: The analysis
+
+    Raises:
+        ValueError: If the season doesn't exist or has no genesis location
+    """
+    season = db_session.get(Season, season_id)
+    if season is None:
+        raise ValueError(f"Season {season_id} not found")
+    # Named like iter_season_passages names locations
+    start = db_session.execute(
+        select(func.coalesce(Location.name, cast(Location.id, String))).where(
+            Location.id == season.genesis_location_id,
+            Location.season_id == season_id,
+        )
+    ).scalar()
+    if start is None:
+        raise ValueError(f"Season {season.name} has no genesis location")
+
+    ids: list[uuid.UUID] = []
+    passages: list[TwinePassage] = []
+    for id, passage in iter_season_passages(db_session, season_id):
+        ids.append(id)
+        passages.append(passage)
+    analysis = analyze_story(passages, start)
+
+    rows = []
+    for position, id in enumerate(ids):
+        start_distance, ending_distance = analysis.distances(position)
+        rows.append(
+            {
+                "location_id": id,
+                "start_distance": start_distance,
+                "ending_distance": ending_distance,
+            }
+        )
+    locations = Location.__table__
+    db_session.execute(
+        update(locations)
+        .where(
+            locations.c.season_id == season_id,
+            locations.c.id == bindparam("location_id"),
+        )
+        .values(
+            start_distance=bindparam("start_distance"),
+            ending_distance=bindparam("ending_distance"),
+        ),
+        rows,
+    )
+    return analysis
+
+
+def season_analysis(db_session: Session, season_id: uuid.UUID) -> dict[str, Any] | None:
+    """
+    Read the stored analysis of a season, how many passages are unreachable, dead ends or
+    trapped, and the first ANALYSIS_NAME_LIMIT names of each
+
+    Returns:
+        dict[str, Any] | None: The analysis, None if the season doesn't exist or wasn't
+            analyzed
+    """
+    genesis_distance = db_session.execute(
+        select(Location.start_distance)
+        .join(Season, Season.genesis_location_id == Location.id)
+        .where(Season.id == season_id, Location.season_id == season_id)
+    ).scalar()
+    if genesis_distance is None:
+        return None
+
+    name = func.coalesce(Location.name, cast(Location.id, String))
+    problems = {
+        "unreachable": Location.start_distance.is_(None),
+        "dead_ends": Location.ending_distance == 0,
+        "trapped": and_(
+            Location.start_distance.is_not(None), Location.ending_distance.is_(None)
+        ),
+    }
+    result: dict[str, Any] = {
+        "season_id": season_id,
+        # The longest of the shortest ways to a location
+        "depth": db_session.execute(
+            select(func.max(Location.start_distance)).where(
+                Location.season_id == season_id
+            )
+        ).scalar(),
+    }
+    for problem, condition in problems.items():
+        where = (Location.season_id == season_id, condition)
+        result[problem] = {
+            "count": db_session.execute(
+                select(func.count()).select_from(Location).where(*where)
+            ).scalar_one(),
+            "names": list(
+                db_session.execute(
+                    select(name).where(*where).order_by(name).limit(ANALYSIS_NAME_LIMIT)
+                ).scalars()
+            ),
+        }
+    return result
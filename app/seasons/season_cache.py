@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import datetime
+import threading
+import time
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from .seasons import SeasonRecord
+
+"""
+Per-worker cache for the current (default) season
+
+The current season only changes when an admin makes a season default, deletes a season or
+imports a new one, so those paths invalidate it explicitly. The TTL is a safety net for
+changes made through other workers.
+
+The next scheduled season is cached alongside the current one, and every worker switches to
+it on its own at the scheduled time, without waiting for its cache to expire.
+"""
+
+
+class CurrentSeasonCache:
+    ttl: float
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._record: SeasonRecord | None = None
+        self._upcoming: SeasonRecord | None = None
+        self._expires_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(
+        self, loader: Callable[[], tuple[SeasonRecord, SeasonRecord | None]]
+    ) -> SeasonRecord:
+        """
+        Get the cached current season, calling the loader when it's missing or expired
+
+        Args:
+            loader: Resolves the current season and the next scheduled season, if any, from
+                the database
+
+        Returns:
+            SeasonRecord
+        """
+        with self._lock:
+            if self._record is not None and time.monotonic() < self._expires_at:
+                return self.__current(self._record, self._upcoming)
+            generation = self._generation
+
+        record, upcoming = loader()
+        with self._lock:
+            # Don't store a record that was loaded before an invalidation landed
+            if generation == self._generation:
+                self._record = record
+                self._upcoming = upcoming
+                self._expires_at = time.monotonic() + self.ttl
+        return self.__current(record, upcoming)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._record = None
+            self._upcoming = None
+            self._expires_at = 0.0
+            self._generation += 1
+
+    @staticmethod
+    def __current(record: SeasonRecord, upcoming: SeasonRecord | None) -> SeasonRecord:
+        if upcoming is not None and upcoming.publish_at is not None:
+            if upcoming.publish_at <= datetime.datetime.now(datetime.timezone.utc):
+                return upcoming
+        return record
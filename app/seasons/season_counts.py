@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import uuid
+from typing import Iterable
+
+from sqlalchemy import ColumnElement, Select, exists, func, select, update
+from sqlalchemy.dialects.postgresql import Insert
+from sqlalchemy.orm import Session
+
+from ..models import Decision, DecisionDestination, Location, Season, UserLocation
+
+"""
+Per-season row counts
+
+The count columns on seasons are adjusted in the same transaction as the rows they count,
+so the admin overview reads one row per season instead of counting every location.
+recount_seasons computes them from scratch, for seasons imported before the columns existed
+or rows written outside the app.
+"""
+
+
+def new_players(upsert: Insert) -> Select[tuple[uuid.UUID]]:
+    """
+    Run a user_locations upsert as a WITH query that selects the season of every player it
+    wrote who had no location in the season yet. Postgres only, SQLite can't put an INSERT
+    in a WITH query
+
+    The parts of a WITH query don't see each other's writes, so the player's row is looked
+    up as it was before the upsert. Two first moves of one player racing each other can
+    both be counted, recount_seasons corrects that.
+    """
+    moved = upsert.returning(UserLocation.season_id, UserLocation.user_id).cte("moved")
+    return select(moved.c.season_id).where(
+        ~is_player(moved.c.season_id, moved.c.user_id)
+    )
+
+
+def is_player(
+    season_id: uuid.UUID | ColumnElement[uuid.UUID],
+    user_id: uuid.UUID | ColumnElement[uuid.UUID],
+) -> ColumnElement[bool]:
+    """
+    Does the user have a location in the season?
+    """
+    return exists().where(
+        UserLocation.season_id == season_id, UserLocation.user_id == user_id
+    )
+
+
+def adjust_counts(
+    db_session: Session,
+    season_id: uuid.UUID,
+    locations: int = 0,
+    decisions: int = 0,
+    destinations: int = 0,
+    players: int = 0,
+) -> None:
+    """
+    Add to the counts of a season, in the session's transaction
+
+    Args:
+        season_id: The season id
+        locations, decisions, destinations, players: How many rows were added, negative for
+            rows that were removed
+    """
+    deltas = {
+        Season.location_count: locations,
+        Season.decision_count: decisions,
+        Season.destination_count: destinations,
+        Season.player_count: players,
+    }
+    values = {column.key: column + delta for column, delta in deltas.items() if delta}
+    if not values:
+        return
+    db_session.execute(
+        update(Season).where(Season.id == season_id).values(values),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def recount_seasons(
+    db_session: Session, season_ids: Iterable[uuid.UUID] | None = None
+) -> int:
+    """
+    Count the rows of seasons from scratch, in a single UPDATE
+
+    Args:
+        season_ids: The seasons to count, every season by default
+
+    Returns:
+        int: The number of seasons counted
+    """
+    stmt = update(Season).values(
+        location_count=select(func.count())
+        .select_from(Location)
+        .where(Location.season_id == Season.id)
+        .scalar_subquery(),
+        decision_count=select(func.count())
+        .select_from(Decision)
+        .join(Location, Decision.source_location_id == Location.id)
+        .where(Location.season_id == Season.id)
+        .scalar_subquery(),
+        destination_count=select(func.count())
+        .select_from(DecisionDestination)
+        .join(Decision)
+        .join(Location, Decision.source_location_id == Location.id)
+        .where(Location.season_id == Season.id)
+        .scalar_subquery(),
+        player_count=select(func.count())
+        .select_from(UserLocation)
+        .where(UserLocation.season_id == Season.id)
+        .scalar_subquery(),
+    )
+    if season_ids is not None:
+        stmt = stmt.where(Season.id.in_(list(season_ids)))
+    return db_session.execute(
+        stmt, execution_options={"synchronize_session": False}
+    ).rowcount
@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable
+
+from flask import Flask, current_app
+from sqlalchemy import String, cast, func, select
+from sqlalchemy.orm import Session
+
+from ..models import Decision, DecisionDestination, Location, Season
+
+try:
+    # Optional, only needed for season statistics
+    import numpy as np
+    from scipy import sparse
+    from scipy.sparse import csgraph, linalg
+except ImportError:
+    np = None  # type: ignore
+
+"""
+Balancing statistics of seasons, for players who choose uniformly at random
+
+A season is an absorbing Markov chain: every location moves to each of its destinations
+with equal probability, and locations without destinations (the endings) absorb. With Q the
+moves between the other locations and N = (I - Q)^-1 the expected visits, the row of N for
+the genesis location gives the expected number of moves to finish and, multiplied by the
+moves into the endings, the probability of reaching each ending. That row is one sparse
+linear solve, (I - Q)^T x = e_genesis, so no inverse is ever formed.
+
+Locations without a way to an ending (see app/navigation/story_analysis.py) are absorbing
+too: a player who reaches one is stuck, which stuck_probability reports.
+
+The statistics are cached per season on each worker, keyed by the season's content_version
+so any change in place recomputes them. NumPy and SciPy are declared in the
+Pipfile and requirements.txt, an install without them still runs but has no statistics.
+"""
+
+logger = logging.getLogger(__name__)
+
+# Endings listed per season, most likely first
+ENDING_LIMIT = 10
+# Relative tolerance of the iterative solve
+SOLVE_TOLERANCE = 1e-10
+# Systems up to this many locations are solved directly if the iterative solve doesn't
+# converge. Direct solves of larger stories can fill in to dense factors
+DIRECT_SOLVE_MAX_LOCATIONS = 5000
+
+
+@dataclass(frozen=True)
+class SeasonStats:
+    """
+    Statistics of a season under uniform random choice
+
+    Attributes:
+        expected_moves (float): Moves from the genesis location until an ending, or until
+            the player is stuck
+        stuck_probability (float): Probability of reaching a location without a way to an
+            ending
+        ending_probabilities (list[tuple[str, float]]): The ENDING_LIMIT most likely endings
+            and their probabilities
+        endings (int): How many endings the season has
+        seconds (float): How long the statistics took
+        error (str | None): Why there are no statistics, e.g. a season without a genesis
+            location
+    """
+
+    season_id: uuid.UUID
+    expected_moves: float = 0.0
+    stuck_probability: float = 0.0
+    ending_probabilities: list[tuple[str, float]] = field(default_factory=list)
+    endings: int = 0
+    seconds: float = 0.0
+    error: str | None = None
+
+
+def stats_available() -> bool:
+    return np is not None
+
+
+def compute_season_stats(db_session: Session, season_id: uuid.UUID) -> SeasonStats:
+    """
+    Load a season's locations and destinations and compute its statistics
+
+    Raises:
+        ValueError: If the season doesn't exist or has no genesis location, or the solve
+            doesn't converge
+        RuntimeError: If NumPy or SciPy aren't installed
+    """
+    if np is None:
+        raise RuntimeError("Season statistics need numpy and scipy")
+    started = time.perf_counter()
+    genesis_location_id = db_session.execute(
+        select(Season.genesis_location_id).where(Season.id == season_id)
+    ).scalar()
+    if genesis_location_id is None:
+        raise ValueError(f"Season {season_id} not found or without a genesis location")
+
+    index: dict[uuid.UUID, int] = {}
+    names: list[str] = []
+    for row in db_session.execute(
+        select(
+            Location.id, func.coalesce(Location.name, cast(Location.id, String))
+        ).where(Location.season_id == season_id)
+    ):
+        index[row[0]] = len(names)
+        names.append(row[1])
+    if genesis_location_id not in index:
+        raise ValueError(f"The genesis location of season {season_id} doesn't exist")
+
+    sources: list[int] = []
+    targets: list[int] = []
+    for source_id, target_id in db_session.execute(
+        select(Decision.source_location_id, DecisionDestination.destination_location_id)
+        .select_from(DecisionDestination)
+        .join(Decision)
+        .where(
+            Decision.season_id == season_id,
+            DecisionDestination.season_id == season_id,
+        )
+    ):
+        target = index.get(target_id)
+        if target is not None:
+            sources.append(index[source_id])
+            targets.append(target)
+
+    expected_moves, stuck, ending_indexes, probabilities = absorbing_chain(
+        len(names),
+        np.array(sources, dtype=np.int64),
+        np.array(targets, dtype=np.int64),
+        index[genesis_location_id],
+    )
+    order = np.argsort(-probabilities, kind="stable")[:ENDING_LIMIT]
+    return SeasonStats(
+        season_id=season_id,
+        expected_moves=expected_moves,
+        stuck_probability=stuck,
+        ending_probabilities=[
+            (names[ending_indexes[position]], float(probabilities[position]))
+            for position in order
+        ],
+        endings=len(ending_indexes),
+        seconds=time.perf_counter() - started,
+    )
+
+
+def absorbing_chain(
+    count: int, sources: np.ndarray, targets: np.ndarray, start: int
+) -> tuple[float, float, np.ndarray, np.ndarray]:
+    """
+    Solve the absorbing chain of a story graph for one start location
+
+    Args:
+        count (int): Number of locations
+        sources, targets: A link per position, as location indexes. Repeated links count
+            as separate choices
+        start (int): Index of the start location
+
+    Returns:
+        tuple[float, float, np.ndarray, np.ndarray]: Expected moves, the probability of
+        getting stuck, the indexes of the endings and the probability of each
+    """
+    links = np.bincount(sources, minlength=count)
+    endings = np.flatnonzero(links == 0)
+    # Every link of a location is equally likely, repeated entries add up
+    moves = sparse.csr_matrix(
+        (1.0 / links[sources], (sources, targets)), shape=(count, count)
+    )
+
+    # Locations with a way to an ending, searched back from an extra node linked to every
+    # ending
+    backwards = sparse.csr_matrix(
+        (
+            np.ones(len(targets) + len(endings)),
+            (
+                np.concatenate([targets, np.full(len(endings), count)]),
+                np.concatenate([sources, endings]),
+            ),
+        ),
+        shape=(count + 1, count + 1),
+    )
+    finishing = np.zeros(count + 1, dtype=bool)
+    finishing[
+        csgraph.breadth_first_order(
+            backwards, count, directed=True, return_predecessors=False
+        )
+    ] = True
+    finishing = finishing[:count]
+
+    if links[start] == 0:
+        probabilities = (endings == start).astype(float)
+        return 0.0, 0.0, endings, probabilities
+    if not finishing[start]:
+        return 0.0, 1.0, endings, np.zeros(len(endings))
+
+    transient = np.flatnonzero(finishing & (links > 0))
+    position = np.full(count, -1)
+    position[transient] = np.arange(len(transient))
+    from_transient = moves[transient]
+    system = (
+        sparse.identity(len(transient), format="csr") - from_transient[:, transient]
+    ).T.tocsr()
+    unit = np.zeros(len(transient))
+    unit[position[start]] = 1.0
+    # Expected visits to every transient location
+    visits = _solve(system, unit)
+
+    probabilities = np.clip(from_transient[:, endings].T @ visits, 0.0, 1.0)
+    stuck = max(0.0, 1.0 - float(probabilities.sum()))
+    return float(visits.sum()), stuck, endings, probabilities
+
+
+def _solve(system, right: np.ndarray) -> np.ndarray:
+    # LGMRES converges in a few iterations on story graphs, where a direct solve of a
+    # large story can take minutes
+    solution, info = linalg.lgmres(system, right, rtol=SOLVE_TOLERANCE, maxiter=1000)
+    if info == 0:
+        return solution
+    if system.shape[0] <= DIRECT_SOLVE_MAX_LOCATIONS:
+        return linalg.spsolve(system.tocsc(), right)
+    raise ValueError("The season statistics didn't converge")
+
+
+class SeasonStatsCache:
+    """
+    Statistics per season, computed in the background the first time they are asked for,
+    unless background is off
+
+    Attributes:
+        background (bool): Compute on a thread pool rather than in the caller
+        max_concurrent (int): How many seasons may be computed at once, the rest wait
+    """
+
+    background: bool
+    max_concurrent: int
+
+    def __init__(self, background: bool, max_concurrent: int = 1):
+        self.background = background
+        self.max_concurrent = max_concurrent
+        # Season id to the content_version the statistics were computed from
+        self._stats: dict[uuid.UUID, tuple[int, SeasonStats]] = {}
+        self._computing: set[uuid.UUID] = set()
+        self._lock = threading.Lock()
+        # Starts its workers lazily, on the first season computed
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrent, thread_name_prefix="season-stats"
+        )
+
+    def get(self, app: Flask, season: Season) -> SeasonStats | None:
+        """
+        Get the statistics of a season, starting to compute them if they aren't cached or
+        the season changed since
+
+        Returns:
+            SeasonStats | None: The statistics, None while they are computed or if NumPy
+            and SciPy aren't installed
+        """
+        if not stats_available():
+            return None
+        # Bumped by every change in place, see season_graph
+        version = season.content_version
+        with self._lock:
+            cached = self._stats.get(season.id)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            if season.id in self._computing:
+                return None
+            self._computing.add(season.id)
+
+        if not self.background:
+            self._compute(app, season.id, version)
+            return self._stats[season.id][1]
+        self._executor.submit(self._compute, app, season.id, version)
+        return None
+
+    def retain(self, season_ids: Iterable[uuid.UUID]) -> None:
+        """
+        Drop the statistics of every other season, e.g. of seasons that were deleted
+
+        Args:
+            season_ids (Iterable[uuid.UUID]): The seasons that still exist
+        """
+        keep = set(season_ids)
+        with self._lock:
+            for season_id in [id for id in self._stats if id not in keep]:
+                del self._stats[season_id]
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def _compute(self, app: Flask, season_id: uuid.UUID, version: int) -> None:
+        try:
+            with app.app_context():
+                with app.extensions["Session"]() as db_session:
+                    stats = compute_season_stats(db_session, season_id)
+        except Exception as e:
+            logger.exception("Failed to compute the statistics of season %s", season_id)
+            stats = SeasonStats(season_id, error=str(e))
+        with self._lock:
+            self._stats[season_id] = (version, stats)
+            self._computing.discard(season_id)
+
+
+def get_season_stats() -> SeasonStatsCache:
+    return current_app.extensions["season_stats"]
@@ -1,29 +1,101 @@
+from __future__ import annotations
+
 import datetime
 import uuid
+from dataclasses import dataclass
+from typing import Sequence
 
 from flask import current_app
-from sqlalchemy import func, select
+from sqlalchemy import delete, func, orm, select, update
 from sqlalchemy.exc import NoResultFound
 
-from ..models import Location, Season
+from ..models import Season
+from ..navigation.season_graph import get_season_graphs
+from . import partitions, season_counts
+from .season_cache import CurrentSeasonCache
 
 """
 Basic season getter functions until we have more need for season CRUD
+
+Imported seasons are staged: players only see them once they are published. Publishing
+schedules the cutover SEASON_PUBLISH_LEAD seconds ahead, so every worker compiles the
+season's graph before it goes live (see SEASON_PREWARM_WINDOW) and switches to it at the
+same moment. The first worker to resolve the current season after that time flips the
+default flag in the database.
 """
 
 
+@dataclass(frozen=True, slots=True)
+class SeasonRecord:
+    """
+    Immutable snapshot of a season row, safe to share between requests and threads
+    """
+
+    id: uuid.UUID
+    name: str
+    genesis_location_id: uuid.UUID | None
+    default: bool
+    date_created: datetime.datetime
+    origin_file: str | None
+    published_at: datetime.datetime | None = None
+    publish_at: datetime.datetime | None = None
+
+    @classmethod
+    def from_season(cls, season: Season) -> SeasonRecord:
+        return cls(
+            id=season.id,
+            name=season.name,
+            genesis_location_id=season.genesis_location_id,
+            default=season.default,
+            date_created=season.date_created,
+            origin_file=season.origin_file,
+            published_at=_utc(season.published_at),
+            publish_at=_utc(season.publish_at),
+        )
+
+
+def _utc(value: datetime.datetime | None) -> datetime.datetime | None:
+    # SQLite hands timestamps back without a timezone, they are stored in UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
 class SeasonStore:
     @staticmethod
-    def get_current_season() -> Season:
+    def get_current_season() -> SeasonRecord:
         """
         Get the current season based on the default flag
-        If no default season is set, get the latest season based on the version flag
+        If no default season is set, get the latest published season, or the latest season
+        if none has been published yet
+
+        Resolved from the database at most once per SEASON_CACHE_TTL seconds per worker,
+        see invalidate_current_season. Compiled season graphs are checked against the
+        seasons at the same time, see SeasonGraphCache.sync
 
         Returns:
-            Season
+            SeasonRecord
+        """
+        cache: CurrentSeasonCache = current_app.extensions["current_season"]
+        return cache.get(SeasonStore.__resolve_current_season)
+
+    @staticmethod
+    def invalidate_current_season() -> None:
         """
+        Drop the cached current season. Call this whenever a season is made default,
+        deleted or imported
+        """
+        cache: CurrentSeasonCache = current_app.extensions["current_season"]
+        cache.invalidate()
+
+    @staticmethod
+    def __resolve_current_season() -> tuple[SeasonRecord, SeasonRecord | None]:
+        SeasonStore.promote_due_seasons()
         Session = current_app.extensions["Session"]
         with Session() as db_session:
+            # Graphs compiled before another worker changed or deleted their season
+            versions = db_session.execute(select(Season.id, Season.content_version))
+            get_season_graphs().sync({row.id: row.content_version for row in versions})
             try:
                 season = (
                     db_session.execute(select(Season).filter(Season.default == True))
@@ -31,18 +103,190 @@ class SeasonStore:
                     .one()
                 )
             except NoResultFound:
-                # If no default season is set, get the latest season
+                # If no default season is set, get the latest published season
                 # This shouldn't happen but just in case we have a race condition
                 season = (
                     db_session.execute(
-                        select(Season).order_by(Season.date_created.desc())
+                        select(Season).order_by(
+                            Season.published_at.is_(None), Season.date_created.desc()
+                        )
                     )
                     .scalars()
                     .first()
                 )
                 if season is None:
                     raise ValueError("No seasons found")
-        return season
+            upcoming = (
+                db_session.execute(
+                    select(Season)
+                    .filter(Season.publish_at.is_not(None))
+                    .order_by(Season.publish_at)
+                )
+                .scalars()
+                .first()
+            )
+            record = SeasonRecord.from_season(season)
+            upcoming_record = (
+                SeasonRecord.from_season(upcoming) if upcoming is not None else None
+            )
+
+        window = current_app.config["SEASON_PREWARM_WINDOW"]
+        if upcoming_record is not None and upcoming_record.publish_at is not None:
+            starts_in = upcoming_record.publish_at - datetime.datetime.now(
+                datetime.timezone.utc
+            )
+            if starts_in.total_seconds() <= window:
+                get_season_graphs().prewarm(
+                    current_app._get_current_object(),  # type: ignore
+                    upcoming_record.id,
+                )
+        return record, upcoming_record
+
+    @staticmethod
+    def publish_season(
+        id: uuid.UUID, publish_at: datetime.datetime | None = None
+    ) -> datetime.datetime | None:
+        """
+        Schedule a season to become the current season
+
+        Args:
+            id (uuid.UUID): The season id
+            publish_at (datetime.datetime | None): When the season goes live. Defaults to
+                SEASON_PUBLISH_LEAD seconds from now, so every worker can prepare for it
+
+        Returns:
+            datetime.datetime | None: When the season goes live, None if it wasn't found
+        """
+        if publish_at is None:
+            publish_at = datetime.datetime.now(datetime.timezone.utc) + (
+                datetime.timedelta(seconds=current_app.config["SEASON_PUBLISH_LEAD"])
+            )
+        # Stored in UTC, SQLite compares timestamps as text
+        publish_at = _utc(publish_at).astimezone(datetime.timezone.utc)  # type: ignore
+        Session = current_app.extensions["Session"]
+        with Session.begin() as db_session:
+            result = db_session.execute(
+                update(Season).where(Season.id == id).values(publish_at=publish_at)
+            )
+        SeasonStore.invalidate_current_season()
+        return publish_at if result.rowcount > 0 else None
+
+    @staticmethod
+    def unschedule_season(id: uuid.UUID) -> bool:
+        """
+        Cancel a scheduled publish
+
+        Returns:
+            bool: Whether the season was found
+        """
+        Session = current_app.extensions["Session"]
+        with Session.begin() as db_session:
+            result = db_session.execute(
+                update(Season).where(Season.id == id).values(publish_at=None)
+            )
+        SeasonStore.invalidate_current_season()
+        return result.rowcount > 0
+
+    @staticmethod
+    def make_default(id: uuid.UUID) -> bool:
+        """
+        Make a season the current season right away
+
+        The season's graph is compiled first, which also reads its rows into the database's
+        buffer cache, so its first players don't pay for either. Other workers switch when
+        their current season cache expires, use publish_season for a coordinated cutover.
+
+        Returns:
+            bool: Whether the season was found
+        """
+        Session = current_app.extensions["Session"]
+        with Session() as db_session:
+            if db_session.get(Season, id) is None:
+                return False
+        get_season_graphs().get(id)
+        with Session.begin() as db_session:
+            found = SeasonStore.__flip_default(db_session, id)
+        SeasonStore.invalidate_current_season()
+        return found
+
+    @staticmethod
+    def promote_due_seasons() -> uuid.UUID | None:
+        """
+        Make the latest season whose scheduled publish time has passed the default
+
+        Every worker calls this when resolving the current season, the first one after the
+        scheduled time does the flip and the rest find nothing due.
+
+        Returns:
+            uuid.UUID | None: The promoted season, None if no season was due
+        """
+        now = datetime.datetime.now(datetime.timezone.utc)
+        Session = current_app.extensions["Session"]
+        with Session.begin() as db_session:
+            due = (
+                db_session.execute(
+                    select(Season.id)
+                    .filter(Season.publish_at <= now)
+                    .order_by(Season.publish_at.desc())
+                    .with_for_update()
+                )
+                .scalars()
+                .all()
+            )
+            if not due:
+                return None
+            # Seasons scheduled before the latest one are published, but never current
+            db_session.execute(
+                update(Season)
+                .where(Season.id.in_(due))
+                .values(
+                    published_at=func.coalesce(Season.published_at, Season.publish_at),
+                    publish_at=None,
+                )
+            )
+            SeasonStore.__flip_default(db_session, due[0])
+        return due[0]
+
+    @staticmethod
+    def __flip_default(db_session: orm.Session, id: uuid.UUID) -> bool:
+        # Only the old and new default rows are written, in one transaction, so other
+        # sessions see one season or the other as the default and never both
+        db_session.execute(
+            update(Season)
+            .where(Season.default.is_(True), Season.id != id)
+            .values(default=False)
+        )
+        result = db_session.execute(
+            update(Season)
+            .where(Season.id == id)
+            .values(
+                default=True,
+                published_at=func.coalesce(
+                    Season.published_at, datetime.datetime.now(datetime.timezone.utc)
+                ),
+                publish_at=None,
+            )
+        )
+        return result.rowcount > 0
+
+    @staticmethod
+    def get_season_by_content_hash(content_hash: str) -> SeasonRecord | None:
+        """
+        Get the season imported from identical Twee content, see import_twine.content_hash
+
+        Returns:
+            SeasonRecord | None
+        """
+        Session = current_app.extensions["Session"]
+        with Session() as db_session:
+            season = (
+                db_session.execute(
+                    select(Season).filter(Season.content_hash == content_hash)
+                )
+                .scalars()
+                .first()
+            )
+            return SeasonRecord.from_season(season) if season is not None else None
 
     @staticmethod
     def get_season_by_id(id: uuid.UUID) -> Season:
@@ -65,10 +309,13 @@ class SeasonStore:
         return season
 
     @staticmethod
-    def fetch_seasons_with_counts() -> list[tuple[Season, int]]:
+    def fetch_seasons_with_counts() -> list[Season]:
         """
-        Fetch all seasons with location count
-        For admin pages only! Location counting will get expensive over time
+        Fetch all seasons, oldest first, with their location, decision, destination and
+        player counts
+
+        The counts are columns kept up to date as seasons are written (see season_counts),
+        so this reads one row per season however much content is stored
 
         Returns:
             list[Season]
@@ -76,17 +323,63 @@ class SeasonStore:
         Session = current_app.extensions["Session"]
         with Session() as db_session:
             stmt = select(Season).order_by(Season.date_created.asc())
-            seasons = db_session.execute(stmt).scalars().all()
-            stmt = select(func.count(Location.id), Location.season_id).group_by(
-                Location.season_id
-            )
-            results = db_session.execute(stmt).all()
+            return list(db_session.execute(stmt).scalars().all())
+
+    @staticmethod
+    def recount_seasons(ids: Sequence[uuid.UUID] | None = None) -> int:
+        """
+        Count the rows of seasons from scratch, e.g. for seasons imported before the count
+        columns existed. Each season is counted in its own transaction, so players only
+        wait on the season being counted
+
+        Args:
+            ids (Sequence[uuid.UUID] | None): The seasons to count, every season by default
+
+        Returns:
+            int: The number of seasons counted
+        """
+        Session = current_app.extensions["Session"]
+        if ids is None:
+            with Session() as db_session:
+                ids = db_session.execute(select(Season.id)).scalars().all()
+        counted = 0
+        for id in ids:
+            with Session.begin() as db_session:
+                counted += season_counts.recount_seasons(db_session, [id])
+        return counted
+
+    @staticmethod
+    def bump_content_version(db_session: orm.Session, id: uuid.UUID) -> None:
+        """
+        Mark a season's content as changed, so every worker recompiles its graph. Call this
+        in the transaction that changes the content
+        """
+        db_session.execute(
+            update(Season)
+            .where(Season.id == id)
+            .values(content_version=Season.content_version + 1)
+        )
 
-        location_counts: dict[uuid.UUID, int] = {
-            row.season_id: int(row[0]) for row in results
-        }
+    @staticmethod
+    def delete_season(id: uuid.UUID) -> bool:
+        """
+        Delete a season with its locations, decisions and player positions
 
-        return [(season, location_counts.get(season.id, 0)) for season in seasons]
+        With partitioned tables (see partitions) the season row is deleted on its own and
+        the season's partitions are dropped. Otherwise the delete cascades to every row of
+        the season.
+
+        Returns:
+            bool: Whether the season was found
+        """
+        Session = current_app.extensions["Session"]
+        with Session.begin() as db_session:
+            result = db_session.execute(delete(Season).where(Season.id == id))
+        # Also cleans up after a delete whose partitions weren't all dropped
+        partitions.drop_season_partitions(current_app.extensions["engine"], id)
+        get_season_graphs().invalidate(id)
+        SeasonStore.invalidate_current_season()
+        return result.rowcount > 0
 
     @staticmethod
     def create_season(name: str, origin_file: str) -> uuid.UUID:
@@ -109,5 +402,6 @@ class SeasonStore:
         )
         with Session.begin() as db_session:
             db_session.add(season)
+        partitions.create_season_partitions(current_app.extensions["engine"], id)
 
         return id
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+import uuid
+from collections import Counter
+
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+
+from ..models import UserLocation
+from ..seasons.season_counts import adjust_counts, new_players
+
+"""
+Write-behind buffer for user positions
+
+Instead of committing one upsert per move, the latest position of each player is kept in
+memory and written out as multi-row upserts, either every flush_interval seconds or as soon
+as max_pending players are waiting. A crash can lose at most the positions buffered since the
+last flush, which is bounded by those two settings. The buffer is flushed on shutdown.
+"""
+
+logger = logging.getLogger(__name__)
+
+PositionKey = tuple[uuid.UUID, uuid.UUID]
+
+
+class PositionBuffer:
+    """
+    Coalesces user location writes per (season_id, user_id)
+
+    Attributes:
+        flush_interval (float): Maximum seconds a position may wait before being written
+        max_pending (int): Number of buffered players that triggers an early flush
+        batch_size (int): Maximum rows per upsert statement
+    """
+
+    flush_interval: float
+    max_pending: int
+    batch_size: int
+
+    def __init__(
+        self,
+        Session: sessionmaker,
+        flush_interval: float,
+        max_pending: int,
+        batch_size: int = 1000,
+    ):
+        self.Session = Session
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self._pending: dict[PositionKey, uuid.UUID] = {}
+        # Positions taken by a flush that hasn't committed yet, still served to readers
+        self._inflight: dict[PositionKey, uuid.UUID] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """
+        Start the background flusher and make sure the buffer is flushed on shutdown
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="position-buffer", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self) -> None:
+        """
+        Stop the background flusher and write out everything still buffered
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def set(
+        self, season_id: uuid.UUID, user_id: uuid.UUID, location_id: uuid.UUID
+    ) -> None:
+        with self._lock:
+            self._pending[(season_id, user_id)] = location_id
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def get(self, season_id: uuid.UUID, user_id: uuid.UUID) -> uuid.UUID | None:
+        """
+        Get a buffered position that may not have been written yet
+
+        Returns:
+            uuid.UUID | None: The buffered location id, or None if nothing is buffered
+        """
+        key = (season_id, user_id)
+        with self._lock:
+            return self._pending.get(key) or self._inflight.get(key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """
+        Write every buffered position as batched multi-row upserts
+
+        Positions that violate a foreign key are dropped rather than retried, so one bad
+        position can't hold up every other player's.
+
+        Returns:
+            int: The number of positions written
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                self._inflight, self._pending = self._pending, {}
+                positions = list(self._inflight.items())
+
+            try:
+                try:
+                    self.__write(positions)
+                    written = len(positions)
+                except IntegrityError:
+                    # A location or player that doesn't exist (any more) fails the whole
+                    # batch, so write one at a time and drop the ones that fail
+                    written = self.__write_each(positions)
+            except Exception:
+                logger.exception("Failed to flush %d user locations", len(positions))
+                with self._lock:
+                    # Put the positions back, unless the player has moved on since
+                    for key, location_id in self._inflight.items():
+                        self._pending.setdefault(key, location_id)
+                    self._inflight = {}
+                return 0
+
+            with self._lock:
+                self._inflight = {}
+            return written
+
+    def __write(self, positions: list[tuple[PositionKey, uuid.UUID]]) -> None:
+        with self.Session.begin() as db_session:
+            new_players: Counter[uuid.UUID] = Counter()
+            for start in range(0, len(positions), self.batch_size):
+                new_players.update(
+                    self.__upsert(
+                        db_session, positions[start : start + self.batch_size]
+                    )
+                )
+            # In a fixed order, so concurrent flushes can't deadlock on seasons
+            for season_id in sorted(new_players):
+                adjust_counts(db_session, season_id, players=new_players[season_id])
+
+    def __write_each(self, positions: list[tuple[PositionKey, uuid.UUID]]) -> int:
+        written = 0
+        for position in positions:
+            try:
+                self.__write([position])
+                written += 1
+            except IntegrityError:
+                (season_id, user_id), location_id = position
+                logger.warning(
+                    "Dropped the position of user %s in season %s at location %s, "
+                    "which doesn't exist",
+                    user_id,
+                    season_id,
+                    location_id,
+                )
+        return written
+
+    @staticmethod
+    def __upsert(
+        db_session: Session, positions: list[tuple[PositionKey, uuid.UUID]]
+    ) -> list[uuid.UUID]:
+        """
+        Write a batch of positions as one multi-row upsert
+
+        Returns:
+            list[uuid.UUID]: The season of every player new to their season
+        """
+        stmt = insert(UserLocation).values(
+            [
+                {"season_id": season_id, "user_id": user_id, "location_id": location_id}
+                for (season_id, user_id), location_id in positions
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["season_id", "user_id"],
+            set_={"location_id": stmt.excluded.location_id},
+        )
+        if db_session.get_bind().dialect.name == "postgresql":
+            return list(db_session.execute(new_players(stmt)).scalars())
+
+        keys = [key for key, _ in positions]
+        existing = set(
+            db_session.execute(
+                select(UserLocation.season_id, UserLocation.user_id).where(
+                    tuple_(UserLocation.season_id, UserLocation.user_id).in_(keys)
+                )
+            ).tuples()
+        )
+        db_session.execute(stmt)
+        return [
+            season_id
+            for season_id, user_id in keys
+            if (season_id, user_id) not in existing
+        ]
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("User location flusher failed")
@@ -1,10 +1,14 @@
 import uuid
 
+from flask import current_app
 from sqlalchemy import select
-from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.dialects.postgresql import Insert, insert
+from sqlalchemy.orm import Session
 
 from ..db import get_db_session
 from ..models import UserLocation
+from ..seasons.season_counts import adjust_counts, is_player, new_players
+from .position_buffer import PositionBuffer
 
 """
 User location store
@@ -12,6 +16,16 @@ User location store
 
 
 class UserLocationStore:
+    @staticmethod
+    def get_buffer() -> PositionBuffer | None:
+        """
+        Get the write-behind buffer, if USER_LOCATION_WRITE_BEHIND is enabled
+
+        Returns:
+            PositionBuffer | None
+        """
+        return current_app.extensions.get("position_buffer")
+
     @staticmethod
     def fetch(
         season_id: uuid.UUID,
@@ -20,9 +34,20 @@ class UserLocationStore:
         """
         Get a user location by user id
 
+        Positions still waiting in the write-behind buffer are returned first, so a player
+        always reads their own latest move
+
         Returns:
             UserLocations
         """
+        buffer = UserLocationStore.get_buffer()
+        if buffer is not None:
+            location_id = buffer.get(season_id, user_id)
+            if location_id is not None:
+                return UserLocation(
+                    season_id=season_id, user_id=user_id, location_id=location_id
+                )
+
         user_location = (
             get_db_session()
             .execute(
@@ -36,18 +61,18 @@ class UserLocationStore:
         return user_location
 
     @staticmethod
-    def set(
+    def upsert_statement(
         season_id: uuid.UUID, user_id: uuid.UUID, location_id: uuid.UUID
-    ) -> UserLocation:
+    ) -> Insert:
         """
-        Set a user location
+        Build the upsert for a user location, so callers can compose it with other statements
 
         Args:
             season_id (uuid.UUID): The season id
             user_id (uuid.UUID): The user id
             location_id (uuid.UUID): The location id
         """
-        stmt = (
+        return (
             insert(UserLocation)
             .values(season_id=season_id, user_id=user_id, location_id=location_id)
             .on_conflict_do_update(
@@ -55,10 +80,56 @@ class UserLocationStore:
                 set_={"location_id": location_id},
             )
         )
+
+    @staticmethod
+    def upsert(
+        db_session: Session,
+        season_id: uuid.UUID,
+        user_id: uuid.UUID,
+        location_id: uuid.UUID,
+    ) -> bool:
+        """
+        Write a user location in the session's transaction, counting players new to the
+        season in the season's player_count
+
+        Returns:
+            bool: Whether this is the player's first location in the season
+        """
+        stmt = UserLocationStore.upsert_statement(season_id, user_id, location_id)
+        if db_session.get_bind().dialect.name == "postgresql":
+            inserted = db_session.execute(new_players(stmt)).first() is not None
+        else:
+            inserted = not db_session.execute(
+                select(is_player(season_id, user_id))
+            ).scalar_one()
+            db_session.execute(stmt)
+        if inserted:
+            adjust_counts(db_session, season_id, players=1)
+        return inserted
+
+    @staticmethod
+    def set(
+        season_id: uuid.UUID, user_id: uuid.UUID, location_id: uuid.UUID
+    ) -> UserLocation:
+        """
+        Set a user location
+
+        Args:
+            season_id (uuid.UUID): The season id
+            user_id (uuid.UUID): The user id
+            location_id (uuid.UUID): The location id
+        """
+        buffer = UserLocationStore.get_buffer()
+        if buffer is not None:
+            buffer.set(season_id, user_id, location_id)
+            return UserLocation(
+                season_id=season_id, user_id=user_id, location_id=location_id
+            )
+
         # TODO: Verify that the user is allowed to set this location based on the season and user's current location
         # For now we just blindly trust we can set this new location
         db_session = get_db_session()
-        db_session.execute(stmt)
+        UserLocationStore.upsert(db_session, season_id, user_id, location_id)
         db_session.commit()
 
         return UserLocation(
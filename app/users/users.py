@@ -1,6 +1,6 @@
 from typing import Sequence
 
-from flask import current_app, session
+from flask import current_app, g, session
 from sqlalchemy import or_, select
 
 from ..db import get_db_session
@@ -51,6 +51,9 @@ class UserStore:
         """
         Get the current user from the session
 
+        The user is looked up at most once per request (per session email), every other call
+        in the same request is served from flask.g
+
         Returns:
             User | None: The current user, or None if there is no user in the session
         """
@@ -58,10 +61,15 @@ class UserStore:
             return None
         email: str = str(session.get("user").get("email"))  # type: ignore
 
+        cached: tuple[str, User | None] | None = g.get("_current_user")
+        if cached is not None and cached[0] == email:
+            return cached[1]
+
         Session = current_app.extensions["Session"]
         with Session() as db_session:
             user = db_session.query(User).filter(User.email == email).one_or_none()
 
+        g._current_user = (email, user)
         return user
 
     @staticmethod
@@ -76,3 +84,16 @@ class UserStore:
         if not user:
             return False
         return user.is_admin
+
+    @staticmethod
+    def inject_user() -> dict:
+        """
+        Template context processor shared by every blueprint
+
+        Returns:
+            dict: The current user and the current_user_is_admin helper
+        """
+        return dict(
+            user=UserStore.get_current_user(),
+            current_user_is_admin=UserStore.current_user_is_admin,
+        )
@@ -1,9 +1,10 @@
 import uuid
 
 
-# check if an input string is a valid UUID4 string
+# check if an input string is a valid UUID string. Imported locations have uuid5 ids, so
+# any version is accepted as is
 def uuid_validate(uuid_str: str) -> uuid.UUID | None:
     try:
-        return uuid.UUID(uuid_str, version=4)
+        return uuid.UUID(uuid_str)
     except ValueError:
         return None
@@ -0,0 +1,96 @@
+import argparse
+import json
+import random
+from typing import Iterator, TextIO
+
+"""
+Synthetic Twee stories for benchmarks
+
+Every passage links to the next one, so the whole story is reachable from the start, plus
+(branching - 1) links to random passages. The last passage is the only ending.
+"""
+
+WORDS = (
+    "the a you field honey tree cloud sun door key river stone path dark light old "
+    "wind shadow voice cave bridge tower lantern map whisper forest gate wall fire"
+).split()
+
+
+def generate_story(
+    passages: int,
+    branching: int = 2,
+    passage_length: int = 200,
+    seed: int = 0,
+) -> Iterator[str]:
+    """
+    Generate a Twee story, line by line, so even a million passages never sit in memory
+
+    Args:
+        passages (int): Number of passages, not counting StoryTitle and StoryData
+        branching (int): Links from every passage but the last
+        passage_length (int): Approximate characters of text per passage
+        seed (int): Seed for the random text and links, the same seed gives the same story
+
+    Yields:
+        str: Lines of the story, each ending in a newline
+    """
+    rng = random.Random(seed)
+    yield ":: StoryTitle\n"
+    yield f"Synthetic story, {passages} passages\n\n"
+    yield ":: StoryData\n"
+    story_data = {
+        "ifid": f"00000000-0000-4000-8000-{seed:012d}",
+        "format": "Harlowe",
+        "format-version": "3.3.9",
+        "start": "Passage 0",
+        "zoom": 1,
+    }
+    yield json.dumps(story_data, indent=2) + "\n\n"
+
+    for index in range(passages):
+        yield f':: Passage {index} {{"position":"{index % 100 * 125},{index // 100 * 125}"}}\n'
+        words: list[str] = []
+        length = 0
+        while length < passage_length:
+            word = rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        yield " ".join(words).capitalize() + ".\n"
+        if index < passages - 1:
+            yield f"[[Go on->Passage {index + 1}]]\n"
+            for choice in range(1, branching):
+                yield f"[[Choice {choice}->Passage {rng.randrange(passages)}]]\n"
+        else:
+            yield "THE END\n"
+        yield "\n"
+
+
+def write_story(file: TextIO, passages: int, **options) -> int:
+    """
+    Write a generated story to a file
+
+    Returns:
+        int: Characters written
+    """
+    written = 0
+    for line in generate_story(passages, **options):
+        written += file.write(line)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic Twee story")
+    parser.add_argument("output", type=argparse.FileType("w", encoding="utf-8"))
+    parser.add_argument("--passages", type=int, default=1000)
+    parser.add_argument("--branching", type=int, default=2)
+    parser.add_argument("--passage-length", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with args.output:
+        write_story(
+            args.output,
+            args.passages,
+            branching=args.branching,
+            passage_length=args.passage_length,
+            seed=args.seed,
+        )
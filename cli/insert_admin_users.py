@@ -4,14 +4,14 @@ import sys
 # Add the parent directory to the sys.path to allow absolute imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from sqlalchemy import create_engine, select
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import select
 
+from app import create_app
 from app.models import User
-from config import MainConfig
 
-engine = create_engine(MainConfig.SQLALCHEMY_DATABASE_URI)
-Session = sessionmaker(bind=engine)
+# Use the app's engine and pool rather than building a separate one
+app = create_app("config.MainConfig")
+Session = app.extensions["Session"]
 
 admin_users = os.getenv("ADMIN_USERS", "").split(",")
 with Session.begin() as session:
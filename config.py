@@ -3,6 +3,54 @@ import os
 
 class Config:
     TESTING: bool = False
+    SQLALCHEMY_POOL_PREWARM: int = 0
+    # Memory budget for compiled season graphs held by each worker
+    SEASON_GRAPH_CACHE_BYTES: int = int(
+        os.getenv("SEASON_GRAPH_CACHE_BYTES", str(64 * 1024 * 1024))
+    )
+    # Safety net for how long a worker may serve a stale current season, in seconds
+    SEASON_CACHE_TTL: float = float(os.getenv("SEASON_CACHE_TTL", "60"))
+    # Publishing a season schedules the cutover this many seconds ahead, longer than
+    # SEASON_CACHE_TTL so every worker has seen the schedule before the season goes live
+    SEASON_PUBLISH_LEAD: float = float(os.getenv("SEASON_PUBLISH_LEAD", "120"))
+    # Workers compile the graph of a season scheduled to go live within this many seconds,
+    # 0 turns it off
+    SEASON_PREWARM_WINDOW: float = float(os.getenv("SEASON_PREWARM_WINDOW", "600"))
+    # Compute season statistics for the admin seasons page in the background, see
+    # app/seasons/season_stats.py. Off, the page waits for them
+    SEASON_STATS_BACKGROUND: bool = (
+        os.getenv("SEASON_STATS_BACKGROUND", "true").lower() == "true"
+    )
+    # How many seasons have their statistics computed at once, each loads the whole season
+    SEASON_STATS_MAX_CONCURRENT: int = int(
+        os.getenv("SEASON_STATS_MAX_CONCURRENT", "1")
+    )
+    # Buffer user location writes in memory and flush them in batches. At most
+    # USER_LOCATION_FLUSH_INTERVAL seconds (or USER_LOCATION_FLUSH_MAX_PENDING players) of
+    # progress can be lost if a worker dies without shutting down cleanly
+    USER_LOCATION_WRITE_BEHIND: bool = (
+        os.getenv("USER_LOCATION_WRITE_BEHIND", "false").lower() == "true"
+    )
+    USER_LOCATION_FLUSH_INTERVAL: float = float(
+        os.getenv("USER_LOCATION_FLUSH_INTERVAL", "2")
+    )
+    USER_LOCATION_FLUSH_MAX_PENDING: int = int(
+        os.getenv("USER_LOCATION_FLUSH_MAX_PENDING", "1000")
+    )
+    # Imports run in the background. IMPORT_MAX_CONCURRENT caps how many run at once and
+    # IMPORT_PARSE_PROCESSES sizes the parsing process pool (0 parses on the import thread)
+    IMPORT_MAX_CONCURRENT: int = int(os.getenv("IMPORT_MAX_CONCURRENT", "1"))
+    IMPORT_PARSE_PROCESSES: int = int(os.getenv("IMPORT_PARSE_PROCESSES", "2"))
+    # Largest request accepted, checked before the body is read. Uploads are held in memory
+    MAX_CONTENT_LENGTH: int = int(
+        os.getenv("IMPORT_MAX_UPLOAD_BYTES", str(64 * 1024 * 1024))
+    )
+    # Largest story accepted once a compressed upload is decompressed
+    IMPORT_MAX_STORY_BYTES: int = int(
+        os.getenv("IMPORT_MAX_STORY_BYTES", str(256 * 1024 * 1024))
+    )
+    # Keep a copy of every upload in this folder. Uploads aren't written to disk if unset
+    IMPORT_ARCHIVE_FOLDER: str | None = os.getenv("IMPORT_ARCHIVE_FOLDER")
 
 
 class MainConfig(Config):
@@ -20,10 +68,26 @@ class MainConfig(Config):
         f"postgresql://{POSTGRES_USER}:{POSTGRES_PW}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
     )
     SQLALCHEMY_TRACK_MODIFICATIONS: bool = False
+    # Connection pool for each worker. Size it so workers * (pool_size + max_overflow)
+    # stays below the Postgres max_connections
+    SQLALCHEMY_ENGINE_OPTIONS: dict = {
+        "pool_size": int(os.getenv("SQLALCHEMY_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("SQLALCHEMY_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("SQLALCHEMY_POOL_TIMEOUT", "30")),
+        "pool_pre_ping": os.getenv("SQLALCHEMY_POOL_PRE_PING", "true").lower()
+        == "true",
+        "pool_recycle": int(os.getenv("SQLALCHEMY_POOL_RECYCLE", "1800")),
+    }
+    # Connections each worker opens at startup
+    SQLALCHEMY_POOL_PREWARM: int = int(os.getenv("SQLALCHEMY_POOL_PREWARM", "0"))
 
 
 class TestConfig(Config):
     TESTING: bool = True
+    IMPORT_PARSE_PROCESSES: int = 0
+    # Background threads would share the single in-memory database connection
+    SEASON_PREWARM_WINDOW: float = 0
+    SEASON_STATS_BACKGROUND: bool = False
     SECRET_KEY: str = "test"
     SQLALCHEMY_DATABASE_URI: str = "sqlite:///:memory:"
     SQLALCHEMY_TRACK_MODIFICATIONS: bool = False
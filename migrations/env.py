@@ -5,6 +5,8 @@ from flask import current_app
 
 from alembic import context
 
+from app.seasons.partitions import is_partition_name
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -90,9 +92,15 @@ def run_migrations_online():
                 directives[:] = []
                 logger.info('No changes in schema detected.')
 
+    # Season partitions (see app/seasons/partitions.py) aren't in the models
+    def include_object(object, name, type_, reflected, compare_to):
+        return not (type_ == "table" and reflected and is_partition_name(name))
+
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
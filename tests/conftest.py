@@ -4,7 +4,7 @@ from flask.testing import FlaskClient, FlaskCliRunner
 from sqlalchemy.engine.base import Engine
 
 from app import create_app
-from app.models import Base
+from app.models import Base, User
 
 
 @pytest.fixture()
@@ -29,3 +29,17 @@ def client(app: Flask) -> FlaskClient:
 @pytest.fixture()
 def runner(app: Flask) -> FlaskCliRunner:
     return app.test_cli_runner()
+
+
+@pytest.fixture()
+def admin_client(app: Flask) -> FlaskClient:
+    # The admin routes need an admin in the session
+    email = "admin@example.com"
+    with app.extensions["Session"].begin() as db_session:
+        db_session.add(
+            User(username="admin", email=email, phone=9999999999, is_admin=True)
+        )
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["user"] = {"email": email}
+    return client
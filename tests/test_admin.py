@@ -0,0 +1,44 @@
+import uuid
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+
+from app.models import User
+
+ADMIN_ROUTES = [
+    ("GET", "/admin/users"),
+    ("GET", "/admin/seasons"),
+    ("GET", "/admin/import_jobs/{id}"),
+    ("POST", "/admin/upload"),
+    ("GET", "/admin/export/{id}"),
+    ("GET", "/admin/analysis/{id}"),
+    ("POST", "/admin/delete_season/{id}"),
+    ("POST", "/admin/make_default/{id}"),
+    ("POST", "/admin/publish/{id}"),
+    ("POST", "/admin/unschedule/{id}"),
+]
+
+
+class TestAdminRoutes:
+    @pytest.fixture(autouse=True)
+    def setup(self, app: Flask, client: FlaskClient):
+        self.app = app
+        self.client = client
+        user = User(username="user1", email="user1@example.com", phone=1111111111)
+        with app.extensions["Session"].begin() as db_session:
+            db_session.add(user)
+
+    @pytest.mark.parametrize("method,route", ADMIN_ROUTES)
+    @pytest.mark.parametrize("email", [None, "user1@example.com"])
+    def test_requires_admin(self, method: str, route: str, email: str | None):
+        if email is not None:
+            with self.client.session_transaction() as session:
+                session["user"] = {"email": email}
+        response = self.client.open(route.format(id=uuid.uuid4()), method=method)
+        assert response.status_code == 403
+
+    def test_admin(self, admin_client: FlaskClient):
+        response = admin_client.get(f"/admin/export/{uuid.uuid4()}")
+        # Past the admin check, to the missing season
+        assert response.status_code == 404
@@ -0,0 +1,135 @@
+import io
+import json
+import uuid
+
+import pytest
+
+from app.navigation.import_twine import ImportTwine
+from benchmarks import import_benchmark, player_simulator
+from benchmarks.story_generator import generate_story
+
+
+class TestBenchmarks:
+    def test_generate_story(self):
+        source = "".join(generate_story(50, branching=3, passage_length=40, seed=1))
+        # The same seed gives the same story
+        assert source == "".join(
+            generate_story(50, branching=3, passage_length=40, seed=1)
+        )
+
+        twine = ImportTwine("synthetic.twee", "synthetic.twee")
+        passages = list(twine.iter_passages(io.StringIO(source)))
+        assert len(passages) == 50
+        assert twine.metadata is not None
+        assert twine.metadata["start"] == "Passage 0"
+        assert all(len(passage.links) == 3 for passage in passages[:-1])
+        assert passages[-1].links == []
+        assert all(len(passage.content) >= 40 for passage in passages)
+
+    def test_benchmark_report(self, tmp_path):
+        output = tmp_path / "bench.json"
+        args = ["--passages", "20,40", "--story-dir", str(tmp_path)]
+        assert import_benchmark.main(args + ["--output", str(output)]) == 0
+
+        report = json.loads(output.read_text())
+        assert [result["story"]["passages"] for result in report["results"]] == [20, 40]
+        result = report["results"][1]
+        assert result["database"] == "sqlite:///:memory:"
+        # 40 locations, 40 decisions and 2 destinations from all but the last passage
+        assert result["insert"]["rows"] == 40 + 40 + 2 * 39
+        assert result["parse"]["peak_bytes"] > 0
+        assert result["insert"]["rows_per_second"] > 0
+
+        baseline = report["results"]
+        current = json.loads(output.read_text())["results"]
+        assert import_benchmark.find_regressions(current, baseline, 0.2) == []
+        for before, result in zip(baseline, current):
+            result["parse"]["seconds"] = before["parse"]["seconds"] * 2
+        regressions = import_benchmark.find_regressions(current, baseline, 0.2)
+        assert len(regressions) == 2
+        assert "20 passages: parse took 2.00x as long" in regressions[0]
+
+    def test_benchmark_report_on_stdout(self, tmp_path, capsys):
+        args = ["--passages", "20", "--story-dir", str(tmp_path), "--no-memory"]
+        assert import_benchmark.main(args) == 0
+
+        # Progress goes to stderr, so stdout is just the report
+        captured = capsys.readouterr()
+        report = json.loads(captured.out)
+        assert report["results"][0]["story"]["passages"] == 20
+        assert "20 passages: parse" in captured.err
+
+    def test_player_simulator(self):
+        # Start -> Hall or End, Hall -> End
+        np = player_simulator.np
+        graph = player_simulator.WalkGraph(
+            location_ids=[uuid.uuid4() for _ in range(3)],
+            descriptions=["Start", "Hall", "End"],
+            offsets=np.array([0, 2, 3, 3]),
+            targets=np.array([1, 2, 2]),
+            start=0,
+        )
+        options = {
+            "think_time": player_simulator.parse_think_time("constant:10"),
+            "session_length": player_simulator.parse_session_length("ending"),
+            "arrival_seconds": 0,
+            "flush_interval": 60,
+            "record": 2,
+        }
+        simulation = player_simulator.simulate(
+            graph, 1000, policy=player_simulator.parse_policy("first"), **options
+        )
+        report = player_simulator.simulation_report(graph, simulation, 1000)
+        # Everyone opens the season at 0s, moves to Hall at 10s and to End at 20s
+        assert report["seconds"] == 21
+        assert report["routes"]["main.play"]["requests"] == 1000
+        assert report["routes"]["main.play_location"]["requests"] == 2000
+        assert report["routes"]["main.play_location"]["peak_per_second"] == 1000
+        assert report["writes"]["user_locations"]["rows"] == 3000
+        # All within one flush interval
+        assert report["writes"]["user_locations_write_behind"]["rows"] == 1000
+        assert [location["description"] for location in report["hot_locations"]] == [
+            "Start",
+            "Hall",
+            "End",
+        ]
+        assert report["sessions"]["finished"] == 1
+        assert [tuple(row) for row in np.concatenate(simulation.events)] == [
+            (0, 0, 0),
+            (0, 1, 0),
+            (10, 0, 1),
+            (10, 1, 1),
+            (20, 0, 2),
+            (20, 1, 2),
+        ]
+
+        # Half the players go straight to End, in batches
+        simulation = player_simulator.simulate(
+            graph,
+            10000,
+            policy=player_simulator.parse_policy("uniform"),
+            batch_size=3000,
+            **options,
+        )
+        assert simulation.moves == pytest.approx(15000, rel=0.05)
+        assert simulation.finished == 10000
+
+        with pytest.raises(ValueError, match="Unknown choice policy"):
+            player_simulator.parse_policy("random")
+        with pytest.raises(ValueError, match="Unknown think time distribution"):
+            player_simulator.parse_think_time("lognormal:8")
+
+    def test_player_simulator_replay(self, tmp_path):
+        output = tmp_path / "simulation.json"
+        args = ["--passages", "30", "--players", "200", "--replay", "3"]
+        assert player_simulator.main(args + ["--output", str(output)]) == 0
+
+        report = json.loads(output.read_text())
+        assert report["season"]["locations"] == 30
+        assert report["routes"]["main.play"]["requests"] == 200
+        replay = report["replay"]
+        assert replay["players"] == 3
+        assert replay["routes"]["main.play"]["requests"] == 3
+        assert replay["routes"]["main.play"]["errors"] == 0
+        assert replay["routes"]["main.play_location"]["requests"] > 0
+        assert replay["routes"]["main.play_location"]["errors"] == 0
@@ -0,0 +1,41 @@
+import uuid
+
+import pytest
+from flask import Flask
+
+from app.models import Location
+from app.navigation.bulk_load import BulkLoader, _CopyStream
+
+
+class TestBulkLoader:
+    @pytest.fixture(autouse=True)
+    def setup(self, app: Flask):
+        self.app = app
+        self.Session = app.extensions["Session"]
+
+    def test_executemany_fallback(self):
+        season_id = uuid.uuid4()
+        rows = [(uuid.uuid4(), f"Location {i}", season_id) for i in range(7)]
+        with self.Session.begin() as db_session:
+            loader = BulkLoader(db_session, batch_size=3)
+            assert not loader.use_copy
+            count = loader.load(
+                Location.__table__,
+                ["id", "description", "season_id"],
+                (row for row in rows),
+            )
+            assert count == 7
+            assert loader.rows_loaded == 7
+
+        with self.Session() as db_session:
+            assert db_session.query(Location).count() == 7
+
+    def test_copy_stream(self):
+        location_id = uuid.uuid4()
+        stream = _CopyStream(
+            iter([(location_id, "tab\there\nback\\slash", None, 3, True)])
+        )
+        data = stream.read(5) + stream.read()
+        assert data == f"{location_id}\ttab\\there\\nback\\\\slash\t\\N\t3\tt\n"
+        assert stream.rows == 1
+        assert stream.read() == ""
@@ -0,0 +1,241 @@
+import os
+import time
+import uuid
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskCliRunner
+
+from app import commands
+from app.models import Location, Season
+from app.navigation import import_twine
+from tests import test_import_twine
+
+
+class TestImportSeasons:
+    @pytest.fixture(autouse=True)
+    def setup(self, app: Flask, runner: FlaskCliRunner, tmp_path):
+        self.app = app
+        self.runner = runner
+        self.Session = app.extensions["Session"]
+        self.story = test_import_twine.TestImportTwine.mock_twee_content
+        (tmp_path / "one.twee").write_text(self.story)
+        (tmp_path / "two.twee").write_text(
+            self.story.replace("Test Story", "Test Story Two")
+        )
+        (tmp_path / "notes.txt").write_text("not a story")
+        self.tmp_path = tmp_path
+
+    def test_import_directory(self):
+        # The in-memory test database is a single shared connection, so one writer
+        result = self.runner.invoke(
+            args=[
+                "import-seasons",
+                str(self.tmp_path),
+                "--workers",
+                "0",
+                "--writers",
+                "1",
+            ]
+        )
+        assert result.exit_code == 0, result.output
+        assert "one.twee: season" in result.output
+        assert "two.twee: season" in result.output
+        assert "Imported 2/2 files, 10 passages and 32 rows" in result.output
+
+        with self.Session() as db_session:
+            assert db_session.query(Season).count() == 2
+            assert db_session.query(Location).count() == 10
+
+    def test_import_bounds_parses_waiting_for_writers(self, monkeypatch):
+        for i in range(6):
+            (self.tmp_path / f"story{i}.twee").write_text(
+                self.story.replace("Test Story", f"Test Story {i}")
+            )
+        parsed: list[str] = []
+        parse = commands.parse_story_path
+
+        def counting_parse(filepath: str, filename: str):
+            parsed.append(filename)
+            return parse(filepath, filename)
+
+        waiting: list[int] = []
+        insert_story = import_twine.ImportTwine.insert_story
+
+        def slow_insert_story(twine, *args, **kwargs):
+            if not waiting:
+                # Parsing would carry on through every file while the writer is busy
+                time.sleep(0.5)
+                waiting.append(len(parsed))
+            return insert_story(twine, *args, **kwargs)
+
+        monkeypatch.setattr(commands, "parse_story_path", counting_parse)
+        monkeypatch.setattr(import_twine.ImportTwine, "insert_story", slow_insert_story)
+        result = self.runner.invoke(
+            args=[
+                "import-seasons",
+                str(self.tmp_path),
+                "--workers",
+                "0",
+                "--writers",
+                "1",
+            ]
+        )
+        assert result.exit_code == 0, result.output
+        assert "Imported 8/8 files" in result.output
+        # The story being inserted and two waiting for the writer
+        assert waiting == [3]
+
+    def test_import_splits_big_files(self, monkeypatch):
+        # Big enough to be split, on a machine with several CPUs
+        monkeypatch.setattr("app.navigation.import_jobs.PARALLEL_PARSE_MIN_BYTES", 256)
+        monkeypatch.setattr("app.navigation.import_twine.PARALLEL_PARSE_MIN_BYTES", 256)
+        monkeypatch.setattr("app.navigation.import_twine.PARALLEL_CHUNK_MIN_BYTES", 128)
+        monkeypatch.setattr(os, "cpu_count", lambda: 2)
+        splits: list[int] = []
+        find_boundaries = import_twine.find_passage_boundaries
+
+        def spy(filepath: str, chunks: int) -> list[int]:
+            boundaries = find_boundaries(filepath, chunks)
+            splits.append(len(boundaries) - 1)
+            return boundaries
+
+        monkeypatch.setattr(import_twine, "find_passage_boundaries", spy)
+        one = str(self.tmp_path / "one.twee")
+        result = self.runner.invoke(args=["import-seasons", one, "--workers", "2"])
+        assert result.exit_code == 0, result.output
+        assert "Imported 1/1 files, 5 passages" in result.output
+        assert len(splits) == 1 and splits[0] > 1
+
+    def test_import_skips_identical_files(self):
+        # Same story with Windows line endings, in this run and again in a later run
+        copy = self.tmp_path / "copy.twee"
+        copy.write_bytes(self.story.replace("\n", "\r\n").encode())
+        one = str(self.tmp_path / "one.twee")
+        result = self.runner.invoke(
+            args=["import-seasons", one, str(copy), "--workers", "0"]
+        )
+        assert result.exit_code == 0, result.output
+        assert f"copy.twee: identical to {one}, skipped" in result.output
+        assert "Imported 1/2 files" in result.output
+        assert "skipped 1 identical files" in result.output
+
+        result = self.runner.invoke(
+            args=["import-seasons", str(copy), "--workers", "0"]
+        )
+        assert result.exit_code == 0, result.output
+        with self.Session() as db_session:
+            season = db_session.query(Season).one()
+        assert f"identical to season {season.id}, skipped" in result.output
+        assert "Imported 0/1 files" in result.output
+
+    def test_import_stdin(self):
+        result = self.runner.invoke(
+            args=["import-seasons", "-", "--workers", "0"], input=self.story
+        )
+        assert result.exit_code == 0, result.output
+        assert "Imported 1/1 files" in result.output
+
+    def test_import_failure(self):
+        broken = self.tmp_path / "broken.twee"
+        broken.write_text(':: StoryData\n{"format": "SugarCube"}\n')
+        result = self.runner.invoke(
+            args=["import-seasons", str(broken), "--workers", "0"]
+        )
+        assert result.exit_code == 1
+        assert "parse failed: Only Harlowe format is supported" in result.output
+
+    def test_recount_seasons(self):
+        one = str(self.tmp_path / "one.twee")
+        result = self.runner.invoke(args=["import-seasons", one, "--workers", "0"])
+        assert result.exit_code == 0, result.output
+        # As if the season was imported before the count columns existed
+        with self.Session.begin() as db_session:
+            season = db_session.query(Season).one()
+            season_id = season.id
+            season.location_count = season.decision_count = 0
+            season.destination_count = 0
+
+        result = self.runner.invoke(args=["recount-seasons"])
+        assert result.exit_code == 0, result.output
+        assert "Counted 1 seasons" in result.output
+        with self.Session() as db_session:
+            season = db_session.get(Season, season_id)
+            assert (
+                season.location_count,
+                season.decision_count,
+                season.destination_count,
+                season.player_count,
+            ) == (5, 5, 6, 0)
+
+        result = self.runner.invoke(args=["recount-seasons", str(uuid.uuid4())])
+        assert result.exit_code == 1
+        assert "1 seasons not found" in result.output
+
+    def test_partition_seasons_requires_postgres(self):
+        result = self.runner.invoke(args=["partition-seasons"])
+        assert result.exit_code == 1
+        assert "Only Postgres tables can be partitioned" in result.output
+
+    def test_update_season(self):
+        one = str(self.tmp_path / "one.twee")
+        result = self.runner.invoke(args=["import-seasons", one, "--workers", "0"])
+        assert result.exit_code == 0, result.output
+        with self.Session() as db_session:
+            season_id = db_session.query(Season).one().id
+
+        edited = self.tmp_path / "edited.twee"
+        edited.write_text(self.story.replace("in a field", "in a meadow"))
+        result = self.runner.invoke(args=["update-season", str(season_id), str(edited)])
+        assert result.exit_code == 0, result.output
+        assert f"Updated season {season_id}" in result.output
+        assert "0 locations added, 1 changed, 0 removed" in result.output
+
+        result = self.runner.invoke(args=["update-season", str(season_id), str(edited)])
+        assert f"identical to season {season_id}, nothing to update" in result.output
+        with self.Session() as db_session:
+            assert db_session.query(Season).count() == 1
+            assert db_session.query(Location).count() == 5
+
+    def test_export_season(self):
+        one = str(self.tmp_path / "one.twee")
+        result = self.runner.invoke(args=["import-seasons", one, "--workers", "0"])
+        assert result.exit_code == 0, result.output
+        with self.Session() as db_session:
+            season_id = db_session.query(Season).one().id
+
+        exported = self.tmp_path / "exported.twee"
+        result = self.runner.invoke(
+            args=["export-season", str(season_id), "--output", str(exported)]
+        )
+        assert result.exit_code == 0, result.output
+        assert f"Exported season {season_id} to {exported}" in result.output
+        assert exported.read_text().startswith(":: StoryTitle\nTest Story\n")
+
+        result = self.runner.invoke(
+            args=["export-season", str(season_id), "--format", "jsonl"]
+        )
+        assert result.exit_code == 0, result.output
+        assert len(result.output.splitlines()) == 6
+
+        result = self.runner.invoke(args=["export-season", str(uuid.uuid4())])
+        assert result.exit_code == 1
+        assert "not found" in result.output
+
+    def test_analyze_seasons(self):
+        one = str(self.tmp_path / "one.twee")
+        result = self.runner.invoke(args=["import-seasons", one, "--workers", "0"])
+        assert result.exit_code == 0, result.output
+        assert (
+            "0 unreachable passages, 1 dead ends, 0 trapped passages" in result.output
+        )
+        with self.Session() as db_session:
+            season_id = db_session.query(Season).one().id
+
+        result = self.runner.invoke(args=["analyze-seasons"])
+        assert result.exit_code == 0, result.output
+        assert f"Season {season_id}: 0 unreachable passages" in result.output
+
+        result = self.runner.invoke(args=["analyze-seasons", str(uuid.uuid4())])
+        assert result.exit_code == 1
+        assert "not found" in result.output
@@ -0,0 +1,61 @@
+from typing import cast
+
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from app.db import get_db_session, prewarm_pool
+
+
+class TestDbSession:
+    def test_one_session_per_app_context(self, app: Flask):
+        with app.app_context():
+            db_session = get_db_session()
+            assert get_db_session() is db_session
+            db_session.connection()
+            assert db_session.in_transaction()
+
+        # The session is closed, and its connection released, on teardown
+        assert not db_session.in_transaction()
+
+        with app.app_context():
+            assert get_db_session() is not db_session
+
+    def test_rollback_on_error(self, app: Flask):
+        @app.route("/fail")
+        def fail():
+            get_db_session().connection()
+            raise RuntimeError("boom")
+
+        app.config["PROPAGATE_EXCEPTIONS"] = False
+        sessions = []
+        original = app.extensions["Session"]
+
+        def track():
+            db_session = original()
+            sessions.append(db_session)
+            return db_session
+
+        app.extensions["Session"] = track
+        response = app.test_client().get("/fail")
+        assert response.status_code == 500
+        assert len(sessions) == 1
+        assert not sessions[0].in_transaction()
+
+    def test_prewarm_pool(self, tmp_path):
+        engine = create_engine(
+            f"sqlite:///{tmp_path / 'prewarm.db'}",
+            poolclass=QueuePool,
+            pool_size=3,
+            max_overflow=5,
+        )
+        prewarm_pool(engine, 10)
+        pool = cast(QueuePool, engine.pool)
+        # Capped at the pool size, and every connection is back in the pool
+        assert pool.checkedin() == 3
+        assert pool.checkedout() == 0
+
+    def test_single_engine(self, app: Flask):
+        with app.app_context():
+            assert app.extensions["sqlalchemy"].engine is app.extensions["engine"]
+            assert get_db_session().get_bind() is app.extensions["engine"]
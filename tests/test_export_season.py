@@ -0,0 +1,154 @@
+import io
+import json
+import uuid
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+
+from app.models import Location
+from app.navigation import export_season
+from app.navigation.import_twine import ImportTwine
+from tests import test_import_twine
+
+
+class TestExportSeason:
+    @pytest.fixture(autouse=True)
+    def setup(self, app: Flask, admin_client: FlaskClient):
+        self.app = app
+        self.client = admin_client
+        self.Session = app.extensions["Session"]
+        self.story = test_import_twine.TestImportTwine.mock_twee_content
+        with app.app_context():
+            twine = self.parse(self.story)
+            twine.insert_story()
+            self.season_id = twine.season_id
+
+    def parse(self, twee: str) -> ImportTwine:
+        twine = ImportTwine("export.twee", "export.twee")
+        twine.passages = list(twine.iter_passages(io.StringIO(twee)))
+        return twine
+
+    def test_twee_round_trip(self):
+        with self.app.app_context():
+            season_export = export_season.export_season(self.season_id, "twee")
+            assert season_export is not None
+            assert season_export.filename == "Test_Story.twee"
+            exported = "".join(season_export.chunks)
+
+        original = self.parse(self.story)
+        twine = self.parse(exported)
+        assert twine.story_title == "Test Story"
+        assert twine.metadata is not None
+        assert twine.metadata["start"] == "Introduction"
+        assert sorted(twine.passages, key=lambda passage: passage.name) == sorted(
+            original.passages, key=lambda passage: passage.name
+        )
+
+        # Exporting again gives the same file
+        with self.app.app_context():
+            season_export = export_season.export_season(self.season_id, "twee")
+            assert season_export is not None
+            assert "".join(season_export.chunks) == exported
+
+    def test_twee_round_trip_links_in_content(self):
+        # The content line's own links are stored as decisions too
+        story = self.story.replace(
+            "Welcome to Text Game!\n", "Welcome to [[Text Game->I am happy]]!\n"
+        )
+        with self.app.app_context():
+            twine = self.parse(story)
+            twine.insert_story()
+            season_export = export_season.export_season(twine.season_id, "twee")
+            assert season_export is not None
+            reimported = self.parse("".join(season_export.chunks))
+            reimported.insert_story()
+
+        with self.Session() as db_session:
+            decisions = [
+                {
+                    passage.name: [(link.label, link.target) for link in passage.links]
+                    for _, passage in export_season.iter_season_passages(
+                        db_session, season_id
+                    )
+                }
+                for season_id in (twine.season_id, reimported.season_id)
+            ]
+        assert decisions[0]["Introduction"] == [
+            ("Text Game", "I am happy"),
+            ("Begin Your Adventure", "You Awake"),
+        ]
+        assert decisions[1] == decisions[0]
+
+    def test_jsonl(self):
+        with self.app.app_context():
+            season_export = export_season.export_season(self.season_id, "jsonl")
+            assert season_export is not None
+            lines = [
+                json.loads(line) for line in "".join(season_export.chunks).splitlines()
+            ]
+
+        assert lines[0]["type"] == "story"
+        assert lines[0]["title"] == "Test Story"
+        passages = {line["name"]: line for line in lines[1:]}
+        assert len(passages) == 5
+        assert passages["Begin Getting Excited"]["links"] == [
+            {"label": "I am happy", "target": "I am happy"},
+            {"label": "I fail to be happy and pass out", "target": "You Awake"},
+        ]
+        assert passages["I am happy"]["links"] == []
+
+    def test_unnamed_locations(self):
+        # Locations imported before names were stored are exported under their id
+        with self.Session.begin() as db_session:
+            location = (
+                db_session.query(Location).filter(Location.name == "You Awake").one()
+            )
+            location.name = None
+            awake_id = location.id
+
+        with self.app.app_context():
+            season_export = export_season.export_season(self.season_id, "twee")
+            assert season_export is not None
+            twine = self.parse("".join(season_export.chunks))
+        awake = next(
+            p for p in twine.passages if awake_id.hex in p.name.replace("-", "")
+        )
+        assert awake.content.startswith("You awake to find yourself in a field")
+        introduction = next(p for p in twine.passages if p.name == "Introduction")
+        assert introduction.links[0].target == awake.name
+
+    def test_chunks(self, monkeypatch):
+        monkeypatch.setattr(export_season, "EXPORT_CHUNK_CHARS", 1)
+        monkeypatch.setattr(export_season, "EXPORT_BATCH_ROWS", 2)
+        with self.app.app_context():
+            season_export = export_season.export_season(self.season_id, "jsonl")
+            assert season_export is not None
+            chunks = list(season_export.chunks)
+        # A chunk per line once a line fills a chunk
+        assert len(chunks) == 6
+
+    def test_export_route(self):
+        response = self.client.get(f"/admin/export/{self.season_id}?format=jsonl")
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert response.mimetype == "application/jsonl"
+        assert (
+            response.headers["Content-Disposition"]
+            == 'attachment; filename="Test_Story.jsonl"'
+        )
+        assert len(response.get_data(as_text=True).splitlines()) == 6
+
+        response = self.client.get(f"/admin/export/{self.season_id}")
+        assert response.get_data(as_text=True).startswith(":: StoryTitle\n")
+
+        response = self.client.get(f"/admin/export/{self.season_id}?format=csv")
+        assert response.status_code == 400
+        response = self.client.get(f"/admin/export/{uuid.uuid4()}")
+        assert response.status_code == 404
+
+    def test_unknown_format(self):
+        with self.app.app_context():
+            with pytest.raises(ValueError, match="Unsupported export format"):
+                export_season.export_season(self.season_id, "csv")
+            assert export_season.export_season(uuid.uuid4(), "twee") is None
@@ -0,0 +1,243 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+from uuid import UUID
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from app.models import ImportJobRecord, Location, Season
+from app.navigation.import_jobs import ImportJobManager, get_import_jobs
+from tests import test_import_twine
+
+# Queues two imports and exits while the first one is running
+EXIT_WITH_QUEUED_JOB = """
+import sys
+import threading
+import time
+
+from app import create_app
+from app.models import Base
+from config import TestConfig
+
+
+class ExitConfig(TestConfig):
+    SQLALCHEMY_DATABASE_URI = sys.argv[1]
+
+
+app = create_app(ExitConfig)
+Base.metadata.create_all(app.extensions["engine"])
+manager = app.extensions["import_jobs"]
+parse = manager._parse
+submitted = threading.Event()
+
+
+def parse_until_cancelled(source, filename):
+    # Still running when the interpreter exits, until the queued job is cancelled
+    submitted.wait(5)
+    deadline = time.monotonic() + 5
+    while not manager._futures[queued.id].cancelled() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return parse(source, filename)
+
+
+manager._parse = parse_until_cancelled
+running = manager.submit(sys.argv[2], "story.twee")
+queued = manager.submit(sys.argv[2], "again.twee")
+submitted.set()
+print(running.id, queued.id)
+"""
+
+
+class TestImportJobs:
+    @pytest.fixture(autouse=True)
+    def setup(self, app: Flask, tmp_path):
+        self.app = app
+        self.Session = app.extensions["Session"]
+        self.filepath = tmp_path / "story.twee"
+        self.filepath.write_text(test_import_twine.TestImportTwine.mock_twee_content)
+
+    def assert_imported(self, manager: ImportJobManager):
+        job = manager.submit(str(self.filepath), "story.twee")
+        assert job.status == "queued"
+
+        job = manager.wait(job.id, timeout=30)
+        assert job is not None
+        assert job.status == "done", job.error
+        assert job.passages_parsed == 5
+        # 5 locations, 5 decisions and 6 destinations
+        assert job.rows_inserted == 16
+        assert job.elapsed > 0
+
+        with self.Session() as db_session:
+            season = db_session.get(Season, job.season_id)
+            assert season is not None
+            assert season.name == "Test Story"
+            assert db_session.query(Location).count() == 5
+
+    def test_import_on_job_thread(self):
+        with self.app.app_context():
+            self.assert_imported(get_import_jobs())
+
+    def test_import_in_parse_process(self):
+        manager = ImportJobManager(self.app, max_concurrent=1, parse_processes=1)
+        try:
+            self.assert_imported(manager)
+        finally:
+            manager.shutdown()
+
+    def test_failed_import(self, tmp_path):
+        broken = tmp_path / "broken.twee"
+        broken.write_text(':: StoryData\n{"format": "SugarCube"}\n')
+        with self.app.app_context():
+            manager = get_import_jobs()
+            job = manager.wait(manager.submit(str(broken), "broken.twee").id, 30)
+            assert job is not None
+            assert job.status == "failed"
+            assert job.error is not None
+
+    def test_job_status_route(self, admin_client):
+        with self.app.app_context():
+            manager = get_import_jobs()
+            job = manager.submit(str(self.filepath), "story.twee")
+            manager.wait(job.id, timeout=30)
+
+        response = admin_client.get(f"/admin/import_jobs/{job.id}")
+        assert response.status_code == 200
+        assert response.json["status"] == "done"
+        assert response.json["passages_parsed"] == 5
+
+        response = admin_client.get("/admin/seasons")
+        assert response.status_code == 200
+        assert str(job.id).encode() in response.data
+
+    def test_job_on_another_worker(self, admin_client):
+        with self.app.app_context():
+            manager = get_import_jobs()
+            job = manager.wait(manager.submit(str(self.filepath), "story.twee").id, 30)
+            assert job is not None
+
+        # A worker that didn't run the job reads it from the database
+        other_worker = ImportJobManager(self.app, max_concurrent=1, parse_processes=0)
+        self.app.extensions["import_jobs"] = other_worker
+        found = other_worker.get(job.id)
+        assert found is not None
+        assert found.status == "done"
+        assert found.season_id == job.season_id
+        assert found.rows_inserted == 16
+        assert found.elapsed == pytest.approx(job.elapsed, abs=1e-3)
+        assert [listed.id for listed in other_worker.list()] == [job.id]
+
+        response = admin_client.get(f"/admin/import_jobs/{job.id}")
+        assert response.status_code == 200
+        assert response.json["status"] == "done"
+
+    def test_shutdown_fails_queued_jobs(self):
+        manager = ImportJobManager(self.app, max_concurrent=1, parse_processes=0)
+        started = threading.Event()
+        release = threading.Event()
+        parse = manager._parse
+
+        def blocking_parse(source, filename):
+            started.set()
+            release.wait(30)
+            return parse(source, filename)
+
+        manager._parse = blocking_parse  # type: ignore[method-assign]
+        running = manager.submit(str(self.filepath), "story.twee")
+        assert started.wait(30)
+        queued = manager.submit(str(self.filepath), "again.twee")
+        shutdown = threading.Thread(target=manager.shutdown)
+        shutdown.start()
+        # Keep the running import blocked until shutdown has cancelled the queued one
+        deadline = time.monotonic() + 30
+        while not manager._futures[queued.id].cancelled():
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        release.set()
+        shutdown.join(30)
+
+        assert manager.get(running.id).status == "done"
+        job = manager.get(queued.id)
+        assert job.status == "failed"
+        assert "shut down" in job.error
+
+    def test_exit_fails_queued_jobs(self, tmp_path):
+        database = tmp_path / "exit.db"
+        result = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                EXIT_WITH_QUEUED_JOB,
+                f"sqlite:///{database}",
+                str(self.filepath),
+            ],
+            cwd=os.path.dirname(os.path.dirname(__file__)),
+            capture_output=True,
+            text=True,
+            timeout=60,
+        )
+        assert result.returncode == 0, result.stderr
+        running, queued = (UUID(job_id) for job_id in result.stdout.split())
+
+        # The running import finished, the queued one never started
+        engine = create_engine(f"sqlite:///{database}")
+        try:
+            with Session(engine) as db_session:
+                assert db_session.get(ImportJobRecord, running).status == "done"
+                job = db_session.get(ImportJobRecord, queued)
+                assert job.status == "failed"
+                assert "shut down" in job.error
+        finally:
+            engine.dispose()
+
+    def test_forked_process_exits_with_lock_held(self):
+        manager = ImportJobManager(self.app, max_concurrent=1, parse_processes=0)
+        try:
+            self.assert_imported(manager)
+            # As if another thread was submitting a job when a parse process was forked
+            with manager._lock:
+                process = multiprocessing.get_context("fork").Process(target=int)
+                process.start()
+                process.join(30)
+                if process.is_alive():
+                    process.kill()
+            assert process.exitcode == 0
+        finally:
+            manager.shutdown()
+
+    def test_duplicate_upload(self, admin_client):
+        with self.app.app_context():
+            manager = get_import_jobs()
+            job = manager.wait(manager.submit(str(self.filepath), "story.twee").id, 30)
+            assert job is not None
+            assert not job.duplicate
+
+            # Queued again, the job finds the season without parsing or inserting
+            again = manager.wait(
+                manager.submit(str(self.filepath), "again.twee").id, 30
+            )
+            assert again is not None
+            assert again.status == "done"
+            assert again.duplicate
+            assert again.season_id == job.season_id
+            assert again.passages_parsed == 0
+
+        # Uploaded again, the route short-circuits before saving the file
+        with open(self.filepath, "rb") as file:
+            response = admin_client.post(
+                "/admin/upload",
+                data={"file": (file, "story.twee")},
+                follow_redirects=True,
+            )
+        assert response.status_code == 200
+        assert f"identical to season Test Story ({job.season_id})".encode() in (
+            response.data
+        )
+        with self.Session() as db_session:
+            assert db_session.query(Season).count() == 1
@@ -1,11 +1,26 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import mock_open, patch
 
 import pytest
 from flask import Flask, session
 
-from app.models import Decision, DecisionDestination, Location, Season, User
-from app.navigation.import_twine import ImportTwine
+from app.models import (
+    Decision,
+    DecisionDestination,
+    Location,
+    Season,
+    User,
+    UserLocation,
+)
+from app.navigation.import_twine import (
+    ImportTwine,
+    content_hash,
+    find_passage_boundaries,
+    location_id,
+)
 from app.navigation.nav import Nav
+from app.navigation.season_graph import get_season_graphs
 from app.users.user_locations import UserLocationStore
 from app.users.users import UserStore
 
@@ -74,6 +89,118 @@ You awake to find yourself in a field. You are covered in honey.
             assert passages[0].links[1].label == "I fail to be happy and pass out"
             assert passages[0].links[1].target == "You Awake"
 
+    def test_iter_passages_streaming(self):
+        twine = ImportTwine("unused.twee", "unused.twee")
+        stream = io.StringIO(self.mock_twee_content.replace("\n", "\r\n"))
+        passages = twine.iter_passages(stream)
+
+        # Passages are yielded as the stream is read, metadata is set along the way
+        first = next(passages)
+        assert first.name == "Begin Getting Excited"
+        assert twine.story_title == "Test Story"
+        assert twine.metadata is not None
+        assert twine.metadata["start"] == "Introduction"
+        assert twine.passages == []
+
+        rest = list(passages)
+        assert [p.name for p in rest] == [
+            "I am happy",
+            "Introduction",
+            "Go Back To Sleep",
+            "You Awake",
+        ]
+        assert rest[-1].content == (
+            "You awake to find yourself in a field. You are covered in honey."
+        )
+        assert [(link.label, link.target) for link in rest[-1].links] == [
+            ("Go Back To Sleep", "Go Back To Sleep"),
+            ("Begin Getting Excited", "Begin Getting Excited"),
+        ]
+
+    def test_iter_passages_headers_only_at_line_start(self):
+        twine = ImportTwine("unused.twee", "unused.twee")
+        stream = io.StringIO(
+            ":: Start\nA sign reads 12::30.\n[[Go->End]]\n\n:: End [tag]\n\nThe end\n"
+        )
+        passages = list(twine.iter_passages(stream))
+        assert [p.name for p in passages] == ["Start", "End [tag]"]
+        assert passages[0].content == "A sign reads 12::30."
+        assert passages[0].links[0].target == "End"
+        assert passages[1].content == "The end"
+
+    def test_parse_twee_file_parallel_matches_serial(self, tmp_path, monkeypatch):
+        # Story metadata in the middle of the file, so it lands in a later chunk
+        passages = [
+            f':: Passage {i} {{"position":"{i},0"}}\nRoom {i}, a sign reads 1::2.\n'
+            f"[[Next->Passage {i + 1}]]\n[[Passage 0]]\n\n"
+            for i in range(200)
+        ]
+        header, story_data = self.mock_twee_content.split(":: Begin")[0].split(
+            ":: StoryData"
+        )
+        passages.insert(120, ":: StoryData" + story_data)
+        passages.insert(60, header)
+        path = tmp_path / "big.twee"
+        path.write_text("".join(passages), encoding="utf-8")
+        monkeypatch.setattr("app.navigation.import_twine.PARALLEL_CHUNK_MIN_BYTES", 256)
+
+        serial = ImportTwine(str(path), "big.twee")
+        serial.parse_twee_file(parallel=False)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            parallel = ImportTwine(str(path), "big.twee")
+            parallel.parse_twee_file(parallel=True, executor=executor)
+
+        assert len(serial.passages) == 200
+        assert parallel.passages == serial.passages
+        assert parallel.story_title == serial.story_title == "Test Story"
+        assert parallel.metadata == serial.metadata
+        assert parallel.metadata is not None
+        assert parallel.metadata["start"] == "Introduction"
+
+    def test_parse_twee_file_with_bom(self, tmp_path, monkeypatch):
+        # As saved by editors that mark UTF-8 files
+        path = tmp_path / "bom.twee"
+        path.write_text(self.mock_twee_content.lstrip("\n"), encoding="utf-8-sig")
+        monkeypatch.setattr("app.navigation.import_twine.PARALLEL_CHUNK_MIN_BYTES", 64)
+
+        for parallel in (False, True):
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                twine = ImportTwine(str(path), "bom.twee")
+                twine.parse_twee_file(parallel=parallel, executor=executor)
+            assert twine.story_title == "Test Story"
+            assert twine.metadata is not None
+            assert twine.metadata["start"] == "Introduction"
+            assert len(twine.passages) == 5
+
+    def test_find_passage_boundaries(self, tmp_path, monkeypatch):
+        path = tmp_path / "story.twee"
+        path.write_text(
+            "".join(f":: P{i}\nText {i}\n\n" for i in range(100)), encoding="utf-8"
+        )
+        monkeypatch.setattr("app.navigation.import_twine.PARALLEL_CHUNK_MIN_BYTES", 64)
+        data = path.read_bytes()
+        boundaries = find_passage_boundaries(str(path), 8)
+        assert boundaries[0] == 0
+        assert boundaries[-1] == len(data)
+        assert len(boundaries) == 9
+        assert boundaries == sorted(set(boundaries))
+        for offset in boundaries[1:-1]:
+            assert data[offset:].startswith(b":: P")
+            assert data[offset - 1 : offset] == b"\n"
+
+    def test_content_hash_normalizes(self):
+        digest = content_hash(io.BytesIO(self.mock_twee_content.encode()))
+        variants = [
+            self.mock_twee_content.replace("\n", "\r\n"),
+            "\ufeff" + self.mock_twee_content,
+            self.mock_twee_content.replace("\n", "  \n") + "\n\n",
+        ]
+        for variant in variants:
+            assert content_hash(io.BytesIO(variant.encode())) == digest
+
+        changed = self.mock_twee_content.replace("laugh", "cry")
+        assert content_hash(io.BytesIO(changed.encode())) != digest
+
     def test_insert_story(self):
         with patch("builtins.open", mock_open(read_data=self.mock_twee_content)):
             twine = ImportTwine("mock_file.twee", "mock_file.twee")
@@ -94,9 +221,33 @@ You awake to find yourself in a field. You are covered in honey.
                     assert db_session.query(Location).count() == 5
                     assert db_session.query(Decision).count() == 5
                     assert db_session.query(DecisionDestination).count() == 6
+                    assert (
+                        season.location_count,
+                        season.decision_count,
+                        season.destination_count,
+                    ) == (5, 5, 6)
+                    # Every row carries its season, see app.seasons.partitions
+                    for model in (Decision, DecisionDestination):
+                        assert {row.season_id for row in db_session.query(model)} == {
+                            season.id
+                        }
                     assert season.name == "Test Story"
                     assert season.origin_file == "mock_file.twee"
                     assert season.genesis_location_id is not None
+                    # Moves from the start and to I am happy, the only ending
+                    assert {
+                        location.name: (
+                            location.start_distance,
+                            location.ending_distance,
+                        )
+                        for location in db_session.query(Location)
+                    } == {
+                        "Introduction": (0, 3),
+                        "You Awake": (1, 2),
+                        "Go Back To Sleep": (2, 3),
+                        "Begin Getting Excited": (2, 1),
+                        "I am happy": (3, 0),
+                    }
 
                     # Set the user in the session
                     with self.app.test_request_context():
@@ -131,3 +282,126 @@ You awake to find yourself in a field. You are covered in honey.
                         )
                         assert user_location is not None
                         assert user_location.location_id == second_location_id
+
+    def test_insert_story_broken_link(self):
+        twine = ImportTwine("story.twee", "story.twee")
+        twine.passages = list(
+            twine.iter_passages(
+                io.StringIO(
+                    self.mock_twee_content.replace("[[You Awake]]", "[[Awake]]")
+                )
+            )
+        )
+        with self.app.app_context():
+            with pytest.raises(
+                ValueError,
+                match="1 links to passages that don't exist: Go Back To Sleep -> Awake",
+            ):
+                twine.insert_story()
+            with self.Session() as db_session:
+                assert db_session.query(Season).count() == 0
+
+    def test_update_story(self):
+        twine = ImportTwine("story.twee", "story.twee")
+        twine.passages = list(twine.iter_passages(io.StringIO(self.mock_twee_content)))
+        with self.app.app_context():
+            twine.insert_story()
+            season_id = twine.season_id
+            with self.Session.begin() as db_session:
+                ids = {
+                    location.name: location.id
+                    for location in db_session.query(Location)
+                }
+                awake, asleep = User(username="awake", phone=1), User(
+                    username="asleep", phone=2
+                )
+                db_session.add_all([awake, asleep])
+                db_session.flush()
+                awake_id, asleep_id = awake.id, asleep.id
+                db_session.add_all(
+                    [
+                        UserLocation(
+                            user_id=awake_id,
+                            season_id=season_id,
+                            location_id=ids["You Awake"],
+                        ),
+                        UserLocation(
+                            user_id=asleep_id,
+                            season_id=season_id,
+                            location_id=ids["Go Back To Sleep"],
+                        ),
+                    ]
+                )
+            # Ids are derived from the season and passage name
+            assert ids["Introduction"] == location_id(season_id, "Introduction")
+
+            # Go Back To Sleep is replaced by Stay Awake, and the introduction is reworded
+            edited = (
+                self.mock_twee_content.replace(
+                    "Welcome to Text Game!", "Welcome back to Text Game!"
+                )
+                .replace("Go Back To Sleep", "Stay Awake")
+                .replace("you back to sleep", "you to stay up")
+            )
+            update = ImportTwine("story.twee", "story-v2.twee")
+            update.passages = list(update.iter_passages(io.StringIO(edited)))
+            changes = update.update_story(season_id)
+
+            assert changes.locations_added == 1
+            assert changes.locations_changed == 1
+            assert changes.locations_removed == 1
+            # You Awake links to Stay Awake now, Stay Awake is new
+            assert changes.decisions_changed == 2
+            assert changes.players_moved == 1
+
+            with self.Session.begin() as db_session:
+                assert db_session.query(Season).count() == 1
+                season = db_session.get(Season, season_id)
+                assert season.origin_file == "story-v2.twee"
+                assert season.genesis_location_id == ids["Introduction"]
+                locations = {
+                    location.name: location for location in db_session.query(Location)
+                }
+                assert set(locations) == set(ids) - {"Go Back To Sleep"} | {
+                    "Stay Awake"
+                }
+                for name in locations.keys() & ids.keys():
+                    assert locations[name].id == ids[name]
+                assert (
+                    locations["Introduction"].description
+                    == "Welcome back to Text Game!"
+                )
+                assert (
+                    locations["Stay Awake"].start_distance,
+                    locations["Stay Awake"].ending_distance,
+                ) == (2, 3)
+                assert db_session.query(Decision).count() == 5
+                assert db_session.query(DecisionDestination).count() == 6
+                assert (
+                    season.location_count,
+                    season.decision_count,
+                    season.destination_count,
+                ) == (5, 5, 6)
+
+                positions = {
+                    user_location.user_id: user_location.location_id
+                    for user_location in db_session.query(UserLocation)
+                }
+                assert positions[awake_id] == ids["You Awake"]
+                # The player at the removed passage starts over
+                assert positions[asleep_id] == ids["Introduction"]
+
+            graph = get_season_graphs().get(season_id)
+            destinations = graph.locations[ids["You Awake"]].destinations
+            assert [d.description for d in destinations] == [
+                "Stay Awake",
+                "Begin Getting Excited",
+            ]
+            assert destinations[0].destination_location_id == location_id(
+                season_id, "Stay Awake"
+            )
+
+            # Updating again with the same story writes nothing
+            again = ImportTwine("story.twee", "story-v2.twee")
+            again.passages = list(again.iter_passages(io.StringIO(edited)))
+            assert again.update_story(season_id).rows_written == 0
@@ -0,0 +1,111 @@
+import io
+
+import pytest
+from flask import Flask
+
+from app.models import DecisionDestination, Location, Season
+from app.navigation.import_jobs import get_import_jobs
+from app.navigation.import_twine import ImportTwine
+from app.navigation.import_twine_html import ImportTwineHtml
+from tests import test_import_twine
+
+
+class TestImportTwineHtml:
+    # The Twee test story, as published by Twine
+    mock_html_content: str = (
+        "<!DOCTYPE html>\n"
+        "<html>\n"
+        "<head><title>Test Story</title></head>\n"
+        "<body>\n"
+        "<tw-story></tw-story>\n"
+        '<tw-storydata name="Test Story" startnode="3" creator="Twine" '
+        'creator-version="2.6.2" format="Harlowe" format-version="3.3.9" '
+        'ifid="43048DD4-5A6B-4D29-BCC6-F418D5460FED" options="" tags="" '
+        'zoom="1" hidden>\n'
+        '<style role="stylesheet" id="twine-user-stylesheet" '
+        'type="text/twine-css"></style>\n'
+        '<script role="script" id="twine-user-script" '
+        'type="text/twine-javascript">if (a < b) { [[not a link]] }</script>\n'
+        '<tw-passagedata pid="1" name="Begin Getting Excited" tags="" '
+        'position="1075,750" size="100,100">You look around and begin to laugh. '
+        "You see many trees and clouds.\n"
+        "[[I am happy]]\n"
+        "[[I fail to be happy and pass out-&gt;You Awake]]</tw-passagedata>\n"
+        '<tw-passagedata pid="2" name="I am happy" tags="" position="1075,875" '
+        'size="100,100">Satisfied with your happiness, and having no concern over '
+        "how you came to be here in the first place, you shuffle off to find home.\n"
+        "YOU&#39;VE WON</tw-passagedata>\n"
+        '<tw-passagedata pid="3" name="Introduction" tags="" '
+        'position="900,400" size="100,100">Welcome to Text Game!\n'
+        "[[Begin Your Adventure-&gt;You Awake]]</tw-passagedata>\n"
+        '<tw-passagedata pid="4" name="Go Back To Sleep" tags="" '
+        'position="725,725" size="100,100">Unconcerned with your stickiness, you '
+        "allow the warmth from the sun and the soft breeze to coax you back to sleep.\n"
+        "[[You Awake]]</tw-passagedata>\n"
+        '<tw-passagedata pid="5" name="You Awake" tags="" position="900,600" '
+        'size="100,100">You awake to find yourself in a field. You are covered in '
+        "honey.\n"
+        "[[Go Back To Sleep]]\n"
+        "[[Begin Getting Excited]]</tw-passagedata>\n"
+        "</tw-storydata>\n"
+        '<script>window.story = "<tw-passagedata>";</script>\n'
+        "</body>\n"
+        "</html>\n"
+    )
+
+    @pytest.fixture(autouse=True)
+    def setup(self, app: Flask):
+        self.app = app
+        self.Session = app.extensions["Session"]
+
+    def test_matches_twee(self, monkeypatch):
+        # Tiny chunks, so tags and character references are split across feeds
+        monkeypatch.setattr("app.navigation.import_twine_html.HTML_CHUNK_SIZE", 7)
+        html = ImportTwineHtml("story.html", "story.html")
+        passages = list(html.iter_passages(io.StringIO(self.mock_html_content)))
+
+        twee = ImportTwine("story.twee", "story.twee")
+        expected = list(
+            twee.iter_passages(
+                io.StringIO(test_import_twine.TestImportTwine.mock_twee_content)
+            )
+        )
+
+        assert passages == expected
+        assert html.story_title == twee.story_title == "Test Story"
+        assert html.metadata is not None
+        assert twee.metadata is not None
+        for key in ("ifid", "format", "format-version", "start", "zoom"):
+            assert html.metadata[key] == twee.metadata[key]  # type: ignore
+
+    def test_rejects_other_formats(self):
+        html = ImportTwineHtml("story.html", "story.html")
+        content = self.mock_html_content.replace(
+            'format="Harlowe"', 'format="SugarCube"'
+        )
+        with pytest.raises(ValueError, match="Only Harlowe format is supported"):
+            list(html.iter_passages(io.StringIO(content)))
+
+        html = ImportTwineHtml("story.html", "story.html")
+        with pytest.raises(ValueError, match="no <tw-storydata> story"):
+            list(html.iter_passages(io.StringIO("<html><body></body></html>")))
+
+    def test_import_job(self, tmp_path):
+        filepath = tmp_path / "story.html"
+        filepath.write_text(self.mock_html_content)
+        with self.app.app_context():
+            manager = get_import_jobs()
+            job = manager.wait(manager.submit(str(filepath), "story.html").id, 30)
+            assert job is not None
+            assert job.status == "done", job.error
+            assert job.passages_parsed == 5
+
+        with self.Session() as db_session:
+            season = db_session.get(Season, job.season_id)
+            assert season is not None
+            assert season.name == "Test Story"
+            assert season.origin_file == "story.html"
+            genesis = db_session.get(Location, season.genesis_location_id)
+            assert genesis is not None
+            assert genesis.description == "Welcome to Text Game!"
+            assert db_session.query(DecisionDestination).count() == 6
@@ -0,0 +1,197 @@
+import uuid
+from unittest.mock import mock_open, patch
+
+import pytest
+from flask import Flask
+from sqlalchemy import select
+
+from app.models import Location, Season, User, UserLocation
+from app.navigation.import_twine import ImportTwine
+from app.navigation.nav import Nav
+from app.navigation.season_graph import (
+    GraphLocation,
+    SeasonGraphCache,
+    get_season_graphs,
+)
+from app.users.position_buffer import PositionBuffer
+from app.users.user_locations import UserLocationStore
+from tests import test_import_twine
+
+
+class TestNav:
+    @pytest.fixture(autouse=True)
+    def setup(self, app: Flask):
+        self.app = app
+        self.Session = app.extensions["Session"]
+
+    def setup_story(self) -> tuple[Season, User]:
+        with patch(
+            "builtins.open",
+            mock_open(read_data=test_import_twine.TestImportTwine.mock_twee_content),
+        ):
+            twine = ImportTwine("mock_file.twee", "mock_file.twee")
+            twine.parse_twee_file()
+        twine.insert_story()
+
+        user = User(username="user1", email="user1@example.com", phone=1111111111)
+        with self.Session() as db_session:
+            db_session.add(user)
+            db_session.commit()
+            db_session.refresh(user)
+            season = db_session.get(Season, twine.season_id)
+        return season, user
+
+    def assert_transitions(self, season: Season, user: User):
+        nav = Nav(season.id, season.genesis_location_id, user)
+        description, decisions = nav.transition(season.genesis_location_id)
+        assert description == "Welcome to Text Game!"
+        assert [d.description for d in decisions] == ["Begin Your Adventure"]
+
+        second_location_id = decisions[0].destination_location_id
+        description, decisions = nav.transition(second_location_id)
+        assert (
+            description
+            == "You awake to find yourself in a field. You are covered in honey."
+        )
+        assert [(d.description, d.position) for d in decisions] == [
+            ("Go Back To Sleep", 0),
+            ("Begin Getting Excited", 1),
+        ]
+        assert nav.get_location_id() == second_location_id
+
+        user_location = UserLocationStore.fetch(season.id, user.id)
+        assert user_location is not None
+        assert user_location.location_id == second_location_id
+
+        # Dead ends still come back with their description
+        happy_location_id = decisions[1].destination_location_id
+        _, decisions = nav.transition(happy_location_id)
+        description, decisions = nav.transition(decisions[0].destination_location_id)
+        assert description.startswith("Satisfied with your happiness")
+        assert decisions == []
+
+    def test_transition_cold_graph(self):
+        with self.app.app_context():
+            season, user = self.setup_story()
+            assert get_season_graphs().peek(season.id) is None
+            self.assert_transitions(season, user)
+            # Compiled by the first move
+            assert get_season_graphs().peek(season.id) is not None
+
+    def test_transition_graph_too_large(self):
+        # Every move queries the database
+        self.app.extensions["season_graphs"] = SeasonGraphCache(1)
+        with self.app.app_context():
+            season, user = self.setup_story()
+            self.assert_transitions(season, user)
+            assert get_season_graphs().peek(season.id) is None
+
+    def test_transition_compiled_graph(self):
+        with self.app.app_context():
+            season, user = self.setup_story()
+            get_season_graphs().get(season.id)
+            self.assert_transitions(season, user)
+
+    def test_transition_write_behind(self):
+        with self.app.app_context():
+            season, user = self.setup_story()
+            self.app.extensions["position_buffer"] = PositionBuffer(
+                self.Session, flush_interval=60, max_pending=100
+            )
+            self.assert_transitions(season, user)
+            with self.Session() as db_session:
+                assert db_session.query(UserLocation).count() == 0
+
+    def test_transition_counts_new_players(self):
+        with self.app.app_context():
+            season, user = self.setup_story()
+            self.assert_transitions(season, user)
+            with self.Session() as db_session:
+                assert db_session.get(Season, season.id).player_count == 1
+
+            # Players moved by the write-behind buffer are counted when it flushes
+            buffer = PositionBuffer(self.Session, flush_interval=60, max_pending=100)
+            self.app.extensions["position_buffer"] = buffer
+            other = User(username="user2", email="user2@example.com", phone=2222222222)
+            with self.Session() as db_session:
+                db_session.add(other)
+                db_session.commit()
+                db_session.refresh(other)
+            self.assert_transitions(season, other)
+            self.assert_transitions(season, user)
+            assert buffer.flush() == 2
+            with self.Session() as db_session:
+                assert db_session.get(Season, season.id).player_count == 2
+
+    def test_play_location(self):
+        with self.app.app_context():
+            season, user = self.setup_story()
+            with self.Session() as db_session:
+                # Imported locations have uuid5 ids
+                location_id = db_session.execute(
+                    select(Location.id).where(Location.name == "You Awake")
+                ).scalar_one()
+        assert location_id.version == 5
+
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session["user"] = {"email": user.email}
+        response = client.get(f"/play/{season.id}/{location_id}")
+        assert response.status_code == 200
+        assert "You are covered in honey" in response.text
+
+    @pytest.mark.parametrize("write_behind", [False, True])
+    def test_play_unknown_location(self, write_behind: bool):
+        self.app.extensions["season_graphs"] = SeasonGraphCache(1)
+        if write_behind:
+            buffer = PositionBuffer(self.Session, flush_interval=60, max_pending=100)
+            self.app.extensions["position_buffer"] = buffer
+        with self.app.app_context():
+            season, user = self.setup_story()
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session["user"] = {"email": user.email}
+        response = client.get(f"/play/{season.id}/{uuid.uuid4()}")
+        assert response.status_code == 404
+        if write_behind:
+            # Not buffered, where it would fail the next flush
+            assert len(buffer) == 0
+        with self.Session() as db_session:
+            assert db_session.query(UserLocation).count() == 0
+
+    def test_play_unknown_season(self):
+        with self.app.app_context():
+            _, user = self.setup_story()
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session["user"] = {"email": user.email}
+        for _ in range(3):
+            response = client.get(f"/play/{uuid.uuid4()}/{uuid.uuid4()}")
+            assert response.status_code == 404
+        with self.app.app_context():
+            assert len(get_season_graphs()) == 0
+
+    def test_play_location_missing_from_stale_graph(self):
+        engine = self.app.extensions["engine"]
+        with engine.connect() as connection:
+            # SQLite only checks foreign keys when asked to, like Postgres always does
+            connection.exec_driver_sql("PRAGMA foreign_keys = ON")
+        try:
+            with self.app.app_context():
+                season, user = self.setup_story()
+                # Compiled before the location was deleted on another worker
+                graph = get_season_graphs().get(season.id)
+                assert graph is not None
+                deleted_id = uuid.uuid4()
+                graph.locations[deleted_id] = GraphLocation("Deleted", ())
+
+            client = self.app.test_client()
+            with client.session_transaction() as session:
+                session["user"] = {"email": user.email}
+            response = client.get(f"/play/{season.id}/{deleted_id}")
+            assert response.status_code == 404
+            with self.Session() as db_session:
+                assert db_session.query(UserLocation).count() == 0
+        finally:
+            with engine.connect() as connection:
+                connection.exec_driver_sql("PRAGMA foreign_keys = OFF")
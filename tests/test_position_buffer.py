@@ -0,0 +1,111 @@
+import io
+import uuid
+
+import pytest
+from flask import Flask
+
+from app.models import Season, User, UserLocation
+from app.navigation.import_twine import ImportTwine
+from app.users.position_buffer import PositionBuffer
+from app.users.user_locations import UserLocationStore
+from tests import test_import_twine
+
+
+class TestPositionBuffer:
+    @pytest.fixture(autouse=True)
+    def setup(self, app: Flask):
+        self.app = app
+        self.Session = app.extensions["Session"]
+        self.buffer = PositionBuffer(self.Session, flush_interval=60, max_pending=100)
+        app.extensions["position_buffer"] = self.buffer
+
+    def test_set_coalesces_and_reads_own_writes(self):
+        with self.app.app_context():
+            season_id, user_id = uuid.uuid4(), uuid.uuid4()
+            first, second = uuid.uuid4(), uuid.uuid4()
+
+            UserLocationStore.set(season_id, user_id, first)
+            UserLocationStore.set(season_id, user_id, second)
+            assert len(self.buffer) == 1
+
+            # Nothing has been written yet, but the player reads their latest move
+            with self.Session() as db_session:
+                assert db_session.query(UserLocation).count() == 0
+            user_location = UserLocationStore.fetch(season_id, user_id)
+            assert user_location is not None
+            assert user_location.location_id == second
+
+    def test_flush_upserts_in_batches(self):
+        with self.app.app_context():
+            self.buffer.batch_size = 2
+            season_id = uuid.uuid4()
+            positions = {uuid.uuid4(): uuid.uuid4() for _ in range(5)}
+            for user_id, location_id in positions.items():
+                self.buffer.set(season_id, user_id, location_id)
+
+            assert self.buffer.flush() == 5
+            assert len(self.buffer) == 0
+
+            # A later move updates the existing row
+            moved_user_id = next(iter(positions))
+            positions[moved_user_id] = uuid.uuid4()
+            self.buffer.set(season_id, moved_user_id, positions[moved_user_id])
+            assert self.buffer.flush() == 1
+
+            with self.Session() as db_session:
+                rows = db_session.query(UserLocation).all()
+                assert {row.user_id: row.location_id for row in rows} == positions
+
+    def test_stop_flushes(self):
+        with self.app.app_context():
+            self.buffer.start()
+            season_id, user_id, location_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+            self.buffer.set(season_id, user_id, location_id)
+            self.buffer.stop()
+
+            with self.Session() as db_session:
+                user_location = db_session.get(UserLocation, (user_id, season_id))
+                assert user_location is not None
+                assert user_location.location_id == location_id
+
+    def test_flush_drops_positions_that_fail(self):
+        engine = self.app.extensions["engine"]
+        with engine.connect() as connection:
+            # SQLite only checks foreign keys when asked to, like Postgres always does
+            connection.exec_driver_sql("PRAGMA foreign_keys = ON")
+        try:
+            with self.app.app_context():
+                twine = ImportTwine("story.twee", "story.twee")
+                twine.passages = list(
+                    twine.iter_passages(
+                        io.StringIO(test_import_twine.TestImportTwine.mock_twee_content)
+                    )
+                )
+                twine.insert_story()
+                with self.Session() as db_session:
+                    season = db_session.get(Season, twine.season_id)
+                    season_id, genesis_id = season.id, season.genesis_location_id
+                    users = [
+                        User(username=f"user{n}", email=f"user{n}@example.com", phone=n)
+                        for n in (1, 2)
+                    ]
+                    db_session.add_all(users)
+                    db_session.commit()
+                    user_ids = [user.id for user in users]
+
+                self.buffer.set(season_id, user_ids[0], genesis_id)
+                # A location that was deleted since, or never existed
+                self.buffer.set(season_id, user_ids[1], uuid.uuid4())
+                assert self.buffer.flush() == 1
+                assert len(self.buffer) == 0
+                assert self.buffer.flush() == 0
+
+                with self.Session() as db_session:
+                    rows = db_session.query(UserLocation).all()
+                    assert [(row.user_id, row.location_id) for row in rows] == [
+                        (user_ids[0], genesis_id)
+                    ]
+                    assert db_session.get(Season, season_id).player_count == 1
+        finally:
+            with engine.connect() as connection:
+                connection.exec_driver_sql("PRAGMA foreign_keys = OFF")
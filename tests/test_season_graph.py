@@ -0,0 +1,239 @@
+import io
+import time
+import uuid
+from unittest.mock import mock_open, patch
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+from app.models import Season, User
+from app.navigation.import_twine import ImportTwine
+from app.navigation.nav import Nav
+from app.navigation.season_graph import (
+    GraphLocation,
+    SeasonGraph,
+    SeasonGraphCache,
+    get_season_graphs,
+)
+from app.seasons.seasons import SeasonStore
+from tests import test_import_twine
+
+
+class TestSeasonGraph:
+    @pytest.fixture(autouse=True)
+    def setup(self, app: Flask):
+        self.app = app
+        self.Session = app.extensions["Session"]
+
+    def import_story(self) -> Season:
+        with patch(
+            "builtins.open",
+            mock_open(read_data=test_import_twine.TestImportTwine.mock_twee_content),
+        ):
+            twine = ImportTwine("mock_file.twee", "mock_file.twee")
+            twine.parse_twee_file()
+        twine.insert_story()
+        with self.Session() as db_session:
+            return db_session.get(Season, twine.season_id)
+
+    def test_load(self):
+        with self.app.app_context():
+            season = self.import_story()
+            graph = SeasonGraph.load(season.id)
+
+            assert len(graph.locations) == 5
+            genesis = graph.locations[season.genesis_location_id]
+            assert genesis.description == "Welcome to Text Game!"
+            assert [d.description for d in genesis.destinations] == [
+                "Begin Your Adventure"
+            ]
+            awake = graph.locations[genesis.destinations[0].destination_location_id]
+            assert [d.position for d in awake.destinations] == [0, 1]
+            assert graph.size > 0
+
+    def test_fetch_decisions_without_queries(self):
+        with self.app.app_context():
+            season = self.import_story()
+            user = User(username="user1", email="user1@example.com", phone=1111111111)
+            nav = Nav(season.id, season.genesis_location_id, user)
+            nav.fetch_decisions()
+
+            statements: list[str] = []
+            engine = self.app.extensions["engine"]
+
+            def before_execute(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            event.listen(engine, "before_cursor_execute", before_execute)
+            try:
+                description, decisions = nav.fetch_decisions()
+            finally:
+                event.remove(engine, "before_cursor_execute", before_execute)
+
+            assert statements == []
+            assert description == "Welcome to Text Game!"
+            assert decisions[0].description == "Begin Your Adventure"
+
+    def test_delete_season_invalidates(self, admin_client):
+        with self.app.app_context():
+            season = self.import_story()
+            get_season_graphs().get(season.id)
+            assert get_season_graphs().peek(season.id) is not None
+
+        admin_client.post(f"/admin/delete_season/{season.id}")
+
+        with self.app.app_context():
+            assert get_season_graphs().peek(season.id) is None
+
+    def test_update_story_on_another_worker(self):
+        # The graph cache of a worker that didn't run the update
+        other_worker = SeasonGraphCache(self.app.config["SEASON_GRAPH_CACHE_BYTES"])
+        with self.app.app_context():
+            season = self.import_story()
+            stale = other_worker.get(season.id)
+            assert stale is not None and stale.version == 0
+
+            edited = test_import_twine.TestImportTwine.mock_twee_content.replace(
+                "Welcome to Text Game!", "Welcome back to Text Game!"
+            )
+            update = ImportTwine("story.twee", "story-v2.twee")
+            update.passages = list(update.iter_passages(io.StringIO(edited)))
+            update.update_story(season.id)
+            assert other_worker.peek(season.id) is stale
+
+            # The other worker checks its graphs when it resolves the current season
+            self.app.extensions["season_graphs"] = other_worker
+            SeasonStore.invalidate_current_season()
+            SeasonStore.get_current_season()
+            assert other_worker.peek(season.id) is None
+            graph = other_worker.get(season.id)
+            assert graph is not None and graph.version == 1
+            genesis = graph.locations[season.genesis_location_id]
+            assert genesis.description == "Welcome back to Text Game!"
+
+    def test_delete_season_on_another_worker(self):
+        this_worker = self.app.extensions["season_graphs"]
+        other_worker = SeasonGraphCache(self.app.config["SEASON_GRAPH_CACHE_BYTES"])
+        with self.app.app_context():
+            season = self.import_story()
+            this_worker.get(season.id)
+
+            self.app.extensions["season_graphs"] = other_worker
+            SeasonStore.delete_season(season.id)
+            self.app.extensions["season_graphs"] = this_worker
+            assert this_worker.peek(season.id) is not None
+
+            # Checked when this worker resolves the current season next
+            SeasonStore.invalidate_current_season()
+            with pytest.raises(ValueError, match="No seasons found"):
+                SeasonStore.get_current_season()
+            assert this_worker.peek(season.id) is None
+
+    def test_cache_memory_budget(self):
+        def graph(size: int) -> SeasonGraph:
+            return SeasonGraph(
+                uuid.uuid4(), {uuid.uuid4(): GraphLocation("x" * size, ())}
+            )
+
+        first, second = graph(1000), graph(1000)
+        cache = SeasonGraphCache(first.size + second.size)
+        cache.put(first)
+        cache.put(second)
+        assert len(cache) == 2
+
+        # Touch the first graph so the second becomes least recently used
+        assert cache.peek(first.season_id) is first
+        third = graph(1000)
+        cache.put(third)
+        assert cache.peek(second.season_id) is None
+        assert cache.peek(first.season_id) is first
+
+        # Graphs larger than the whole budget aren't kept, and aren't compiled again
+        large = graph(10 * cache.max_bytes)
+        cache.put(large)
+        assert len(cache) == 2
+        assert cache.get(large.season_id) is None
+        assert cache.prewarm(Flask(__name__), large.season_id) is None
+        # Until the season changes
+        cache.invalidate(large.season_id)
+        smaller = SeasonGraph(large.season_id, {})
+        cache.put(smaller)
+        assert cache.get(large.season_id) is smaller
+
+    def test_unknown_season_not_cached(self):
+        with self.app.app_context():
+            assert SeasonGraph.load(uuid.uuid4()) is None
+            graphs = get_season_graphs()
+            assert graphs.get(uuid.uuid4()) is None
+            assert len(graphs) == 0
+
+    def test_cache_bounds_graph_count(self):
+        empty = [SeasonGraph(uuid.uuid4(), {}) for _ in range(10)]
+        cache = SeasonGraphCache(3 * empty[0].size)
+        for graph in empty:
+            cache.put(graph)
+        assert len(cache) == 3
+
+    def test_sync(self):
+        kept, changed, deleted = (SeasonGraph(uuid.uuid4(), {}) for _ in range(3))
+        large = SeasonGraph(
+            uuid.uuid4(), {uuid.uuid4(): GraphLocation("x" * 10000, ())}
+        )
+        cache = SeasonGraphCache(large.size - 1)
+        for graph in (kept, changed, deleted, large):
+            cache.put(graph)
+        assert cache.get(large.season_id) is None
+
+        cache.sync({kept.season_id: 0, changed.season_id: 1, large.season_id: 0})
+        assert cache.peek(kept.season_id) is kept
+        assert cache.peek(changed.season_id) is None
+        assert cache.peek(deleted.season_id) is None
+        # Still too large, nothing changed
+        assert cache.get(large.season_id) is None
+        # Changed, so it is compiled again
+        cache.sync({large.season_id: 1})
+        compiled = SeasonGraph(large.season_id, {}, 1)
+        with patch.object(SeasonGraph, "load", return_value=compiled):
+            assert cache.get(large.season_id) is compiled
+
+    def test_fetch_decisions_too_large_to_cache(self):
+        self.app.extensions["season_graphs"] = SeasonGraphCache(1)
+        with self.app.app_context():
+            season = self.import_story()
+            user = User(username="user1", email="user1@example.com", phone=1111111111)
+            nav = Nav(season.id, season.genesis_location_id, user)
+            nav.fetch_decisions()
+
+            statements: list[str] = []
+            engine = self.app.extensions["engine"]
+
+            def before_execute(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            event.listen(engine, "before_cursor_execute", before_execute)
+            try:
+                description, decisions = nav.fetch_decisions()
+            finally:
+                event.remove(engine, "before_cursor_execute", before_execute)
+
+            # One query for the location, not the whole season again
+            assert len(statements) == 1
+            assert description == "Welcome to Text Game!"
+            assert decisions[0].description == "Begin Your Adventure"
+
+    def test_prewarm_scheduled_season(self):
+        self.app.config["SEASON_PREWARM_WINDOW"] = 600
+        with self.app.app_context():
+            season = self.import_story()
+            graphs = get_season_graphs()
+            assert graphs.peek(season.id) is None
+
+            # Resolving the current season compiles a season scheduled within the window
+            SeasonStore.publish_season(season.id)
+            SeasonStore.get_current_season()
+            deadline = time.monotonic() + 5
+            while graphs.peek(season.id) is None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert graphs.peek(season.id) is not None
+            assert graphs.prewarm(self.app, season.id) is None
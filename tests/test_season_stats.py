@@ -0,0 +1,128 @@
+import io
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+
+from app.navigation.import_twine import ImportTwine
+from tests import test_import_twine
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from app.seasons import season_stats  # noqa: E402
+from app.seasons.season_stats import (  # noqa: E402
+    SeasonStats,
+    SeasonStatsCache,
+    absorbing_chain,
+)
+
+
+def chain(count: int, links: list[tuple[int, int]], start: int = 0):
+    sources, targets = zip(*links)
+    return absorbing_chain(count, np.array(sources), np.array(targets), start)
+
+
+class TestSeasonStats:
+    @pytest.fixture(autouse=True)
+    def setup(self, app: Flask, admin_client: FlaskClient):
+        self.app = app
+        self.client = admin_client
+
+    def test_absorbing_chain(self):
+        # Start -> End or Loop, Loop <-> Back never ends
+        expected_moves, stuck, endings, probabilities = chain(
+            4, [(0, 1), (0, 2), (2, 3), (3, 2)]
+        )
+        assert expected_moves == pytest.approx(1.0)
+        assert stuck == pytest.approx(0.5)
+        assert list(endings) == [1]
+        assert probabilities == pytest.approx([0.5])
+
+        # Repeated links are separate choices, so End is twice as likely as Other
+        expected_moves, stuck, endings, probabilities = chain(
+            3, [(0, 1), (0, 1), (0, 2)]
+        )
+        assert stuck == pytest.approx(0.0)
+        assert list(endings) == [1, 2]
+        assert probabilities == pytest.approx([2 / 3, 1 / 3])
+
+        # Starting at an ending or in a trap
+        assert chain(2, [(1, 0)], start=0)[:2] == (0.0, 0.0)
+        assert chain(3, [(0, 1), (1, 0), (2, 2)], start=0)[:2] == (0.0, 1.0)
+
+    def test_season_stats(self):
+        twine = ImportTwine("story.twee", "story.twee")
+        twine.passages = list(
+            twine.iter_passages(
+                io.StringIO(test_import_twine.TestImportTwine.mock_twee_content)
+            )
+        )
+        with self.app.app_context():
+            twine.insert_story()
+
+        response = self.client.get("/admin/seasons")
+        assert response.status_code == 200
+        # One move to You Awake, then eight on average until I am happy, the only ending
+        assert "9.0 moves to finish" in response.text
+        assert "I am happy: 100.0%" in response.text
+        assert "get stuck" not in response.text
+
+    def test_cache_recomputes_changed_seasons(self, monkeypatch):
+        computed: list[uuid.UUID] = []
+
+        def compute(db_session, season_id):
+            computed.append(season_id)
+            return SeasonStats(season_id)
+
+        monkeypatch.setattr(season_stats, "compute_season_stats", compute)
+        cache = SeasonStatsCache(background=False)
+        season = SimpleNamespace(id=uuid.uuid4(), content_version=0)
+        try:
+            first = cache.get(self.app, season)
+            assert cache.get(self.app, season) is first
+            # An edit in place that keeps the content hash and row counts
+            season.content_version = 1
+            assert cache.get(self.app, season) is not first
+            assert computed == [season.id, season.id]
+        finally:
+            cache.shutdown()
+
+    def test_cache_bounds_concurrency(self, monkeypatch):
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def compute(db_session, season_id):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            time.sleep(0.05)
+            with lock:
+                running -= 1
+            return SeasonStats(season_id)
+
+        monkeypatch.setattr(season_stats, "compute_season_stats", compute)
+        cache = SeasonStatsCache(background=True, max_concurrent=2)
+        seasons = [
+            SimpleNamespace(id=uuid.uuid4(), content_version=0) for _ in range(5)
+        ]
+        try:
+            assert [cache.get(self.app, season) for season in seasons] == [None] * 5
+            deadline = time.monotonic() + 10
+            while any(cache.get(self.app, season) is None for season in seasons):
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+            assert peak == 2
+
+            # Deleted seasons are dropped, asking again computes them from scratch
+            cache.retain([seasons[0].id])
+            assert cache.get(self.app, seasons[0]) is not None
+            assert cache.get(self.app, seasons[1]) is None
+        finally:
+            cache.shutdown()
@@ -1,11 +1,12 @@
+import time
 import uuid
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 import pytest
 from flask import Flask
 
 from app.models import Season
-from app.seasons.seasons import SeasonStore
+from app.seasons.seasons import SeasonRecord, SeasonStore
 
 
 class TestSeasonStore:
@@ -63,3 +64,136 @@ class TestSeasonStore:
             # Call the method and assert it raises ValueError
             with pytest.raises(ValueError, match="No seasons found"):
                 SeasonStore.get_current_season()
+
+    def test_get_current_season_cached(self):
+        with self.app.app_context():
+            first_id, second_id = uuid.uuid4(), uuid.uuid4()
+            with self.Session.begin() as db_session:
+                db_session.add(
+                    Season(
+                        id=first_id,
+                        name="Season 1",
+                        default=True,
+                        date_created=datetime.now(tz=timezone.utc),
+                    )
+                )
+
+            season = SeasonStore.get_current_season()
+            assert season.id == first_id
+            assert isinstance(season, SeasonRecord)
+
+            with self.Session.begin() as db_session:
+                db_session.query(Season).update({Season.default: False})
+                db_session.add(
+                    Season(
+                        id=second_id,
+                        name="Season 2",
+                        default=True,
+                        date_created=datetime.now(tz=timezone.utc),
+                    )
+                )
+
+            # Still served from the cache until it is invalidated
+            assert SeasonStore.get_current_season().id == first_id
+            SeasonStore.invalidate_current_season()
+            assert SeasonStore.get_current_season().id == second_id
+
+    def test_delete_season_invalidates_current_season(self, admin_client):
+        with self.app.app_context():
+            first_id, second_id = uuid.uuid4(), uuid.uuid4()
+            with self.Session.begin() as db_session:
+                db_session.add(
+                    Season(
+                        id=first_id,
+                        name="Season 1",
+                        default=True,
+                        date_created=datetime.now(tz=timezone.utc),
+                    )
+                )
+                db_session.add(
+                    Season(
+                        id=second_id,
+                        name="Season 2",
+                        default=False,
+                        date_created=datetime.now(tz=timezone.utc),
+                    )
+                )
+            assert SeasonStore.get_current_season().id == first_id
+
+        admin_client.post(f"/admin/delete_season/{first_id}")
+
+        with self.app.app_context():
+            assert SeasonStore.get_current_season().id == second_id
+
+    def test_publish_season_cutover(self):
+        with self.app.app_context():
+            live_id, staged_id = uuid.uuid4(), uuid.uuid4()
+            with self.Session.begin() as db_session:
+                db_session.add(
+                    Season(
+                        id=live_id,
+                        name="Season 1",
+                        default=True,
+                        date_created=datetime.now(tz=timezone.utc),
+                        published_at=datetime.now(tz=timezone.utc),
+                    )
+                )
+                # A staged import, newer than the live season
+                db_session.add(
+                    Season(
+                        id=staged_id,
+                        name="Season 2",
+                        date_created=datetime.now(tz=timezone.utc),
+                    )
+                )
+            assert SeasonStore.get_current_season().id == live_id
+
+            publish_at = datetime.now(tz=timezone.utc) + timedelta(seconds=0.3)
+            assert SeasonStore.publish_season(staged_id, publish_at) == publish_at
+            assert SeasonStore.get_current_season().id == live_id
+
+            # The worker switches on its own at the scheduled time, from its cache
+            time.sleep(
+                max(0.0, (publish_at - datetime.now(tz=timezone.utc)).total_seconds())
+            )
+            assert SeasonStore.get_current_season().id == staged_id
+            with self.Session() as db_session:
+                assert db_session.get(Season, live_id).default
+
+            # The next worker to resolve the current season flips the default flag
+            SeasonStore.invalidate_current_season()
+            assert SeasonStore.get_current_season().id == staged_id
+            with self.Session() as db_session:
+                assert not db_session.get(Season, live_id).default
+                staged = db_session.get(Season, staged_id)
+                assert staged.default
+                assert staged.published_at is not None
+                assert staged.publish_at is None
+
+    def test_staged_seasons_are_not_current(self, admin_client):
+        with self.app.app_context():
+            published_id, staged_id = uuid.uuid4(), uuid.uuid4()
+            with self.Session.begin() as db_session:
+                db_session.add(
+                    Season(
+                        id=published_id,
+                        name="Season 1",
+                        date_created=datetime(2024, 1, 1, tzinfo=timezone.utc),
+                        published_at=datetime(2024, 1, 1, tzinfo=timezone.utc),
+                    )
+                )
+                db_session.add(
+                    Season(
+                        id=staged_id,
+                        name="Season 2",
+                        date_created=datetime.now(tz=timezone.utc),
+                    )
+                )
+            assert SeasonStore.get_current_season().id == published_id
+
+        # Publishing right away skips the schedule
+        admin_client.post(f"/admin/make_default/{staged_id}")
+        with self.app.app_context():
+            assert SeasonStore.get_current_season().id == staged_id
+            with self.Session() as db_session:
+                assert db_session.query(Season).filter(Season.default).count() == 1
@@ -0,0 +1,100 @@
+import io
+
+import pytest
+from flask import Flask
+from flask.testing import FlaskClient
+
+from app.models import Location
+from app.navigation.import_twine import ImportTwine, TwineLink, TwinePassage
+from app.navigation.story_analysis import analyze_story
+from app.seasons.season_analysis import analyze_season
+from tests import test_import_twine
+
+
+def passage(name: str, *targets: str) -> TwinePassage:
+    return TwinePassage(name, name, [TwineLink(target, target) for target in targets])
+
+
+class TestStoryAnalysis:
+    @pytest.fixture(autouse=True)
+    def setup(self, app: Flask, admin_client: FlaskClient):
+        self.app = app
+        self.client = admin_client
+        self.Session = app.extensions["Session"]
+
+    def test_analyze_story(self):
+        analysis = analyze_story(
+            [
+                passage("Start", "Hall", "Loop"),
+                passage("Hall", "End"),
+                passage("End"),
+                # A cycle without an exit
+                passage("Loop", "Back"),
+                passage("Back", "Loop"),
+                passage("Attic", "End"),
+            ],
+            "Start",
+        )
+        assert [analysis.distances(index) for index in range(6)] == [
+            (0, 2),
+            (1, 1),
+            (2, 0),
+            (1, None),
+            (2, None),
+            (None, 1),
+        ]
+        assert analysis.unreachable == ["Attic"]
+        assert analysis.dead_ends == ["End"]
+        assert analysis.trapped == ["Loop", "Back"]
+        assert str(analysis) == (
+            "1 unreachable passages, 1 dead ends, 2 trapped passages"
+        )
+
+    def test_analyze_story_errors(self):
+        with pytest.raises(ValueError, match="The start passage Nowhere doesn't exist"):
+            analyze_story([passage("Start")], "Nowhere")
+        with pytest.raises(
+            ValueError,
+            match="2 links to passages that don't exist: Start -> A, Start -> B",
+        ):
+            analyze_story([passage("Start", "A", "B")], "Start")
+
+    def test_analyze_season(self):
+        twine = ImportTwine("story.twee", "story.twee")
+        twine.passages = list(
+            twine.iter_passages(
+                io.StringIO(test_import_twine.TestImportTwine.mock_twee_content)
+            )
+        )
+        with self.app.app_context():
+            twine.insert_story()
+        assert str(twine.analysis) == (
+            "0 unreachable passages, 1 dead ends, 0 trapped passages"
+        )
+
+        response = self.client.get(f"/admin/analysis/{twine.season_id}")
+        assert response.status_code == 200
+        assert response.json["depth"] == 3
+        assert response.json["dead_ends"] == {"count": 1, "names": ["I am happy"]}
+        assert response.json["trapped"] == {"count": 0, "names": []}
+
+        # As if the season was imported before the analysis
+        with self.Session.begin() as db_session:
+            stored = {
+                location.name: (location.start_distance, location.ending_distance)
+                for location in db_session.query(Location)
+            }
+            db_session.query(Location).update(
+                {Location.start_distance: None, Location.ending_distance: None}
+            )
+        response = self.client.get(f"/admin/analysis/{twine.season_id}")
+        assert response.status_code == 404
+
+        with self.Session.begin() as db_session:
+            analysis = analyze_season(db_session, twine.season_id)
+        assert analysis.dead_ends == ["I am happy"]
+        with self.Session() as db_session:
+            assert {
+                location.name: (location.start_distance, location.ending_distance)
+                for location in db_session.query(Location)
+            } == stored
@@ -0,0 +1,159 @@
+import gzip
+import io
+import os
+import tempfile
+
+import pytest
+import zstandard
+from flask import Flask
+from flask.testing import FlaskClient
+
+from app.models import Season
+from app.navigation import import_twine
+from app.navigation.uploads import UploadTooLarge, read_upload, split_compression
+from tests import test_import_twine
+
+
+class TestUploads:
+    @pytest.fixture(autouse=True)
+    def setup(self, app: Flask, admin_client: FlaskClient):
+        self.app = app
+        self.client = admin_client
+        self.Session = app.extensions["Session"]
+        self.story = test_import_twine.TestImportTwine.mock_twee_content.encode()
+
+    def upload(self, data: bytes, filename: str):
+        response = self.client.post(
+            "/admin/upload", data={"file": (io.BytesIO(data), filename)}
+        )
+        # The in-memory test database is a single shared connection, so the redirect is
+        # only followed once the import is done writing. Waiting doesn't read the
+        # database, unlike listing the jobs
+        manager = self.app.extensions["import_jobs"]
+        for job_id in list(manager._futures):
+            manager.wait(job_id, timeout=30)
+        return self.client.get(response.location)
+
+    def test_split_compression(self):
+        assert split_compression("story.twee.gz") == ("story.twee", "gzip")
+        assert split_compression("story.twee.ZST") == ("story.twee", "zstd")
+        assert split_compression("story.twee") == ("story.twee", None)
+
+    def test_read_upload_limits_decompressed_size(self):
+        compressed = gzip.compress(self.story)
+        upload = read_upload(io.BytesIO(compressed), "s.twee.gz", len(self.story))
+        assert upload.data == self.story
+        assert upload.path is None
+        assert upload.content_hash == import_twine.content_hash(io.BytesIO(self.story))
+        with pytest.raises(UploadTooLarge):
+            read_upload(io.BytesIO(compressed), "s.twee.gz", len(self.story) - 1)
+        with pytest.raises(ValueError, match="could not be decompressed"):
+            read_upload(io.BytesIO(b"not gzip"), "s.twee.gz", 1024)
+
+    def test_zstd_upload(self):
+        compressed = zstandard.ZstdCompressor().compress(self.story)
+        upload = read_upload(io.BytesIO(compressed), "s.twee.zst", len(self.story))
+        assert upload.data == self.story
+        assert upload.content_hash == import_twine.content_hash(io.BytesIO(self.story))
+        with pytest.raises(ValueError, match="could not be decompressed"):
+            read_upload(io.BytesIO(b"not zstd"), "s.twee.zst", 1024)
+
+        response = self.upload(compressed, "story.twee.zst")
+        assert b"Import of story.twee.zst queued" in response.data
+        with self.Session() as db_session:
+            season = db_session.query(Season).one()
+            assert season.name == "Test Story"
+            assert season.origin_file == "story.twee"
+
+    def test_read_upload_spools_big_stories(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+        upload = read_upload(
+            io.BytesIO(gzip.compress(self.story)), "s.twee.gz", 1024 * 1024, 100
+        )
+        assert upload.data is None
+        with open(upload.path, "rb") as file:
+            assert file.read() == self.story
+        assert upload.content_hash == import_twine.content_hash(io.BytesIO(self.story))
+        upload.discard()
+        assert list(tmp_path.iterdir()) == []
+
+        # The spooled file is removed if the story turns out to be too large
+        with pytest.raises(UploadTooLarge):
+            read_upload(io.BytesIO(self.story), "s.twee", len(self.story) - 1, 100)
+        assert list(tmp_path.iterdir()) == []
+
+    def test_big_upload_split_across_pool(self, tmp_path, monkeypatch):
+        # Big enough to be spooled and split, on a machine with several CPUs
+        monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+        monkeypatch.setattr("app.navigation.import_jobs.PARALLEL_PARSE_MIN_BYTES", 256)
+        monkeypatch.setattr("app.navigation.import_twine.PARALLEL_PARSE_MIN_BYTES", 256)
+        monkeypatch.setattr("app.navigation.import_twine.PARALLEL_CHUNK_MIN_BYTES", 128)
+        monkeypatch.setattr(os, "cpu_count", lambda: 2)
+        monkeypatch.setattr(self.app.extensions["import_jobs"], "parse_processes", 2)
+        splits: list[int] = []
+        find_boundaries = import_twine.find_passage_boundaries
+
+        def spy(filepath: str, chunks: int) -> list[int]:
+            boundaries = find_boundaries(filepath, chunks)
+            splits.append(len(boundaries) - 1)
+            return boundaries
+
+        monkeypatch.setattr(import_twine, "find_passage_boundaries", spy)
+        response = self.upload(gzip.compress(self.story), "story.twee.gz")
+        assert b"Import of story.twee.gz queued" in response.data
+        assert len(splits) == 1 and splits[0] > 1
+
+        with self.Session() as db_session:
+            season = db_session.query(Season).one()
+            assert season.name == "Test Story"
+            assert len(season.locations) == 5
+        # The job removed the spooled story once it was imported
+        assert list(tmp_path.iterdir()) == []
+
+    def test_gzip_upload_without_saving(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        response = self.upload(gzip.compress(self.story), "story.twee.gz")
+        assert response.status_code == 200
+        assert b"Import of story.twee.gz queued" in response.data
+
+        with self.Session() as db_session:
+            season = db_session.query(Season).one()
+            assert season.name == "Test Story"
+            assert season.origin_file == "story.twee"
+        # Nothing was written to disk
+        assert list(tmp_path.iterdir()) == []
+
+    def test_corrupt_gzip_upload(self):
+        compressed = bytearray(gzip.compress(self.story))
+        # Past the header, so the deflate stream itself is corrupt
+        compressed[10:14] = b"\xff" * 4
+        with pytest.raises(ValueError, match="could not be decompressed"):
+            read_upload(io.BytesIO(compressed), "story.twee.gz", 1024 * 1024)
+
+        response = self.upload(bytes(compressed), "story.twee.gz")
+        assert response.status_code == 200
+        assert b"story.twee.gz could not be decompressed" in response.data
+        with self.Session() as db_session:
+            assert db_session.query(Season).count() == 0
+
+    def test_archive_upload(self, tmp_path):
+        self.app.config["IMPORT_ARCHIVE_FOLDER"] = str(tmp_path / "archive")
+        self.upload(gzip.compress(self.story), "story.twee.gz")
+
+        archived = list((tmp_path / "archive").iterdir())
+        assert len(archived) == 1
+        assert archived[0].name.endswith("_story.twee.gz")
+        assert gzip.decompress(archived[0].read_bytes()) == self.story
+
+    def test_upload_size_limits(self):
+        self.app.config["MAX_CONTENT_LENGTH"] = 256
+        response = self.upload(self.story, "story.twee")
+        assert b"Uploads are limited to 256 bytes" in response.data
+
+        self.app.config["MAX_CONTENT_LENGTH"] = None
+        self.app.config["IMPORT_MAX_STORY_BYTES"] = 256
+        response = self.upload(gzip.compress(self.story), "story.twee.gz")
+        assert b"larger than 256 bytes once decompressed" in response.data
+
+        with self.Session() as db_session:
+            assert db_session.query(Season).count() == 0
@@ -1,5 +1,6 @@
 import pytest
 from flask import Flask, session
+from sqlalchemy import event
 
 from app.models import User
 from app.users.users import UserStore
@@ -59,3 +60,37 @@ class TestUserStore:
                 # Call get_current_user
                 current_user = UserStore.get_current_user()
                 assert current_user is None
+
+    def test_get_current_user_once_per_request(self):
+        with self.app.app_context():
+            with self.Session.begin() as db_session:
+                db_session.add(
+                    User(username="user1", email="user1@example.com", phone=1111111111)
+                )
+                db_session.add(
+                    User(username="user2", email="user2@example.com", phone=2222222222)
+                )
+
+            statements: list[str] = []
+            engine = self.app.extensions["engine"]
+
+            def before_execute(conn, cursor, statement, *args):
+                statements.append(statement)
+
+            event.listen(engine, "before_cursor_execute", before_execute)
+            try:
+                with self.app.test_request_context():
+                    session["user"] = {"email": "user1@example.com"}
+                    assert UserStore.get_current_user() is not None
+                    assert UserStore.current_user_is_admin() is False
+                    assert UserStore.inject_user()["user"].username == "user1"
+                    assert len(statements) == 1
+
+                    # A different user in the session is looked up again
+                    session["user"] = {"email": "user2@example.com"}
+                    current_user = UserStore.get_current_user()
+                    assert current_user is not None
+                    assert current_user.username == "user2"
+                    assert len(statements) == 2
+            finally:
+                event.remove(engine, "before_cursor_execute", before_execute)